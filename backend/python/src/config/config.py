@@ -28,6 +28,10 @@ DB_SCHEMA=os.getenv("DB_SCHEMA")
 
 TIMEZONE=os.getenv("TIMEZONE", "Europe/Madrid")
 
+REDIS_HOST=os.getenv("REDIS_HOST", os.getenv("VITE_HOST", 'localhost'))
+REDIS_PORT=int(os.getenv("REDIS_PORT", 6379))
+REDIS_PASSWORD=os.getenv("REDIS_PASSWORD")
+
 INTERNAL_API_KEY=os.getenv("INTERNAL_API_KEY")
 
 MODEL=os.getenv("VITE_MODEL", "gpt-4.1-mini-2025-04-14")
@@ -48,4 +52,125 @@ ASSISTANT_ID=os.getenv("ASSISTANT_ID", "")
 VECTOR_STORE_ID=os.getenv("VECTOR_STORE_ID", "")
 static_tables_str=os.getenv("STATIC_TABLES","")
 static_tables=static_tables_str.split(",") if static_tables_str else []
-STATIC_TABLES = [t.strip() for t in static_tables]
\ No newline at end of file
+STATIC_TABLES = [t.strip() for t in static_tables]
+
+# Caché del esquema de la DB
+SCHEMA_CACHE_TTL=int(os.getenv("SCHEMA_CACHE_TTL", 3600)) # Segundos que el esquema formateado se reutiliza (0 desactiva la caché)
+SCHEMA_CHANGE_DETECTION=os.getenv("SCHEMA_CHANGE_DETECTION", "true").strip().lower() == "true"
+SCHEMA_FINGERPRINT_INTERVAL=int(os.getenv("SCHEMA_FINGERPRINT_INTERVAL", 60)) # Cada cuántos segundos se comprueba si el esquema ha cambiado
+
+# Tablas estáticas
+STATIC_TABLES_REFRESH_INTERVAL=int(os.getenv("STATIC_TABLES_REFRESH_INTERVAL", 300)) # Segundos entre comprobaciones de cambios (0 desactiva el refresco)
+
+# Salud de la conexión con la DB (circuit breaker)
+DB_CONNECT_TIMEOUT=int(os.getenv("DB_CONNECT_TIMEOUT", 5)) # Segundos máximos para abrir una conexión
+DB_HEALTH_HEARTBEAT_INTERVAL=int(os.getenv("DB_HEALTH_HEARTBEAT_INTERVAL", 15)) # Segundos entre sondeos en segundo plano
+DB_HEALTH_FAILURE_THRESHOLD=int(os.getenv("DB_HEALTH_FAILURE_THRESHOLD", 3)) # Fallos consecutivos para abrir el circuito
+DB_HEALTH_OPEN_SECONDS=int(os.getenv("DB_HEALTH_OPEN_SECONDS", 30)) # Segundos con el circuito abierto antes de probar de nuevo (half-open)
+
+# Sesiones del agente
+AGENT_SESSION_TTL=int(os.getenv("AGENT_SESSION_TTL", 1800)) # Segundos de inactividad tras los que se expulsa una sesión y se borra su thread
+AGENT_MAX_SESSIONS=int(os.getenv("AGENT_MAX_SESSIONS", 500)) # Nº máximo de sesiones en memoria (LRU)
+AGENT_SESSION_SWEEP_INTERVAL=int(os.getenv("AGENT_SESSION_SWEEP_INTERVAL", 60)) # Segundos entre limpiezas de sesiones inactivas
+SESSION_STORE=os.getenv("SESSION_STORE", "redis").strip().lower() # "redis" (compartido entre workers) o "memory"
+SESSION_STORE_PREFIX=os.getenv("SESSION_STORE_PREFIX", "chatbot:session:")
+
+# Ficheros subidos a OpenAI (caché direccionada por contenido)
+FILE_INDEX_STORE=os.getenv("FILE_INDEX_STORE", "redis").strip().lower() # "redis" (compartido entre workers) o "local" (fichero, un único worker)
+FILE_INDEX_PREFIX=os.getenv("FILE_INDEX_PREFIX", "chatbot:files:")
+FILE_INDEX_PATH=os.getenv("FILE_INDEX_PATH", "tmp/file_index.json") # Índice local digest -> fichero de OpenAI (FILE_INDEX_STORE=local)
+FILE_GC_GRACE_SECONDS=int(os.getenv("FILE_GC_GRACE_SECONDS", 3600)) # Segundos sin uso antes de eliminar un fichero
+FILE_GC_INTERVAL=int(os.getenv("FILE_GC_INTERVAL", 300)) # Segundos entre recolecciones (0 desactiva)
+
+# Arranque del agente
+AGENT_INIT_BACKGROUND=os.getenv("AGENT_INIT_BACKGROUND", "true").strip().lower() == "true" # Preparar assistant/vector store en segundo plano
+AGENT_INIT_CONCURRENCY=int(os.getenv("AGENT_INIT_CONCURRENCY", 8)) # Llamadas concurrentes al reconciliar el vector store
+# Resultados de las queries generadas por el LLM
+QUERY_MAX_ROWS=int(os.getenv("QUERY_MAX_ROWS", 5000)) # Filas máximas que se leen de una query (el resto se descarta)
+QUERY_MAX_BYTES=int(os.getenv("QUERY_MAX_BYTES", 2000000)) # Tamaño máximo serializado (bytes) del resultado
+QUERY_FETCH_SIZE=int(os.getenv("QUERY_FETCH_SIZE", 500)) # Filas por lote leídas del cursor de servidor
+QUERY_RESULT_FORMAT=os.getenv("QUERY_RESULT_FORMAT", "tsv").strip().lower() # Formato del resultado en el prompt: "tsv", "csv", "markdown", "columnar" (JSON columnas + filas) o "records" (JSON lista de dicts)
+
+# Carril de ejecución de las queries generadas por el LLM (pool propio, solo lectura y con timeouts)
+QUERY_POOL_SIZE=int(os.getenv("QUERY_POOL_SIZE", 3)) # Conexiones del pool dedicado a SQL generado
+QUERY_POOL_MAX_OVERFLOW=int(os.getenv("QUERY_POOL_MAX_OVERFLOW", 2))
+QUERY_POOL_TIMEOUT=int(os.getenv("QUERY_POOL_TIMEOUT", 10)) # Segundos máximos esperando una conexión libre del pool
+QUERY_STATEMENT_TIMEOUT_MS=int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", 15000)) # statement_timeout de cada query generada
+QUERY_LOCK_TIMEOUT_MS=int(os.getenv("QUERY_LOCK_TIMEOUT_MS", 2000)) # lock_timeout de cada query generada
+QUERY_SESSION_CONCURRENCY=int(os.getenv("QUERY_SESSION_CONCURRENCY", 1)) # Queries generadas simultáneas por sesión
+
+# Control de coste (EXPLAIN) de las queries generadas antes de ejecutarlas
+QUERY_COST_GATE=os.getenv("QUERY_COST_GATE", "true").strip().lower() == "true"
+QUERY_MAX_COST=float(os.getenv("QUERY_MAX_COST", 1000000)) # Coste total estimado máximo por el planner
+QUERY_MAX_PLAN_ROWS=int(os.getenv("QUERY_MAX_PLAN_ROWS", 100000)) # Filas estimadas máximas
+QUERY_COST_ACTION=os.getenv("QUERY_COST_ACTION", "limit").strip().lower() # "limit" (añade LIMIT y reevalúa) o "reject"
+QUERY_COST_CACHE_TTL=int(os.getenv("QUERY_COST_CACHE_TTL", 600)) # Segundos que se reutiliza el plan de una query normalizada
+
+# Caché de resultados de las queries generadas (por SQL normalizado)
+RESULT_CACHE=os.getenv("RESULT_CACHE", "true").strip().lower() == "true"
+RESULT_CACHE_BACKEND=os.getenv("RESULT_CACHE_BACKEND", "memory").strip().lower() # "memory" (por proceso) o "redis" (compartida)
+RESULT_CACHE_PREFIX=os.getenv("RESULT_CACHE_PREFIX", "chatbot:query:")
+RESULT_CACHE_TTL=int(os.getenv("RESULT_CACHE_TTL", 300)) # Segundos por defecto que se reutiliza un resultado
+RESULT_CACHE_MAX_ENTRIES=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 512)) # Entradas máximas de la caché en memoria
+RESULT_CACHE_FINGERPRINT_INTERVAL=int(os.getenv("RESULT_CACHE_FINGERPRINT_INTERVAL", 10)) # Segundos que se reutiliza la huella de cambios de una tabla
+result_cache_table_ttls=os.getenv("RESULT_CACHE_TABLE_TTLS", "").split(",") # TTL por tabla: "entradas_salidas:60,recaudacion_semanal:600"
+RESULT_CACHE_TABLE_TTLS={t.split(":")[0].strip().lower(): int(t.split(":")[1]) for t in result_cache_table_ttls if ":" in t}
+
+# Caché de respuestas (pregunta normalizada + versión de los datos)
+ANSWER_CACHE=os.getenv("ANSWER_CACHE", "true").strip().lower() == "true"
+ANSWER_CACHE_TTL=int(os.getenv("ANSWER_CACHE_TTL", 3600)) # Segundos que se reutiliza una respuesta
+ANSWER_CACHE_MAX_ENTRIES=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_IGNORE_HISTORY=os.getenv("ANSWER_CACHE_IGNORE_HISTORY", "false").strip().lower() == "true" # Si es false la última interacción del historial forma parte de la clave
+ANSWER_CACHE_SEMANTIC=os.getenv("ANSWER_CACHE_SEMANTIC", "false").strip().lower() == "true" # Buscar también preguntas parecidas por embeddings (requiere numpy)
+ANSWER_CACHE_EMBEDDING_MODEL=os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+ANSWER_CACHE_SIMILARITY=float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.92)) # Similitud coseno mínima para considerar dos preguntas equivalentes
+
+# Caché de planes (pregunta normalizada -> SQL/decisión de get_response)
+PLAN_CACHE=os.getenv("PLAN_CACHE", "true").strip().lower() == "true"
+PLAN_CACHE_TTL=int(os.getenv("PLAN_CACHE_TTL", 3600)) # Segundos que se reutiliza un plan
+PLAN_CACHE_MAX_ENTRIES=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", 1000))
+PLAN_CACHE_VERIFY_RATE=float(os.getenv("PLAN_CACHE_VERIFY_RATE", 0.05)) # Fracción de aciertos que se contrastan con una llamada nueva al LLM
+
+# Presupuesto de tokens de los datos del prompt (esquema, tablas estáticas, resultados)
+PROMPT_DATA_TOKENS=int(os.getenv("PROMPT_DATA_TOKENS", 100000)) # Tokens máximos de datos en línea; lo que no cabe se sube al vector store
+PROMPT_RESERVED_TOKENS=int(os.getenv("PROMPT_RESERVED_TOKENS", 20000)) # Margen para instrucciones, historial y respuesta
+
+STATIC_TABLES_FORMAT=os.getenv("STATIC_TABLES_FORMAT", "tsv").strip().lower() # Formato de las tablas estáticas en el prompt (mismas opciones que QUERY_RESULT_FORMAT)
+# Resumen de resultados grandes antes de pasarlos al agente (estadísticas + muestra en lugar de todas las filas)
+RESULT_DIGEST=os.getenv("RESULT_DIGEST", "true").strip().lower() == "true"
+RESULT_DIGEST_MIN_ROWS=int(os.getenv("RESULT_DIGEST_MIN_ROWS", 200)) # A partir de cuántas filas se resume el resultado
+RESULT_DIGEST_SAMPLE_ROWS=int(os.getenv("RESULT_DIGEST_SAMPLE_ROWS", 40)) # Filas de muestra que acompañan al resumen
+RESULT_DIGEST_TOP_K=int(os.getenv("RESULT_DIGEST_TOP_K", 5)) # Valores más frecuentes por columna
+RESULT_DIGEST_MAX_GROUPS=int(os.getenv("RESULT_DIGEST_MAX_GROUPS", 20)) # Máximo de valores distintos de una columna para agrupar por ella
+
+# Logging
+LOG_LEVEL=os.getenv("LOG_LEVEL", "INFO").strip().upper() # Nivel por defecto (se puede subir por petición con LOG_LEVEL_HEADER)
+LOG_FORMAT=os.getenv("LOG_FORMAT", "text").strip().lower() # "text" o "json" (una línea JSON por registro)
+LOG_ENQUEUE=os.getenv("LOG_ENQUEUE", "true").strip().lower() == "true" # Escribir los logs desde un hilo en segundo plano en lugar del event loop
+LOG_LEVEL_HEADER=os.getenv("LOG_LEVEL_HEADER", "X-Log-Level").strip() # Cabecera para cambiar el nivel en una petición autenticada (vacío para desactivar)
+LOG_PAYLOAD_MAX_CHARS=int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 2000)) # Caracteres máximos de un contenido grande en el log (0 sin límite)
+log_payload_limits=os.getenv("LOG_PAYLOAD_LIMITS", "prompt:4000,messages:2000,schema:1000").split(",") # Límite por punto de log: "prompt:4000,messages:2000"
+LOG_PAYLOAD_LIMITS={p.split(":")[0].strip(): int(p.split(":")[1]) for p in log_payload_limits if ":" in p}
+log_payload_sample_rates=os.getenv("LOG_PAYLOAD_SAMPLE_RATES", "prompt:0.1,messages:0.1").split(",") # Fracción de registros que se escriben por punto de log (el resto, todos)
+LOG_PAYLOAD_SAMPLE_RATES={p.split(":")[0].strip(): float(p.split(":")[1]) for p in log_payload_sample_rates if ":" in p}
+
+# Trazas (spans por etapa del pipeline)
+TRACE_EXPORTER=os.getenv("TRACE_EXPORTER", "memory").strip().lower() # "none", "memory" (solo en proceso), "log" (árbol de spans en el log) u "otlp" (requiere opentelemetry)
+TRACE_OTLP_ENDPOINT=os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME=os.getenv("TRACE_SERVICE_NAME", "chatbot-vismel")
+TRACE_DEBUG_HEADER=os.getenv("TRACE_DEBUG_HEADER", "X-Debug-Timing").strip() # Si la petición la envía, se devuelve el desglose de tiempos en Server-Timing
+
+# Métricas (endpoint /metrics en formato Prometheus)
+METRICS_ENABLED=os.getenv("METRICS_ENABLED", "true").strip().lower() == "true"
+
+# Limitador adaptativo de llamadas a OpenAI (AIMD sobre la concurrencia, límites por minuto y carriles de prioridad)
+LLM_CONCURRENCY_MIN=int(os.getenv("LLM_CONCURRENCY_MIN", 1)) # Concurrencia mínima aunque haya 429 seguidos
+LLM_CONCURRENCY_MAX=int(os.getenv("LLM_CONCURRENCY_MAX", 32)) # Techo de la concurrencia (ajustar al tier de OpenAI)
+LLM_CONCURRENCY_INITIAL=int(os.getenv("LLM_CONCURRENCY_INITIAL", 4)) # Concurrencia de partida
+LLM_CONCURRENCY_BACKOFF=float(os.getenv("LLM_CONCURRENCY_BACKOFF", 0.5)) # Factor de reducción ante un 429, un timeout o latencia alta
+LLM_LATENCY_TARGET=float(os.getenv("LLM_LATENCY_TARGET", 30)) # Segundos hasta las cabeceras de la respuesta por encima de los cuales se reduce (0 desactiva)
+LLM_RPM_LIMIT=int(os.getenv("LLM_RPM_LIMIT", 0)) # Peticiones por minuto como máximo (0 sin límite)
+LLM_TPM_LIMIT=int(os.getenv("LLM_TPM_LIMIT", 0)) # Tokens por minuto como máximo (0 sin límite)
+LLM_BACKGROUND_SHARE=float(os.getenv("LLM_BACKGROUND_SHARE", 0.25)) # Fracción de la concurrencia que pueden ocupar las tareas en segundo plano
+LLM_RATE_LIMIT_HEADERS=os.getenv("LLM_RATE_LIMIT_HEADERS", "true").strip().lower() == "true" # Retener las llamadas según las cabeceras x-ratelimit-* de OpenAI antes de recibir un 429
+LLM_COMPLETION_TOKENS_ESTIMATE=int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", 1000)) # Tokens de salida previstos por llamada si no se indica max_tokens
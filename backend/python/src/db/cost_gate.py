@@ -0,0 +1,104 @@
+# backend/python/src/db/cost_gate.py
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.logging.logger import base_logger
+from src.config.config import QUERY_COST_GATE, QUERY_MAX_COST, QUERY_MAX_PLAN_ROWS, QUERY_COST_ACTION, QUERY_COST_CACHE_TTL, QUERY_MAX_ROWS
+from src.db.database import Database
+from src.models.QueryResult import CostCheck
+from src.utils.cache import TTLCache
+from src.utils.metrics import metrics
+from src.utils.sql import normalize_sql, inject_limit
+from src.utils.tracing import traced, set_attributes
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("query_cost_gate_total", "counter", "Decisiones del control de coste de las queries generadas (allowed, limited, rejected, skipped)")
+
+"""
+Control previo a la ejecución de las queries generadas: estima su coste con EXPLAIN (FORMAT JSON)
+y las rechaza o les añade un LIMIT si superan los umbrales configurados.
+Los planes se cachean por query normalizada y versión del esquema.
+"""
+class QueryCostGate():
+    def __init__(self, db: Database, enabled: bool = QUERY_COST_GATE, max_cost: float = QUERY_MAX_COST, max_rows: int = QUERY_MAX_PLAN_ROWS, action: str = QUERY_COST_ACTION, limit: int = QUERY_MAX_ROWS, cache_ttl: int = QUERY_COST_CACHE_TTL):
+        self.db = db
+        self.enabled = enabled
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.limit = limit
+        self.plans = TTLCache(maxsize=1024, ttl=cache_ttl)
+
+    """
+    Evalúa la query y devuelve si se puede ejecutar y con qué texto.
+    Si no se puede obtener el plan se deja pasar: el statement_timeout del carril sigue protegiendo la DB.
+    """
+    @traced("db.cost_gate")
+    async def check(self, query: str, session_id: str = "anon", logger=base_logger) -> CostCheck:
+        if not self.enabled:
+            return CostCheck(query=query)
+
+        estimate = await self._estimate(query, session_id, logger)
+        if estimate is None:
+            metrics.inc("query_cost_gate_total", decision="skipped")
+            set_attributes(decision="skipped")
+            return CostCheck(query=query)
+
+        total_cost, plan_rows = estimate
+        if not self._exceeds(total_cost, plan_rows):
+            metrics.inc("query_cost_gate_total", decision="allowed")
+            set_attributes(decision="allowed")
+            return CostCheck(query=query, total_cost=total_cost, plan_rows=plan_rows)
+
+        exceeded = self._exceeded(total_cost, plan_rows)
+        reason = f"{' and '.join(exceeded)} {'exceeds the allowed limit' if len(exceeded) == 1 else 'exceed the allowed limits'}."
+        logger.warning(f"{file_name} => Query por encima de los umbrales (coste {total_cost:.0f}, filas {plan_rows}).")
+
+        if self.action == "limit" and self.limit > 0:
+            limited = inject_limit(query, self.limit)
+            limited_estimate = await self._estimate(limited, session_id, logger)
+            if limited_estimate and not self._exceeds(*limited_estimate):
+                logger.info(f"{file_name} => Query reescrita con LIMIT {self.limit}.")
+                metrics.inc("query_cost_gate_total", decision="limited")
+                set_attributes(decision="limited")
+                return CostCheck(query=limited, rewritten=True, total_cost=limited_estimate[0], plan_rows=limited_estimate[1], reason=f"{reason} Only the first {self.limit} rows were requested.")
+
+        metrics.inc("query_cost_gate_total", decision="rejected")
+        set_attributes(decision="rejected")
+        return CostCheck(allowed=False, query=query, total_cost=total_cost, plan_rows=plan_rows, reason=f"The query was not executed because it is too expensive for the database. {reason}")
+
+    def _exceeds(self, total_cost: float, plan_rows: int) -> bool:
+        return bool(self._exceeded(total_cost, plan_rows))
+
+    """
+    Descripción de los umbrales superados (solo los que se han superado).
+    """
+    def _exceeded(self, total_cost: float, plan_rows: int) -> List[str]:
+        exceeded = []
+        if self.max_cost > 0 and total_cost > self.max_cost:
+            exceeded.append(f"Estimated cost {total_cost:.0f} (max {self.max_cost:.0f})")
+        if self.max_rows > 0 and plan_rows > self.max_rows:
+            exceeded.append(f"estimated rows {plan_rows} (max {self.max_rows})" if exceeded else f"Estimated rows {plan_rows} (max {self.max_rows})")
+        return exceeded
+
+    async def _estimate(self, query: str, session_id: str, logger=base_logger) -> Optional[Tuple[float, int]]:
+        key = (self.db.schema_version, normalize_sql(query))
+        estimate = self.plans.get(key)
+        if estimate is not None:
+            return estimate
+
+        plan = await self.db.explain(query, session_id=session_id, logger=logger)
+        estimate = self._parse_plan(plan)
+        if estimate is not None:
+            self.plans.set(key, estimate)
+        return estimate
+
+    @staticmethod
+    def _parse_plan(plan: Optional[Dict[str, Any]]) -> Optional[Tuple[float, int]]:
+        root = (plan or {}).get("Plan")
+        if not root:
+            return None
+        return float(root.get("Total Cost", 0)), int(root.get("Plan Rows", 0))
@@ -1,17 +1,101 @@
 # backend/python/src/db/database.py
 import os
-from typing import List, Dict, Any
+import re
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Literal, Optional, Tuple, get_args
+from sqlalchemy import event
 from sqlalchemy.sql import text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
-from src.logging.logger import base_logger
-from src.config.config import STATIC_TABLES
+from src.logging.logger import base_logger, log_payload
+from src.config.config import STATIC_TABLES, SCHEMA_CACHE_TTL, SCHEMA_CHANGE_DETECTION, SCHEMA_FINGERPRINT_INTERVAL
+from src.config.config import DB_CONNECT_TIMEOUT, DB_HEALTH_HEARTBEAT_INTERVAL, DB_HEALTH_FAILURE_THRESHOLD, DB_HEALTH_OPEN_SECONDS
+from src.config.config import QUERY_MAX_ROWS, QUERY_MAX_BYTES, QUERY_FETCH_SIZE, QUERY_RESULT_FORMAT
+from src.config.config import QUERY_POOL_SIZE, QUERY_POOL_MAX_OVERFLOW, QUERY_POOL_TIMEOUT, QUERY_STATEMENT_TIMEOUT_MS, QUERY_LOCK_TIMEOUT_MS, QUERY_SESSION_CONCURRENCY
+from src.config.config import AGENT_MAX_SESSIONS, AGENT_SESSION_TTL
+from src.models.QueryResult import QueryResult, ResultFormat
+from src.utils.cache import TTLCache
+from src.utils.metrics import metrics
+from src.utils.serialization import dumps_bytes, loads
+from src.utils.tracing import traced, set_attributes
 
 """ VARIABLES GLOBALES """
+INTERNAL_POOL_SIZE = 5
+INTERNAL_POOL_MAX_OVERFLOW = 10
 file_name = os.path.basename(__file__)
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 """"""""""""""""""""""""""
 
+metrics.describe("db_pool_checkout_seconds", "histogram", "Tiempo de espera para obtener una conexión del pool (internal: esquema y tablas estáticas, generated: SQL del LLM)")
+metrics.describe("db_pool_timeouts_total", "counter", "Esperas de conexión que superaron el pool_timeout")
+metrics.describe("db_pool_checked_out", "gauge", "Conexiones del pool en uso")
+metrics.describe("db_pool_saturation", "gauge", "Fracción de la capacidad del pool (pool_size + max_overflow) en uso")
+
+"""
+Estado cacheado de la conexión con la DB con semántica de circuit breaker:
+- closed: la DB responde, las peticiones la usan con normalidad.
+- open: tras N fallos consecutivos se deja de usar la DB durante DB_HEALTH_OPEN_SECONDS.
+- half_open: pasado ese tiempo se deja pasar una sola petición como sondeo (el resto sigue fallando rápido);
+  un éxito cierra el circuito y un fallo lo vuelve a abrir. Si el sondeo no informa en probe_timeout segundos
+  se permite otro.
+"""
+class ConnectionHealthMonitor():
+    def __init__(self, failure_threshold: int = DB_HEALTH_FAILURE_THRESHOLD, open_seconds: int = DB_HEALTH_OPEN_SECONDS, probe_timeout: float = DB_CONNECT_TIMEOUT * 2, logger=base_logger):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self.logger = logger
+        self.state: Literal["closed", "open", "half_open"] = "closed"
+        self.consecutive_failures: int = 0
+        self.opened_at: float = 0.0
+        self.last_success_at: float = 0.0
+        self.last_failure_at: float = 0.0
+        self.probe_started_at: float = 0.0 # Inicio del sondeo half_open en curso (0 si no hay)
+
+    """
+    Devuelve si se puede usar la DB sin bloquear. Con el circuito abierto y el tiempo de espera agotado
+    pasa a half_open y deja pasar una única petición como sondeo.
+    """
+    def is_available(self) -> bool:
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < self.open_seconds:
+                return False
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self.probe_started_at and now - self.probe_started_at < self.probe_timeout:
+                return False
+            self.probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.last_success_at = time.monotonic()
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def record_failure(self, reason: Any = None) -> None:
+        self.consecutive_failures += 1
+        self.last_failure_at = time.monotonic()
+        if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            self.opened_at = self.last_failure_at
+            self._set_state("open", reason)
+        elif self.state == "open":
+            self.opened_at = self.last_failure_at
+
+    def _set_state(self, state: Literal["closed", "open", "half_open"], reason: Any = None) -> None:
+        previous = self.state
+        self.state = state
+        self.probe_started_at = 0.0
+        if state == "open":
+            self.logger.warning(f"{file_name} => Circuito de la DB abierto tras {self.consecutive_failures} fallos ({previous} -> open): {reason}")
+        else:
+            self.logger.info(f"{file_name} => Estado de la conexión con la DB: {previous} -> {state}")
+
 """
 Objeto que representa una conexion a una DB.
 """
@@ -21,8 +105,10 @@ class Database():
         self.database_url = f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{name}"
         self.engine = create_async_engine(
             self.database_url,
-            pool_size=5,
-            max_overflow=10
+            pool_size=INTERNAL_POOL_SIZE,
+            max_overflow=INTERNAL_POOL_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            connect_args={"timeout": DB_CONNECT_TIMEOUT}
         )
         self.Session = async_sessionmaker(
             bind=self.engine,
@@ -30,28 +116,246 @@ class Database():
             class_=AsyncSession
         )
 
+        # Carril para el SQL generado por el LLM: pool propio y acotado, conexiones de solo lectura.
+        # Una query costosa solo puede agotar este pool, no el que usan el esquema, las tablas estáticas o el heartbeat.
+        self.query_engine = create_async_engine(
+            self.database_url,
+            pool_size=QUERY_POOL_SIZE,
+            max_overflow=QUERY_POOL_MAX_OVERFLOW,
+            pool_timeout=QUERY_POOL_TIMEOUT,
+            pool_pre_ping=True,
+            connect_args={
+                "timeout": DB_CONNECT_TIMEOUT,
+                "server_settings": {"default_transaction_read_only": "on", "application_name": "chatbot-generated-sql"}
+            }
+        )
+        self.QuerySession = async_sessionmaker(
+            bind=self.query_engine,
+            expire_on_commit=False,
+            class_=AsyncSession
+        )
+        self.statement_timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+        self.lock_timeout_ms: int = QUERY_LOCK_TIMEOUT_MS
+        self.session_concurrency: int = max(1, QUERY_SESSION_CONCURRENCY)
+        self._session_users: Dict[str, int] = {} # Peticiones con el turno tomado o esperándolo, por sesión
+        self._session_semaphores = TTLCache(maxsize=AGENT_MAX_SESSIONS, ttl=AGENT_SESSION_TTL, sliding=True, pinned=lambda session_id, _: session_id in self._session_users)
+
+        # Caché del esquema formateado
+        self.schema_cache_ttl: int = SCHEMA_CACHE_TTL
+        self.schema_change_detection: bool = SCHEMA_CHANGE_DETECTION
+        self.schema_fingerprint_interval: int = SCHEMA_FINGERPRINT_INTERVAL
+        self._schema_text: str | None = None
+        self._schema_version: str = ""
+        self._schema_fingerprint: str | None = None
+        self._schema_loaded_at: float = 0.0
+        self._schema_checked_at: float = 0.0
+        self._schema_lock = asyncio.Lock()
+
+        # Salud de la conexión: la alimentan los eventos del pool y un heartbeat en segundo plano
+        self.health = ConnectionHealthMonitor()
+        self.heartbeat_interval: int = DB_HEALTH_HEARTBEAT_INTERVAL
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._register_pool_events(self.engine)
+        self._register_pool_events(self.query_engine)
+        metrics.register_collector("db_pool", self._collect_pool_metrics)
+
+    """
+    Versión (hash del texto) del esquema cacheado. Vacía si aún no se ha cargado.
+    """
+    @property
+    def schema_version(self) -> str:
+        return self._schema_version
+
     """
-    Prueba la conexión a la base de datos.
-    Devuelve True si se puede conectar, False si falla.
+    Devuelve al instante si la DB se considera disponible según el estado cacheado del circuit breaker.
     """
-    async def test_connection(self, logger=base_logger) -> bool:
+    def is_available(self) -> bool:
+        return self.health.is_available()
+
+    """
+    Actualiza los gauges de ocupación de ambos pools justo antes de exportar las métricas.
+    """
+    def _collect_pool_metrics(self) -> None:
+        for pool, engine, capacity in (("internal", self.engine, INTERNAL_POOL_SIZE + INTERNAL_POOL_MAX_OVERFLOW), ("generated", self.query_engine, QUERY_POOL_SIZE + QUERY_POOL_MAX_OVERFLOW)):
+            checked_out = engine.pool.checkedout()
+            metrics.set("db_pool_checked_out", checked_out, pool=pool)
+            metrics.set("db_pool_saturation", checked_out / capacity if capacity else 0, pool=pool)
+
+    """
+    Obtiene la conexión de la sesión midiendo la espera en el pool.
+    """
+    async def _checkout(self, session: AsyncSession, pool: str) -> None:
+        start = time.perf_counter()
         try:
-            async with self.engine.connect() as conn:
-                await conn.execute(text("SELECT 1"))
-            logger.info(f"{file_name} => Conexión exitosa con la base de datos.")
+            await session.connection()
+        except PoolTimeoutError:
+            metrics.inc("db_pool_timeouts_total", pool=pool)
+            raise
+        finally:
+            metrics.observe("db_pool_checkout_seconds", time.perf_counter() - start, pool=pool)
+
+    """
+    Escucha los eventos del engine: cada conexión nueva cuenta como éxito. Los fallos no se cuentan aquí
+    sino en cada llamada (_record_connection_error), para que un error no se registre dos veces.
+    """
+    def _register_pool_events(self, engine) -> None:
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self.health.record_success()
+
+    """
+    Registra un fallo en el monitor de salud si la excepción se debe a la conexión (y no a la query).
+    Es el único punto donde se cuentan los fallos de las operaciones con la DB (el heartbeat registra los suyos).
+    """
+    def _record_connection_error(self, error: BaseException) -> None:
+        if getattr(error, "connection_invalidated", False) or isinstance(error, (OSError, asyncio.TimeoutError)):
+            self.health.record_failure(error)
+
+    """
+    Lanza el heartbeat que sondea la DB periódicamente (también sirve de sondeo half-open).
+    """
+    def start_health_monitor(self, logger=base_logger) -> None:
+        if self.heartbeat_interval > 0 and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop(logger=logger))
+
+    async def stop_health_monitor(self) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat_loop(self, logger=base_logger) -> None:
+        while True:
+            await self.heartbeat(logger=logger)
+            await asyncio.sleep(self.heartbeat_interval)
+
+    """
+    Ejecuta un SELECT 1 con timeout y actualiza el estado de salud.
+    """
+    async def heartbeat(self, logger=base_logger) -> bool:
+        try:
+            async with asyncio.timeout(DB_CONNECT_TIMEOUT * 2):
+                async with self.engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            self.health.record_success()
             return True
-        except SQLAlchemyError as e:
-            logger.error(f"{file_name} => Error de conexión a la base de datos: {e}")
-            return False
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.exception(f"{file_name} => Error inesperado en test_connection: {e}")
+            logger.debug(f"{file_name} => Heartbeat de la DB fallido: {e}")
+            self.health.record_failure(e)
             return False
 
     """
     Obtiene una descripción completa del esquema de la base de datos,
     incluyendo tablas, descripciones de tablas y sus columnas con tipo de dato y descripción.
+    El texto formateado se cachea durante SCHEMA_CACHE_TTL segundos y se invalida si cambia la huella del esquema.
+    """
+    @traced("db.get_schema")
+    async def get_schema(self, logger=base_logger, force_refresh: bool = False) -> str | None:
+        if not force_refresh and self._schema_text is not None and not self._is_schema_cache_expired():
+            await self._check_schema_changes(logger=logger)
+            if self._schema_text is not None:
+                logger.info(f"{file_name} => Usando esquema cacheado (versión {self._schema_version}).")
+                return self._schema_text
+
+        async with self._schema_lock:
+            # Otra petición puede haber recargado el esquema mientras esperábamos el lock
+            if not force_refresh and self._schema_text is not None and not self._is_schema_cache_expired():
+                return self._schema_text
+
+            fingerprint = await self._get_schema_fingerprint(logger=logger) if self.schema_change_detection else None
+            schema_text = await self._load_schema(logger=logger)
+            if schema_text is None:
+                if self._schema_text is not None:
+                    logger.warning(f"{file_name} => No se pudo recargar el esquema, se reutiliza la versión cacheada.")
+                return self._schema_text
+
+            now = time.monotonic()
+            self._schema_text = schema_text
+            self._schema_version = hashlib.sha256(schema_text.encode("utf-8")).hexdigest()[:16]
+            self._schema_fingerprint = fingerprint
+            self._schema_loaded_at = now
+            self._schema_checked_at = now
+            logger.info(f"{file_name} => Esquema cacheado (versión {self._schema_version}).")
+            return schema_text
+
+    """
+    Invalida la caché del esquema para que la siguiente llamada a get_schema lo vuelva a consultar.
+    """
+    def invalidate_schema_cache(self, logger=base_logger) -> None:
+        logger.info(f"{file_name} => Invalidando la caché del esquema.")
+        self._schema_text = None
+        self._schema_version = ""
+        self._schema_fingerprint = None
+        self._schema_loaded_at = 0.0
+        self._schema_checked_at = 0.0
+
+    def _is_schema_cache_expired(self) -> bool:
+        if self.schema_cache_ttl <= 0:
+            return True
+        return time.monotonic() - self._schema_loaded_at >= self.schema_cache_ttl
+
+    """
+    Comprueba (como mucho cada SCHEMA_FINGERPRINT_INTERVAL segundos) si la huella del esquema ha cambiado
+    y, en ese caso, invalida la caché.
+    """
+    async def _check_schema_changes(self, logger=base_logger) -> None:
+        if not self.schema_change_detection:
+            return
+        now = time.monotonic()
+        if now - self._schema_checked_at < self.schema_fingerprint_interval:
+            return
+        self._schema_checked_at = now
+        fingerprint = await self._get_schema_fingerprint(logger=logger)
+        if fingerprint and self._schema_fingerprint and fingerprint != self._schema_fingerprint:
+            logger.info(f"{file_name} => El esquema de la base de datos ha cambiado.")
+            self.invalidate_schema_cache(logger=logger)
+
+    """
+    Obtiene una huella barata del esquema a partir de las tablas (oid, relfilenode, nº de columnas)
+    y de sus descripciones. Cambia con cualquier CREATE/ALTER/DROP TABLE o COMMENT ON.
+    """
+    async def _get_schema_fingerprint(self, logger=base_logger) -> str | None:
+        try:
+            async with self.engine.connect() as conn:
+                statement = text("""
+                    SELECT md5(
+                        COALESCE((
+                            SELECT string_agg(c.oid::text || ':' || c.relfilenode::text || ':' || c.relnatts::text, ',' ORDER BY c.oid)
+                            FROM pg_class c
+                            JOIN pg_namespace n ON n.oid = c.relnamespace
+                            WHERE c.relkind = 'r' AND n.nspname = :schema
+                        ), '')
+                        || '|' ||
+                        COALESCE((
+                            SELECT string_agg(d.objoid::text || ':' || d.objsubid::text || ':' || md5(d.description), ',' ORDER BY d.objoid, d.objsubid)
+                            FROM pg_description d
+                            JOIN pg_class c ON c.oid = d.objoid
+                            JOIN pg_namespace n ON n.oid = c.relnamespace
+                            WHERE c.relkind = 'r' AND n.nspname = :schema
+                        ), '')
+                    ) AS fingerprint;
+                """)
+                result = await conn.execute(statement, {"schema": self.schema})
+                return result.scalar()
+        except SQLAlchemyError as e:
+            self._record_connection_error(e)
+            logger.error(f"{file_name} => Error de SQLAlchemy al obtener la huella del esquema: {e}")
+        except Exception as e:
+            self._record_connection_error(e)
+            logger.exception(f"{file_name} => Error inesperado al obtener la huella del esquema: {e}")
+        return None
+
+    """
+    Consulta el catálogo de la DB y formatea el esquema como texto.
     """
-    async def get_schema(self, logger=base_logger) -> str | None:
+    async def _load_schema(self, logger=base_logger) -> str | None:
         logger.info(f"{file_name} => Obteniendo esquema de la base de datos: {self.database_url}")
         try:
             async with self.Session() as session:
@@ -102,12 +406,14 @@ class Database():
                     output.append("")
 
                 schema_text = "\n".join(output)
-                logger.debug(f"{file_name} => Esquema formateado:\n{schema_text}")
+                log_payload(logger, "schema", f"{file_name} => Esquema formateado:\n", schema_text)
                 return schema_text
 
         except SQLAlchemyError as e:
+            self._record_connection_error(e)
             logger.error(f"{file_name} => Error de SQLAlchemy al obtener el esquema: {e}")
         except Exception as e:
+            self._record_connection_error(e)
             logger.exception(f"{file_name} => Error inesperado al obtener el esquema: {e}")
 
         return None
@@ -115,12 +421,13 @@ class Database():
     """
     Obten las tablas estáticas de la base de datos.
     """
-    async def get_static_tables(self, logger=base_logger) -> dict:
+    async def get_static_tables(self, tables: List[str] = STATIC_TABLES, logger=base_logger) -> dict:
         logger.info(f"{file_name} => Obteniendo tablas estáticas de la base de datos: {self.database_url}")
         static_tables = {}
         try:
-            for table in STATIC_TABLES:
-                q = f"SELECT * FROM vismel.{table.strip()};"
+            for table in tables:
+                # Orden fijo: el contenido de las tablas forma parte del prefijo estable de los prompts
+                q = f"SELECT * FROM vismel.{table.strip()} ORDER BY 1;"
                 r = await self.query(query=q, logger=logger)
                 static_tables[table]=r
         except SQLAlchemyError as e:
@@ -131,30 +438,200 @@ class Database():
             return static_tables
 
     """
-    Ejecuta una query en la DB y devuelve los resultados.
+    Obtiene una huella por tabla estática (nº de filas y suma de xmin) en una única consulta.
+    Cualquier INSERT/UPDATE/DELETE sobre la tabla cambia su huella.
+    """
+    async def get_static_tables_fingerprint(self, tables: List[str] = STATIC_TABLES, logger=base_logger) -> Dict[str, str] | None:
+        valid_tables = [t.strip() for t in tables if IDENTIFIER_RE.match(t.strip())]
+        if not valid_tables:
+            return {}
+        try:
+            async with self.engine.connect() as conn:
+                statement = text(" UNION ALL ".join(
+                    f"SELECT '{table}' AS table_name, count(*)::text || ':' || COALESCE(sum(xmin::text::bigint), 0)::text AS fingerprint FROM vismel.\"{table}\""
+                    for table in valid_tables
+                ))
+                result = await conn.execute(statement)
+                return {row.table_name: row.fingerprint for row in result}
+        except SQLAlchemyError as e:
+            self._record_connection_error(e)
+            logger.error(f"{file_name} => Error de SQLAlchemy al obtener la huella de las tablas estáticas: {e}")
+        except Exception as e:
+            self._record_connection_error(e)
+            logger.exception(f"{file_name} => Error inesperado al obtener la huella de las tablas estáticas: {e}")
+        return None
+
+    """
+    Obtiene una huella barata de cambios por tabla a partir de las estadísticas de Postgres (sin recorrer las tablas):
+    nº acumulado de filas insertadas/actualizadas/borradas y el filenode (cambia con TRUNCATE).
+    Las tablas se indican como (esquema, tabla); sin esquema se usa el de la conexión.
+    """
+    async def get_tables_change_fingerprint(self, tables: List[Tuple[str, str]], logger=base_logger) -> Dict[str, str] | None:
+        names = sorted({(schema or self.schema, table) for schema, table in tables})
+        if not names:
+            return {}
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    text(
+                        "SELECT schemaname || '.' || relname AS table_name, "
+                        "pg_relation_filenode(relid)::text || ':' || (n_tup_ins + n_tup_upd + n_tup_del)::text AS fingerprint "
+                        "FROM pg_stat_user_tables WHERE schemaname || '.' || relname = ANY(:names)"
+                    ),
+                    {"names": [f"{schema}.{table}" for schema, table in names]}
+                )
+                fingerprints = {row.table_name: row.fingerprint for row in result}
+            # Las tablas que no aparecen (vistas, tablas del sistema...) no se pueden vigilar
+            return {f"{schema}.{table}": fingerprints.get(f"{schema}.{table}", "") for schema, table in names}
+        except SQLAlchemyError as e:
+            self._record_connection_error(e)
+            logger.error(f"{file_name} => Error de SQLAlchemy al obtener la huella de cambios de las tablas: {e}")
+        except Exception as e:
+            self._record_connection_error(e)
+            logger.exception(f"{file_name} => Error inesperado al obtener la huella de cambios de las tablas: {e}")
+        return None
+
+    """
+    Ejecuta una query interna (esquema, tablas estáticas...) en el pool principal y devuelve los resultados como lista de dicts.
     """
     async def query(self, query: str, logger=base_logger) -> List[Dict[str, Any]] | None:
+        result = await self.stream_query(query, max_rows=0, max_bytes=0, lane="internal", logger=logger)
+        return result.records() if result is not None else None
+
+    """
+    Ejecuta una query leyendo el resultado por lotes con un cursor de servidor, sin materializarlo entero.
+    Deja de leer al alcanzar max_rows filas o max_bytes bytes serializados (0 sin límite) e indica el truncado en el resultado.
+    Por defecto usa el carril del SQL generado: pool propio, transacción READ ONLY con statement_timeout/lock_timeout
+    y como mucho QUERY_SESSION_CONCURRENCY queries simultáneas por sesión.
+    """
+    @traced("db.query")
+    async def stream_query(self, query: str, max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES, fetch_size: int = QUERY_FETCH_SIZE, result_format: str = QUERY_RESULT_FORMAT, lane: Literal["generated", "internal"] = "generated", session_id: str = "anon", logger=base_logger) -> QueryResult | None:
         logger.info(f"{file_name} => Ejecutando query en la DB: {query}")
         try:
-            async with self.Session() as session:
-                statement = text(query)
-                result = await session.execute(statement)
-                data = [dict(row._mapping) for row in result]
-                logger.info(f"{file_name} => Consulta ejecutada correctamente.")
-                # logger.debug(f"{file_name} => Datos obtenidos:\n{data}")
-                return data
+            if lane == "internal":
+                async with self.Session() as session:
+                    await self._checkout(session, "internal")
+                    result = await self._fetch_bounded(session, query, max_rows, max_bytes, fetch_size, result_format)
+            else:
+                async with self._generated_session(session_id) as session:
+                    result = await self._fetch_bounded(session, query, max_rows, max_bytes, fetch_size, result_format)
+
+            set_attributes(lane=lane, rows=result.row_count, bytes=result.size_bytes, truncated=result.truncated)
+            if result.truncated:
+                logger.warning(f"{file_name} => Resultado truncado ({result.truncated_reason}): {result.row_count} filas, {result.size_bytes} bytes.")
+            logger.info(f"{file_name} => Consulta ejecutada correctamente ({result.row_count} filas).")
+            return result
+        except asyncio.CancelledError:
+            logger.warning(f"{file_name} => Query cancelada (cliente desconectado).")
+            raise
         except SQLAlchemyError as e:
-            logger.error(f"{file_name} => Error de SQLAlchemy al ejecutar query: {e}")
+            self._record_connection_error(e)
+            if self._is_statement_timeout(e):
+                logger.warning(f"{file_name} => Query cancelada por superar el statement_timeout ({self.statement_timeout_ms} ms).")
+            else:
+                logger.error(f"{file_name} => Error de SQLAlchemy al ejecutar query: {e}")
         except Exception as e:
+            self._record_connection_error(e)
             logger.exception(f"{file_name} => Error inesperado al ejecutar query: {e}")
         return None
 
+    """
+    Devuelve el plan estimado (EXPLAIN (FORMAT JSON), sin ejecutar la query) de una query generada, o None si falla.
+    """
+    @traced("db.explain")
+    async def explain(self, query: str, session_id: str = "anon", logger=base_logger) -> Dict[str, Any] | None:
+        try:
+            async with self._generated_session(session_id) as session:
+                result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {query}"))
+                plan = result.scalar()
+            if isinstance(plan, str):
+                plan = loads(plan)
+            return plan[0] if isinstance(plan, list) and plan else None
+        except asyncio.CancelledError:
+            raise
+        except SQLAlchemyError as e:
+            self._record_connection_error(e)
+            logger.warning(f"{file_name} => No se pudo obtener el plan de la query: {e}")
+        except Exception as e:
+            self._record_connection_error(e)
+            logger.exception(f"{file_name} => Error inesperado al obtener el plan de la query: {e}")
+        return None
+
+    """
+    Sesión del carril de SQL generado: pool propio, transacción READ ONLY con statement_timeout/lock_timeout
+    locales y límite de concurrencia por sesión.
+    """
+    @asynccontextmanager
+    async def _generated_session(self, session_id: str):
+        async with self._session_slot(session_id):
+            async with self.QuerySession() as session, session.begin():
+                await self._checkout(session, "generated")
+                await session.execute(text("SET TRANSACTION READ ONLY"))
+                await session.execute(
+                    text("SELECT set_config('statement_timeout', :statement_timeout, true), set_config('lock_timeout', :lock_timeout, true)"),
+                    {"statement_timeout": f"{self.statement_timeout_ms}ms", "lock_timeout": f"{self.lock_timeout_ms}ms"}
+                )
+                yield session
+
+    """
+    Lee el resultado de la query por lotes aplicando los límites de filas y bytes.
+    """
+    async def _fetch_bounded(self, session: AsyncSession, query: str, max_rows: int, max_bytes: int, fetch_size: int, result_format: str) -> QueryResult:
+        statement = text(query).execution_options(yield_per=fetch_size)
+        stream = await session.stream(statement)
+        result = QueryResult(columns=list(stream.keys()), format=result_format if result_format in get_args(ResultFormat) else "tsv")
+        try:
+            async for partition in stream.partitions(fetch_size):
+                for row in partition:
+                    if max_rows and result.row_count >= max_rows:
+                        result.truncated, result.truncated_reason = True, "max_rows"
+                        break
+                    values = tuple(row)
+                    size = len(dumps_bytes(values))
+                    if max_bytes and result.size_bytes + size > max_bytes:
+                        result.truncated, result.truncated_reason = True, "max_bytes"
+                        break
+                    result.rows.append(values)
+                    result.size_bytes += size
+                if result.truncated:
+                    break
+        finally:
+            await stream.close()
+        return result
+
+    """
+    Turno en el semáforo que limita las queries generadas simultáneas de una misma sesión. Mientras alguna
+    petición lo tenga o lo espere el semáforo no se expulsa de la caché: otro nuevo permitiría superar el límite.
+    """
+    @asynccontextmanager
+    async def _session_slot(self, session_id: str):
+        semaphore = self._session_semaphores.get(session_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.session_concurrency)
+            self._session_semaphores.set(session_id, semaphore)
+        self._session_users[session_id] = self._session_users.get(session_id, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._session_users[session_id] -= 1
+            if not self._session_users[session_id]:
+                del self._session_users[session_id]
+
+    @staticmethod
+    def _is_statement_timeout(error: BaseException) -> bool:
+        orig = getattr(error, "orig", None)
+        return getattr(orig, "sqlstate", None) == "57014" or "statement timeout" in str(error)
+
     """
     Cierra la conexión con la DB.
     """
     async def close(self, logger=base_logger) -> None:
         logger.info(f"{file_name} => Cerrando conexión con la base de datos...")
         try:
+            await self.stop_health_monitor()
+            metrics.unregister_collector("db_pool")
+            await self.query_engine.dispose()
             await self.engine.dispose()
             logger.info(f"{file_name} => Conexión cerrada exitosamente.")
         except Exception as e:
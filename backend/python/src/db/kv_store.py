@@ -0,0 +1,53 @@
+# backend/python/src/db/kv_store.py
+import os
+from typing import Any, Optional
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.logging.logger import base_logger
+from src.config.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+from src.utils.serialization import dumps, loads
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+"""
+Almacén clave-valor sobre el Redis del docker-compose para cachés compartidas entre workers.
+Los valores se guardan como JSON bajo <prefijo><clave> con un TTL opcional. Acepta un cliente ya creado
+(p.ej. fakeredis.aioredis.FakeRedis en tests). Los errores de Redis no rompen la petición:
+se registran y se tratan como un fallo de caché.
+"""
+class RedisKVStore():
+    def __init__(self, prefix: str, client: Optional[Redis] = None, host: str = REDIS_HOST, port: int = REDIS_PORT, password: Optional[str] = REDIS_PASSWORD):
+        self.client: Redis = client or Redis(host=host, port=port, password=password or None, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def get(self, key: str, logger=base_logger) -> Optional[Any]:
+        try:
+            raw = await self.client.get(self._key(key))
+            return loads(raw) if raw else None
+        except (RedisError, OSError, ValueError) as e:
+            logger.error(f"{file_name} => Error al leer {self._key(key)} de Redis: {e}")
+            return None
+
+    async def set(self, key: str, value: Any, ttl: int = 0, logger=base_logger) -> None:
+        try:
+            await self.client.set(self._key(key), dumps(value), ex=ttl if ttl > 0 else None)
+        except (RedisError, OSError) as e:
+            logger.error(f"{file_name} => Error al guardar {self._key(key)} en Redis: {e}")
+
+    async def delete(self, key: str, logger=base_logger) -> None:
+        try:
+            await self.client.delete(self._key(key))
+        except (RedisError, OSError) as e:
+            logger.error(f"{file_name} => Error al eliminar {self._key(key)} de Redis: {e}")
+
+    async def close(self, logger=base_logger) -> None:
+        try:
+            await self.client.aclose()
+        except Exception as e:
+            logger.warning(f"{file_name} => Error al cerrar la conexión con Redis: {e}")
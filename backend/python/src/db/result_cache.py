@@ -0,0 +1,129 @@
+# backend/python/src/db/result_cache.py
+import os
+from typing import Dict, List, Optional, Tuple
+
+from src.logging.logger import base_logger
+from src.config.config import RESULT_CACHE, RESULT_CACHE_BACKEND, RESULT_CACHE_PREFIX, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES
+from src.config.config import RESULT_CACHE_FINGERPRINT_INTERVAL, RESULT_CACHE_TABLE_TTLS, QUERY_MAX_ROWS, QUERY_MAX_BYTES, QUERY_RESULT_FORMAT
+from src.db.database import Database
+from src.db.kv_store import RedisKVStore
+from src.models.QueryResult import QueryResult
+from src.utils.cache import TTLCache
+from src.utils.format import hash_text
+from src.utils.metrics import metrics
+from src.utils.serialization import dumps, encode_typed, decode_typed
+from src.utils.sql import canonicalize_sql, referenced_tables, is_volatile
+from src.utils.tracing import traced, set_attributes
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("query_result_cache_total", "counter", "Consultas a la caché de resultados de SQL generado (hit, miss, bypass)")
+
+"""
+Caché de resultados de las queries generadas, delante de Database.stream_query.
+La clave es la query canónica (sqlglot) junto con la huella de cambios de las tablas que lee,
+así que cualquier escritura en esas tablas invalida sus entradas sin tener que borrarlas.
+Cada entrada vive el menor TTL de sus tablas (RESULT_CACHE_TABLE_TTLS o RESULT_CACHE_TTL).
+Se guarda en memoria del proceso o en el Redis compartido (RESULT_CACHE_BACKEND).
+"""
+class QueryResultCache():
+    def __init__(self, db: Database, enabled: bool = RESULT_CACHE, backend: str = RESULT_CACHE_BACKEND, ttl: int = RESULT_CACHE_TTL, table_ttls: Dict[str, int] = RESULT_CACHE_TABLE_TTLS, max_entries: int = RESULT_CACHE_MAX_ENTRIES, fingerprint_interval: int = RESULT_CACHE_FINGERPRINT_INTERVAL, store: Optional[RedisKVStore] = None):
+        self.db = db
+        self.enabled = enabled and ttl > 0
+        self.ttl = ttl
+        self.table_ttls = table_ttls
+        self.memory = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.store: Optional[RedisKVStore] = store or (RedisKVStore(prefix=RESULT_CACHE_PREFIX) if backend == "redis" else None)
+        self.fingerprints = TTLCache(maxsize=1024, ttl=fingerprint_interval)
+
+    """
+    Devuelve el resultado de la query desde la caché o ejecutándola en la DB (y guardándolo).
+    Las queries que dependen del momento de ejecución (now(), random()...) o cuyas tablas no se pueden vigilar no se cachean.
+    """
+    @traced("db.result_cache")
+    async def fetch(self, query: str, session_id: str = "anon", logger=base_logger) -> QueryResult | None:
+        key, ttl = await self._key(query, logger) if self.enabled else (None, 0)
+        if key is None:
+            metrics.inc("query_result_cache_total", result="bypass")
+            set_attributes(result="bypass")
+            return await self.db.stream_query(query, session_id=session_id, logger=logger)
+
+        cached = await self._get(key, logger)
+        if cached is not None:
+            metrics.inc("query_result_cache_total", result="hit")
+            set_attributes(result="hit")
+            logger.info(f"{file_name} => Resultado de la query obtenido de la caché ({cached.row_count} filas).")
+            return cached
+
+        metrics.inc("query_result_cache_total", result="miss")
+        set_attributes(result="miss")
+        result = await self.db.stream_query(query, session_id=session_id, logger=logger)
+        if result is not None:
+            await self._set(key, result, ttl, logger)
+        return result
+
+    async def close(self, logger=base_logger) -> None:
+        self.memory.clear()
+        if self.store:
+            await self.store.close(logger=logger)
+
+    """
+    Clave y TTL de la query, o (None, 0) si no se puede cachear.
+    """
+    async def _key(self, query: str, logger=base_logger) -> Tuple[Optional[str], int]:
+        if is_volatile(query):
+            return None, 0
+        tables = referenced_tables(query)
+        if not tables:
+            return None, 0
+        fingerprints = await self._fingerprints(tables, logger)
+        if fingerprints is None or not all(fingerprints.values()):
+            return None, 0
+
+        ttl = min(self.table_ttls.get(table.lower(), self.ttl) for _, table in tables)
+        if ttl <= 0:
+            return None, 0
+        key = hash_text(
+            canonicalize_sql(query),
+            dumps(fingerprints, sort_keys=True),
+            f"{QUERY_MAX_ROWS}:{QUERY_MAX_BYTES}:{QUERY_RESULT_FORMAT}",
+        )
+        return key, ttl
+
+    """
+    Huella de cambios de cada tabla, reutilizada durante RESULT_CACHE_FINGERPRINT_INTERVAL segundos.
+    """
+    async def _fingerprints(self, tables: List[Tuple[str, str]], logger=base_logger) -> Optional[Dict[str, str]]:
+        qualified = [(schema or self.db.schema, table) for schema, table in tables]
+        fingerprints = {f"{schema}.{table}": self.fingerprints.get((schema, table)) for schema, table in qualified}
+        missing = [(schema, table) for schema, table in qualified if fingerprints[f"{schema}.{table}"] is None]
+        if missing:
+            fresh = await self.db.get_tables_change_fingerprint(missing, logger=logger)
+            if fresh is None:
+                return None
+            for (schema, table) in missing:
+                fingerprint = fresh.get(f"{schema}.{table}", "")
+                self.fingerprints.set((schema, table), fingerprint)
+                fingerprints[f"{schema}.{table}"] = fingerprint
+        return fingerprints
+
+    """
+    En Redis las filas se guardan con su tipo (Decimal, fechas...) para que el resultado recuperado
+    sea idéntico al de la DB (las estadísticas del resumen dependen de ello).
+    """
+    async def _get(self, key: str, logger=base_logger) -> Optional[QueryResult]:
+        if self.store is None:
+            return self.memory.get(key)
+        state = await self.store.get(key, logger=logger)
+        if not state:
+            return None
+        return QueryResult.model_validate({**state, "rows": [tuple(decode_typed(row)) for row in state.get("rows", [])]})
+
+    async def _set(self, key: str, result: QueryResult, ttl: int, logger=base_logger) -> None:
+        if self.store is None:
+            self.memory.set(key, result, ttl=ttl)
+        else:
+            state = {**result.model_dump(exclude={"rows"}), "rows": [encode_typed(row) for row in result.rows]}
+            await self.store.set(key, state, ttl=ttl, logger=logger)
@@ -0,0 +1,112 @@
+# backend/python/src/db/session_store.py
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.logging.logger import base_logger
+from src.config.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, SESSION_STORE, SESSION_STORE_PREFIX
+from src.utils.serialization import dumps, loads
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+"""
+Interfaz de persistencia del estado de las sesiones del agente (thread, historial sincronizado,
+versiones de esquema/tablas usadas). Permite que varios workers o réplicas compartan las sesiones.
+"""
+class SessionStore(ABC):
+    @abstractmethod
+    async def load(self, session_id: str, logger=base_logger) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def save(self, session_id: str, state: Dict[str, Any], ttl: int = 0, logger=base_logger) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str, logger=base_logger) -> None:
+        ...
+
+    async def close(self, logger=base_logger) -> None:
+        pass
+
+"""
+Implementación en memoria del proceso. Útil en desarrollo, tests o con un único worker.
+"""
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._data: Dict[str, tuple[Dict[str, Any], float]] = {}
+
+    async def load(self, session_id: str, logger=base_logger) -> Optional[Dict[str, Any]]:
+        item = self._data.get(session_id)
+        if item is None:
+            return None
+        state, expires_at = item
+        if expires_at and time.monotonic() >= expires_at:
+            self._data.pop(session_id, None)
+            return None
+        return dict(state)
+
+    async def save(self, session_id: str, state: Dict[str, Any], ttl: int = 0, logger=base_logger) -> None:
+        self._data[session_id] = (dict(state), time.monotonic() + ttl if ttl > 0 else 0.0)
+        if len(self._data) % 256 == 0:
+            self._purge()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for session_id in [k for k, (_, expires_at) in self._data.items() if expires_at and now >= expires_at]:
+            self._data.pop(session_id, None)
+
+    async def delete(self, session_id: str, logger=base_logger) -> None:
+        self._data.pop(session_id, None)
+
+"""
+Implementación sobre el Redis del docker-compose. Acepta un cliente ya creado
+(p.ej. fakeredis.aioredis.FakeRedis en tests). Los errores de Redis no rompen la petición:
+se registran y la sesión se trata como nueva.
+"""
+class RedisSessionStore(SessionStore):
+    def __init__(self, client: Optional[Redis] = None, host: str = REDIS_HOST, port: int = REDIS_PORT, password: Optional[str] = REDIS_PASSWORD, prefix: str = SESSION_STORE_PREFIX):
+        self.client: Redis = client or Redis(host=host, port=port, password=password or None, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+        self.prefix = prefix
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    async def load(self, session_id: str, logger=base_logger) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.client.get(self._key(session_id))
+            return loads(raw) if raw else None
+        except (RedisError, OSError, ValueError) as e:
+            logger.error(f"{file_name} => Error al leer la sesión de Redis: {e}")
+            return None
+
+    async def save(self, session_id: str, state: Dict[str, Any], ttl: int = 0, logger=base_logger) -> None:
+        try:
+            await self.client.set(self._key(session_id), dumps(state), ex=ttl if ttl > 0 else None)
+        except (RedisError, OSError) as e:
+            logger.error(f"{file_name} => Error al guardar la sesión en Redis: {e}")
+
+    async def delete(self, session_id: str, logger=base_logger) -> None:
+        try:
+            await self.client.delete(self._key(session_id))
+        except (RedisError, OSError) as e:
+            logger.error(f"{file_name} => Error al eliminar la sesión de Redis: {e}")
+
+    async def close(self, logger=base_logger) -> None:
+        try:
+            await self.client.aclose()
+        except Exception as e:
+            logger.warning(f"{file_name} => Error al cerrar la conexión con Redis: {e}")
+
+"""
+Crea el almacén configurado en SESSION_STORE ("redis" o "memory").
+"""
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "redis":
+        return RedisSessionStore()
+    return MemorySessionStore()
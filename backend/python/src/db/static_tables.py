@@ -0,0 +1,133 @@
+# backend/python/src/db/static_tables.py
+import os
+import time
+import asyncio
+import hashlib
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.logging.logger import base_logger
+from src.config.config import STATIC_TABLES, STATIC_TABLES_REFRESH_INTERVAL
+from src.db.database import Database
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+"""
+Foto inmutable de las tablas estáticas en un momento dado.
+La versión cambia siempre que cambia el contenido de alguna tabla, por lo que
+puede usarse como clave de caché en las capas superiores (prompts, ficheros...).
+"""
+class StaticTablesSnapshot():
+    __slots__ = ("version", "tables", "fingerprint", "loaded_at")
+
+    def __init__(self, version: str, tables: Dict[str, List[Dict[str, Any]]], fingerprint: Dict[str, str], loaded_at: float):
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "tables", MappingProxyType({name: tuple(rows) for name, rows in tables.items()}))
+        object.__setattr__(self, "fingerprint", MappingProxyType(dict(fingerprint)))
+        object.__setattr__(self, "loaded_at", loaded_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StaticTablesSnapshot es inmutable")
+
+    def is_empty(self) -> bool:
+        return not self.version
+
+EMPTY_SNAPSHOT = StaticTablesSnapshot(version="", tables={}, fingerprint={}, loaded_at=0.0)
+
+"""
+Almacén de las tablas estáticas. Las carga una vez al arrancar y las refresca en segundo plano
+cada STATIC_TABLES_REFRESH_INTERVAL segundos, solo si su huella (nº de filas + xmin) ha cambiado.
+Las peticiones leen siempre la última foto sin tocar Postgres.
+"""
+class StaticTablesStore():
+    def __init__(self, db: Database, tables: List[str] = STATIC_TABLES, refresh_interval: int = STATIC_TABLES_REFRESH_INTERVAL, logger=base_logger):
+        self.db = db
+        self.tables = [t.strip() for t in tables if t.strip()]
+        self.refresh_interval = refresh_interval
+        self.logger = logger
+        self._snapshot: StaticTablesSnapshot = EMPTY_SNAPSHOT
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> StaticTablesSnapshot:
+        return self._snapshot
+
+    """
+    Carga la primera foto y lanza la tarea de refresco en segundo plano.
+    """
+    async def start(self, logger=base_logger) -> None:
+        await self.refresh(logger=logger, force=True)
+        if self.refresh_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    """
+    Detiene la tarea de refresco.
+    """
+    async def stop(self, logger=base_logger) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"{file_name} => Refresco de tablas estáticas detenido.")
+
+    """
+    Devuelve la foto actual. Si todavía no se ha podido cargar (p.ej. la DB no estaba disponible al arrancar)
+    intenta cargarla una vez.
+    """
+    async def get_snapshot(self, logger=base_logger) -> StaticTablesSnapshot:
+        if self._snapshot.is_empty() and self.tables:
+            await self.refresh(logger=logger)
+        return self._snapshot
+
+    """
+    Recarga las tablas si su huella ha cambiado (o siempre si force=True).
+    Devuelve True si se ha publicado una nueva foto.
+    """
+    async def refresh(self, logger=base_logger, force: bool = False) -> bool:
+        async with self._lock:
+            fingerprint = await self.db.get_static_tables_fingerprint(tables=self.tables, logger=logger)
+            if not force and fingerprint and not self._snapshot.is_empty() and fingerprint == dict(self._snapshot.fingerprint):
+                logger.debug(f"{file_name} => Tablas estáticas sin cambios (versión {self._snapshot.version}).")
+                return False
+
+            tables = await self.db.get_static_tables(tables=self.tables, logger=logger)
+            # Database.query devuelve None si la consulta falla: una tabla sin filas es [] y una que no se pudo leer, None
+            failed = [name for name in self.tables if tables.get(name) is None]
+            if failed:
+                logger.warning(f"{file_name} => No se pudieron cargar las tablas estáticas {failed}, se mantiene la versión {self._snapshot.version or 'vacía'}.")
+                return False
+
+            version = self._build_version(fingerprint, tables)
+            if version == self._snapshot.version:
+                return False
+
+            self._snapshot = StaticTablesSnapshot(
+                version=version,
+                tables={name: tables[name] for name in sorted(tables)},
+                fingerprint=fingerprint or {},
+                loaded_at=time.time()
+            )
+            logger.info(f"{file_name} => Nueva foto de tablas estáticas publicada (versión {version}).")
+            return True
+
+    def _build_version(self, fingerprint: Optional[Dict[str, str]], tables: Dict[str, Any]) -> str:
+        # Si no hay huella (error en la consulta) se versiona por contenido
+        parts: List[Tuple[str, str]] = sorted(fingerprint.items()) if fingerprint else sorted((k, str(v)) for k, v in tables.items())
+        digest = hashlib.sha256("|".join(f"{k}={v}" for k, v in parts).encode("utf-8")).hexdigest()
+        return digest[:16]
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh(logger=self.logger)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.exception(f"{file_name} => Error refrescando las tablas estáticas: {e}")
@@ -1,12 +1,92 @@
 # backend/python/src/logging/logger.py
 import sys
+import random
+import reprlib
+import traceback
+from contextvars import ContextVar
+from typing import Any, Optional
 from loguru import logger
 
+from src.config.config import LOG_LEVEL, LOG_FORMAT, LOG_ENQUEUE, LOG_LEVEL_HEADER, LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_LIMITS, LOG_PAYLOAD_SAMPLE_RATES
+from src.utils.serialization import dumps
+
+""" VARIABLES GLOBALES """
+TEXT_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <cyan>{extra[session_id]}</cyan> | <level>{message}</level>"
+LEVELS = {level: logger.level(level).no for level in ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")}
+DEFAULT_LEVEL = LOG_LEVEL if LOG_LEVEL in LEVELS else "INFO"
+# Nivel pedido por la petición en curso (cabecera LOG_LEVEL_HEADER); None usa LOG_LEVEL
+request_log_level: ContextVar[Optional[str]] = ContextVar("request_log_level", default=None)
+""""""""""""""""""""""""""
+
+# Representación acotada de objetos grandes (listas de mensajes, dicts de historial...) sin convertirlos enteros a texto
+_payload_repr = reprlib.Repr()
+_payload_repr.maxlevel = 4
+_payload_repr.maxlist = _payload_repr.maxtuple = _payload_repr.maxdict = 20
+_payload_repr.maxstring = _payload_repr.maxother = 500
+
+def effective_level() -> int:
+    return LEVELS[request_log_level.get() or DEFAULT_LEVEL]
+
+def is_enabled(level: str) -> bool:
+    """
+    Indica si un registro de ese nivel se escribiría en la petición actual. Permite no construir mensajes caros.
+    """
+    return LEVELS.get(level, 0) >= effective_level()
+
+def set_request_level(level: Optional[str]) -> Optional[str]:
+    """
+    Cambia el nivel de log para la petición actual (contexto asíncrono). Se ignoran los niveles desconocidos.
+    """
+    level = (level or "").strip().upper()
+    if level not in LEVELS:
+        return None
+    request_log_level.set(level)
+    return level
+
+def _filter(record) -> bool:
+    return record["level"].no >= effective_level()
+
+def _json_format(record) -> str:
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "session_id": record["extra"].get("session_id"),
+        "message": record["message"],
+    }
+    if record["exception"] is not None:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["_json"] = dumps(entry)
+    return "{extra[_json]}\n"
+
+def log_payload(log, site: str, label: str, value: Any, level: str = "DEBUG") -> None:
+    """
+    Registra un contenido potencialmente grande (prompt, mensajes, esquema...) solo si el nivel está activo.
+    Sin cambio de nivel por cabecera se escribe una fracción LOG_PAYLOAD_SAMPLE_RATES[site] de los registros.
+    El texto se construye solo si se va a escribir y se trunca a LOG_PAYLOAD_LIMITS[site] caracteres.
+    """
+    if not is_enabled(level):
+        return
+    rate = LOG_PAYLOAD_SAMPLE_RATES.get(site, 1.0)
+    if request_log_level.get() is None and rate < 1 and random.random() >= rate:
+        return
+    text = value if isinstance(value, str) else _payload_repr.repr(value)
+    limit = LOG_PAYLOAD_LIMITS.get(site, LOG_PAYLOAD_MAX_CHARS)
+    if limit and len(text) > limit:
+        text = f"{text[:limit]}... [+{len(text) - limit} caracteres]"
+    log.log(level, "{} {}", label, text)
+
 # Eliminar configuración por defecto
 logger.remove()
 
-# Agregar handler para consola en JSON o texto plano
-logger.add(sys.stdout, level="DEBUG", format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <cyan>{extra[session_id]}</cyan> | <level>{message}</level>")
+# Handler para consola en texto plano o JSON. Con LOG_ENQUEUE la escritura se hace en un hilo aparte, fuera del event loop.
+# Si se permite subir el nivel por petición el handler acepta DEBUG y el filtro decide según el nivel de la petición.
+logger.add(
+    sys.stdout,
+    level=min(LEVELS[DEFAULT_LEVEL], LEVELS["DEBUG"]) if LOG_LEVEL_HEADER else LEVELS[DEFAULT_LEVEL],
+    format=_json_format if LOG_FORMAT == "json" else TEXT_FORMAT,
+    filter=_filter,
+    enqueue=LOG_ENQUEUE,
+)
 
 # Logger base con session_id anónimo (por si no se establece explícitamente)
 base_logger = logger.bind(session_id="anon")
@@ -6,18 +6,21 @@ https://www.youtube.com/watch?v=3KVqlIF0zZw
 """
 import uvicorn
 from fastapi import FastAPI, Request, status
+from fastapi.responses import PlainTextResponse
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.errors import RateLimitExceeded
 
 from src.config.rate_limiter import limiter
-from src.config.config import HOST, PORT
+from src.config.config import HOST, PORT, METRICS_ENABLED
 from src.routes.agent import setup_routes
-from src.utils.responses import error_response
+from src.utils.responses import error_response, ORJSONResponse
+from src.utils.metrics import metrics, PROMETHEUS_CONTENT_TYPE
 
 app = FastAPI(
     title="ChatBot Vismel",
     description="API para interactuar con agente LLM de Vismel",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.state.limiter = limiter
@@ -26,6 +29,12 @@ app.add_middleware(SlowAPIMiddleware) # Middleware que aplica el control de peti
 # Registrar las rutas de la aplicación
 setup_routes(app)
 
+# Métricas en formato Prometheus (latencias, ramas del agente, pool de la DB, uso del LLM)
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # En caso de error por límite de solicitudes de enviará esta respuesta
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
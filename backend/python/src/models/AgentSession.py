@@ -0,0 +1,53 @@
+# backend/python/src/models/AgentSession.py
+import time
+import asyncio
+from pydantic import BaseModel, Field, PrivateAttr
+
+class AgentSession(BaseModel):
+    """
+    Estado del agente propio de una sesión (X-Session-ID): thread de Assistants y sincronización del historial.
+    """
+    session_id: str = "anon"
+    thread_id: str = ""
+    history_hashes: list[str] = Field(default_factory=list) # Hash de cada interacción del historial ya enviada al thread
+    pending_message_hash: str = "" # Hash del último mensaje de usuario añadido al thread (aparecerá en el próximo historial)
+    schema_version: str = "" # Versión del esquema de la DB usada en la última petición
+    static_tables_version: str = "" # Versión de las tablas estáticas usada en la última petición
+    last_used: float = Field(default_factory=time.time)
+
+    _lock: asyncio.Lock = PrivateAttr(default_factory=asyncio.Lock)
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """
+        Serializa las peticiones concurrentes de una misma sesión sobre su thread.
+        """
+        return self._lock
+
+    @property
+    def history_turns(self) -> int:
+        """
+        Nº de interacciones del historial ya enviadas al thread.
+        """
+        return len(self.history_hashes)
+
+    def reset_thread_state(self):
+        self.history_hashes = []
+        self.pending_message_hash = ""
+
+    def to_state(self) -> dict:
+        """
+        Estado serializable para el SessionStore.
+        """
+        return self.model_dump()
+
+    def apply_state(self, state: dict):
+        """
+        Sustituye el estado por el guardado en el SessionStore (p.ej. por otro worker), conservando el lock.
+        """
+        stored = AgentSession.model_validate({**state, "session_id": self.session_id})
+        for field in AgentSession.model_fields:
+            setattr(self, field, getattr(stored, field))
+
+    def touch(self):
+        self.last_used = time.time()
@@ -8,6 +8,7 @@ class File(BaseModel):
     """
     id: Any = ""
     name: str = ""
+    digest: str = ""
 
 class FileList(BaseModel):
     """
@@ -0,0 +1,56 @@
+# backend/python/src/models/QueryResult.py
+import hashlib
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+from src.utils.serialization import dumps_bytes
+
+ResultFormat = Literal["tsv", "csv", "markdown", "columnar", "records"]
+
+class QueryResult(BaseModel):
+    """
+    Resultado acotado de una query: columnas, filas (tuplas) e información de truncado.
+    """
+    columns: List[str] = Field(default_factory=list)
+    rows: List[tuple] = Field(default_factory=list)
+    size_bytes: int = 0 # Tamaño serializado aproximado de las filas leídas
+    truncated: bool = False
+    truncated_reason: Optional[Literal["max_rows", "max_bytes"]] = None
+    format: ResultFormat = "tsv" # Formato con el que se pasa al agente
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def __bool__(self) -> bool:
+        return bool(self.rows)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Filas como lista de dicts (columna -> valor).
+        """
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def columnar(self) -> Dict[str, Any]:
+        """
+        Forma compacta: nombres de columna una sola vez y filas como listas.
+        """
+        return {"columns": self.columns, "rows": [list(row) for row in self.rows]}
+
+    def digest(self) -> str:
+        """
+        Hash del contenido del resultado (columnas y filas).
+        """
+        payload = dumps_bytes([self.columns, self.rows, self.truncated])
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+class CostCheck(BaseModel):
+    """
+    Decisión del control de coste sobre una query generada.
+    """
+    allowed: bool = True
+    query: str = "" # Query a ejecutar (puede incluir un LIMIT añadido)
+    rewritten: bool = False
+    total_cost: Optional[float] = None
+    plan_rows: Optional[int] = None
+    reason: str = "" # Motivo del rechazo o de la reescritura
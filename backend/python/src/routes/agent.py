@@ -1,15 +1,21 @@
 # backend/python/src/routes/agent.py
 import os
+import asyncio
+from typing import Optional
 from fastapi import FastAPI, APIRouter, Request, Header, status
+from fastapi.responses import StreamingResponse
 
-from src.logging.logger import base_logger
-from src.config.config import INTERNAL_API_KEY
+from src.logging.logger import base_logger, log_payload, set_request_level
+from src.config.config import INTERNAL_API_KEY, LOG_LEVEL_HEADER, TRACE_DEBUG_HEADER
 from src.config.rate_limiter import limiter
-from src.services.process_message import init_agent, init_database, process_message
+from src.services.process_message import init_agent, init_database, close_agent, close_database, process_message
 from src.models.Message import Message
 from src.utils.responses import success_response, error_response, APIResponse
+from src.utils.streaming import PipelineStream, current_stream, format_sse
+from src.utils.tracing import Trace, start_trace
 
 """ VARIABLES GLOBALES """
+DISCONNECT_POLL_INTERVAL = 1 # Segundos entre comprobaciones de desconexión del cliente
 file_name = os.path.basename(__file__)
 """"""""""""""""""""""""""
 
@@ -21,11 +27,41 @@ router = APIRouter(
 def setup_routes(app: FastAPI):
     @app.on_event("startup")
     async def startup_event():
-        await init_agent()
-        await init_database()
+        await asyncio.gather(init_agent(), init_database())
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await close_agent()
+        await close_database()
+        await base_logger.complete() # Vacía la cola de logs pendientes
 
     app.include_router(router)
 
+"""
+Ejecuta el procesamiento como tarea y la cancela si el cliente HTTP se desconecta,
+liberando la conexión del pool y cancelando la query en curso.
+"""
+async def run_until_disconnected(request: Request, coro, logger=base_logger):
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"{file_name} => Cliente desconectado, cancelando el procesamiento.")
+                task.cancel()
+                raise ConnectionAbortedError("Cliente desconectado.")
+    finally:
+        if not task.done():
+            task.cancel()
+
+"""
+Desglose de tiempos de la petición si el cliente lo pide con la cabecera TRACE_DEBUG_HEADER.
+"""
+def wants_timing(request: Request, trace: Optional[Trace]) -> bool:
+    return trace is not None and bool(TRACE_DEBUG_HEADER) and bool(request.headers.get(TRACE_DEBUG_HEADER))
+
 """
 Endpoint para interactuar con el agente. Solo accesible desde el backend autorizado.
 """
@@ -60,8 +96,12 @@ async def talk(
             status_code=status.HTTP_400_BAD_REQUEST
         )
 
+    # Nivel de log solo para esta petición (p. ej. DEBUG para diagnosticar una conversación concreta)
+    if LOG_LEVEL_HEADER and set_request_level(request.headers.get(LOG_LEVEL_HEADER)):
+        logger.info(f"{file_name} => Nivel de log de la petición: {request.headers.get(LOG_LEVEL_HEADER)}")
+
     try:
-        logger.debug(f"{file_name} => Body recibido: {body.dict()}")
+        log_payload(logger, "body", f"{file_name} => Body recibido:", body)
         history = body.history
         # Si es un dict, todo bien.
         if isinstance(history, dict) or isinstance(history, list):
@@ -70,21 +110,31 @@ async def talk(
             history = {}
             
         logger.debug(f"{file_name} => Message recibido: {body.message}")
-        logger.debug(f"{file_name} => History recibido: {history}")
+        log_payload(logger, "history", f"{file_name} => History recibido:", history)
         
-        answer = await process_message(body.message, history, logger)
+        with start_trace("talk", logger=logger, session_id=session_id, endpoint="/agent/talk") as trace:
+            answer = await run_until_disconnected(request, process_message(body.message, history, logger, session_id=session_id), logger=logger)
+        headers = {"Server-Timing": trace.server_timing()} if wants_timing(request, trace) else None
 
         if answer is None:
             logger.info(f"{file_name} => No se encontraron resultados para la consulta.")
             return success_response(
                 message="No se encontraron resultados para la consulta.",
-                data=None
+                data=None,
+                headers=headers
             )
 
         logger.info(f"{file_name} => Respuesta enviada exitosamente.")
         return success_response(
             message="El agente respondió.",
-            data=answer
+            data=answer,
+            headers=headers
+        )
+
+    except ConnectionAbortedError as ce:
+        return error_response(
+            message=str(ce),
+            status_code=499
         )
 
     except ValueError as ve:
@@ -101,4 +151,85 @@ async def talk(
             message="Ocurrió un error inesperado.",
             errors=str(e),
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+"""
+Variante en streaming de /talk (Server-Sent Events). Emite los eventos de cada etapa del pipeline
+(schema_loaded, sql_generated, rows_fetched), los tokens de la respuesta final (token) según los genera
+el LLM y, al terminar, la respuesta completa (answer) o el error (error) seguido de done.
+Con la cabecera TRACE_DEBUG_HEADER antes de answer se emite el desglose de tiempos (timing).
+"""
+@router.post("/talk/stream",
+    name="Conversar con el agente (streaming)",
+    operation_id="talk_to_agent_stream",
+    description="Igual que /agent/talk pero devuelve la respuesta como Server-Sent Events a medida que avanza el procesamiento."
+)
+@limiter.limit("20/minute")
+async def talk_stream(
+    request: Request,
+    body: Message,
+    session_id: str = Header(..., alias="X-Session-ID", description="Identificador único de la sesión"),
+    api_key: str = Header(..., alias="X-Internal-API-Key", description="Clave de autenticación interna")
+):
+    logger = base_logger.bind(session_id=session_id)
+
+    logger.info(f"{file_name} => Inicio de procesamiento del endpoint /talk/stream")
+
+    if api_key != INTERNAL_API_KEY:
+        logger.warning(f"{file_name} => API key inválida: {api_key}")
+        return error_response(
+            message="API-Key no válida. No tiene permisos.",
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    if not session_id.strip():
+        logger.warning(f"{file_name} => session_id vacío o inválido.")
+        return error_response(
+            message="session_id inválido.",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Nivel de log solo para esta petición (p. ej. DEBUG para diagnosticar una conversación concreta)
+    if LOG_LEVEL_HEADER and set_request_level(request.headers.get(LOG_LEVEL_HEADER)):
+        logger.info(f"{file_name} => Nivel de log de la petición: {request.headers.get(LOG_LEVEL_HEADER)}")
+
+    history = body.history if isinstance(body.history, (dict, list)) else {}
+    stream = PipelineStream()
+
+    async def run_pipeline():
+        # La tarea tiene su propia copia del contexto: el stream solo es visible para esta petición
+        current_stream.set(stream)
+        try:
+            with start_trace("talk_stream", logger=logger, session_id=session_id, endpoint="/agent/talk/stream") as trace:
+                answer = await run_until_disconnected(request, process_message(body.message, history, logger, session_id=session_id), logger=logger)
+            if answer is None:
+                logger.info(f"{file_name} => No se encontraron resultados para la consulta.")
+            # Las cabeceras ya se enviaron: el desglose de tiempos va como evento
+            if wants_timing(request, trace):
+                stream.emit("timing", {"server_timing": trace.server_timing(), "spans": trace.breakdown()})
+            stream.emit("answer", {"response": answer})
+            logger.info(f"{file_name} => Respuesta enviada exitosamente.")
+        except Exception as e:
+            logger.exception(f"{file_name} => Error inesperado: {e}")
+            stream.emit("error", {"message": "Ocurrió un error inesperado.", "errors": str(e)})
+        finally:
+            stream.emit("done", {})
+
+    task = asyncio.create_task(run_pipeline())
+
+    async def event_source():
+        try:
+            yield format_sse("start", {"session_id": session_id})
+            async for event, data in stream.events():
+                yield format_sse(event, data)
+        finally:
+            # Si el cliente se desconecta se cancela el pipeline
+            if not task.done():
+                logger.info(f"{file_name} => Cliente desconectado, cancelando el procesamiento.")
+                task.cancel()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
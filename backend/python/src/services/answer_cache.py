@@ -0,0 +1,158 @@
+# backend/python/src/services/answer_cache.py
+import os
+import time
+from typing import Awaitable, Callable, List, Optional
+from pydantic import BaseModel
+
+try:
+    import numpy as np
+except ImportError: # Sin numpy solo se usa la búsqueda exacta
+    np = None
+
+from src.logging.logger import base_logger
+from src.config.config import ANSWER_CACHE, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_IGNORE_HISTORY
+from src.config.config import ANSWER_CACHE_SEMANTIC, ANSWER_CACHE_SIMILARITY
+from src.utils.cache import TTLCache
+from src.utils.format import normalize_question, normalize_history, hash_text
+from src.utils.metrics import metrics
+from src.utils.tracing import traced
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("answer_cache_total", "counter", "Búsquedas en la caché de respuestas (exact, semantic, miss)")
+
+def cache_scope(history, schema_version: str, static_tables_version: str, ignore_history: bool = ANSWER_CACHE_IGNORE_HISTORY) -> str:
+    """
+    Ámbito en el que una respuesta cacheada es válida: mismas versiones de datos y mismo contexto de conversación.
+    """
+    context = ""
+    if not ignore_history:
+        turns = normalize_history(history)
+        # El historial llega del más reciente al más antiguo
+        last = turns[0] if turns else {}
+        context = hash_text(str(last.get("user", "")), str(last.get("bot", last.get("history_resume", ""))))
+    return hash_text(schema_version, static_tables_version, context)
+
+class CachedAnswer(BaseModel):
+    """
+    Respuesta cacheada de una pregunta: la SQL que la resolvió, el hash del resultado y la respuesta final.
+    """
+    key: str
+    question: str
+    scope: str # Versión del esquema, de las tablas estáticas y contexto del historial
+    sql_query: str = ""
+    result_hash: str = ""
+    answer: str = ""
+    created_at: float = 0.0
+
+"""
+Índice vectorial local (fuerza bruta con NumPy) de las preguntas cacheadas.
+"""
+class VectorIndex():
+    def __init__(self):
+        self.keys: List[str] = []
+        self.matrix = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, vector: List[float]) -> None:
+        self.remove(key)
+        row = np.asarray(vector, dtype=np.float32)
+        row = row / (np.linalg.norm(row) or 1.0)
+        self.matrix = row[None, :] if self.matrix is None else np.vstack([self.matrix, row])
+        self.keys.append(key)
+
+    def remove(self, key: str) -> None:
+        if key in self.keys:
+            i = self.keys.index(key)
+            self.keys.pop(i)
+            self.matrix = np.delete(self.matrix, i, axis=0) if self.keys else None
+
+    """
+    Claves ordenadas por similitud coseno descendente (solo las que superan min_score).
+    """
+    def search(self, vector: List[float], min_score: float, top_k: int = 5) -> List[tuple[str, float]]:
+        if self.matrix is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        scores = self.matrix @ (query / (np.linalg.norm(query) or 1.0))
+        best = np.argsort(-scores)[:top_k]
+        return [(self.keys[i], float(scores[i])) for i in best if scores[i] >= min_score]
+
+"""
+Caché de respuestas del agente. La clave es la pregunta normalizada junto con la versión del esquema,
+la de las tablas estáticas y (opcionalmente) la última interacción del historial. Cada entrada guarda
+la SQL usada y el hash de su resultado: si al volver a ejecutarla el resultado no ha cambiado se devuelve
+la respuesta cacheada y, si ha cambiado, al menos se evita la llamada que genera la SQL.
+Con ANSWER_CACHE_SEMANTIC también se reconocen preguntas redactadas de otra forma por similitud de embeddings.
+"""
+class AnswerCache():
+    def __init__(self, embedder: Optional[Callable[[str], Awaitable[Optional[List[float]]]]] = None, enabled: bool = ANSWER_CACHE, ttl: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ignore_history: bool = ANSWER_CACHE_IGNORE_HISTORY, semantic: bool = ANSWER_CACHE_SEMANTIC, min_similarity: float = ANSWER_CACHE_SIMILARITY, logger=base_logger):
+        self.enabled = enabled and ttl > 0
+        self.ignore_history = ignore_history
+        self.embedder = embedder
+        self.semantic = semantic and embedder is not None and np is not None
+        self.min_similarity = min_similarity
+        self.entries = TTLCache(maxsize=max_entries, ttl=ttl, on_evict=self._on_evict)
+        self.index = VectorIndex() if self.semantic else None
+        self.vectors = TTLCache(maxsize=256, ttl=300) # Embeddings recientes: el de lookup se reutiliza en store
+        if semantic and not self.semantic:
+            logger.warning(f"{file_name} => Búsqueda semántica desactivada: falta numpy o el generador de embeddings.")
+
+    def scope(self, history, schema_version: str, static_tables_version: str) -> str:
+        return cache_scope(history, schema_version, static_tables_version, self.ignore_history)
+
+    """
+    Busca una respuesta para la pregunta: primero por coincidencia exacta de la pregunta normalizada y,
+    si está activado, por la pregunta cacheada más parecida del mismo ámbito.
+    """
+    @traced("cache.answer_lookup")
+    async def lookup(self, message: str, history, schema_version: str, static_tables_version: str, logger=base_logger) -> Optional[CachedAnswer]:
+        if not self.enabled:
+            return None
+        scope = self.scope(history, schema_version, static_tables_version)
+        entry = self.entries.get(hash_text(normalize_question(message), scope))
+        if entry is not None:
+            metrics.inc("answer_cache_total", result="exact")
+            logger.info(f"{file_name} => Pregunta encontrada en la caché de respuestas.")
+            return entry
+
+        if self.semantic and len(self.index):
+            vector = await self._embed(normalize_question(message))
+            if vector is not None:
+                for key, score in self.index.search(vector, self.min_similarity):
+                    entry = self.entries.get(key)
+                    if entry is not None and entry.scope == scope:
+                        metrics.inc("answer_cache_total", result="semantic")
+                        logger.info(f"{file_name} => Pregunta equivalente encontrada en la caché de respuestas ({score:.3f}): {entry.question}")
+                        return entry
+
+        metrics.inc("answer_cache_total", result="miss")
+        return None
+
+    async def store(self, message: str, history, schema_version: str, static_tables_version: str, sql_query: str, result_hash: str, answer: str, logger=base_logger) -> None:
+        if not self.enabled or not answer:
+            return
+        question = normalize_question(message)
+        scope = self.scope(history, schema_version, static_tables_version)
+        key = hash_text(question, scope)
+        self.entries.set(key, CachedAnswer(key=key, question=question, scope=scope, sql_query=sql_query, result_hash=result_hash, answer=answer, created_at=time.time()))
+        if self.semantic:
+            vector = await self._embed(question)
+            if vector is not None and key in self.entries:
+                self.index.add(key, vector)
+
+    async def _embed(self, question: str) -> Optional[List[float]]:
+        vector = self.vectors.get(question)
+        if vector is None:
+            vector = await self.embedder(question)
+            if vector is not None:
+                self.vectors.set(question, vector)
+        return vector
+
+    def _on_evict(self, key, entry: CachedAnswer, reason: str) -> None:
+        if self.index is not None:
+            self.index.remove(key)
@@ -0,0 +1,341 @@
+# backend/python/src/services/file_cache.py
+import os
+import time
+import asyncio
+import hashlib
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+
+from src.logging.logger import base_logger
+from src.config.config import FILE_INDEX_PATH, FILE_INDEX_STORE, FILE_INDEX_PREFIX, REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+from src.utils.serialization import dumps, dumps_bytes, loads
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+class CachedFile(BaseModel):
+    """
+    Entrada del índice local: un contenido (digest) subido a OpenAI.
+    """
+    digest: str
+    file_id: str
+    name: str
+    size: int = 0
+    in_vector_store: bool = False
+    refcount: int = 0
+    released_at: float = 0.0
+
+"""
+Índice local direccionado por contenido de los ficheros subidos a OpenAI:
+digest -> id de fichero de OpenAI -> estado en el vector store.
+Los ficheros se comparten entre sesiones con conteo de referencias y solo se eliminan
+(recolección diferida) cuando llevan un tiempo sin usarse.
+El índice y las referencias son del proceso: solo vale con un único worker (ver RedisFileCache).
+"""
+class FileCache():
+    def __init__(self, path: str = FILE_INDEX_PATH, logger=base_logger):
+        self.path = path
+        self.logger = logger
+        self.entries: Dict[str, CachedFile] = {}
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary() # Se liberan solos cuando nadie los usa
+        self.load()
+
+    """
+    Serializa el contenido de forma determinista y devuelve (bytes, digest).
+    """
+    @staticmethod
+    def serialize(data: Any, name: str) -> Tuple[bytes, str]:
+        if "json" in name and not isinstance(data, str):
+            text = dumps(data, sort_keys=True)
+        else:
+            text = str(data)
+        payload = text.encode("utf-8")
+        return payload, hashlib.sha256(payload).hexdigest()
+
+    """
+    Nombre con el que se sube el fichero: <nombre>-<digest><extensión>.
+    """
+    @staticmethod
+    def build_name(name: str, digest: str) -> str:
+        stem, ext = os.path.splitext(name)
+        return f"{stem}-{digest[:16]}{ext}"
+
+    """
+    Lock del digest: serializa la subida y la reconciliación de un mismo contenido entre peticiones.
+    """
+    def lock(self, digest: str) -> asyncio.Lock:
+        lock = self._locks.get(digest)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[digest] = lock
+        return lock
+
+    """
+    Espera a que terminen las operaciones en curso sobre cualquier digest.
+    """
+    async def wait_idle(self) -> None:
+        for lock in list(self._locks.values()):
+            async with lock:
+                pass
+
+    async def get(self, digest: str) -> Optional[CachedFile]:
+        return self.entries.get(digest)
+
+    async def get_by_file_id(self, file_id: str) -> Optional[CachedFile]:
+        for entry in self.entries.values():
+            if entry.file_id == file_id:
+                return entry
+        return None
+
+    async def all(self) -> Dict[str, CachedFile]:
+        return dict(self.entries)
+
+    async def put(self, entry: CachedFile) -> CachedFile:
+        self.entries[entry.digest] = entry
+        self.save()
+        return entry
+
+    """
+    Añade un fichero recién subido salvo que el mismo contenido ya esté en el índice: devuelve la entrada que queda.
+    """
+    async def put_new(self, entry: CachedFile) -> CachedFile:
+        return self.entries.get(entry.digest) or await self.put(entry)
+
+    async def remove(self, digest: str) -> Optional[CachedFile]:
+        entry = self.entries.pop(digest, None)
+        if entry:
+            self.save()
+        return entry
+
+    """
+    Toma una referencia al fichero. Devuelve False si ya no está en el índice (p.ej. lo acaba de retirar el GC).
+    """
+    async def acquire(self, digest: str) -> bool:
+        entry = self.entries.get(digest)
+        if entry:
+            entry.refcount += 1
+        return entry is not None
+
+    async def release(self, digest: str) -> None:
+        entry = self.entries.get(digest)
+        if entry and entry.refcount > 0:
+            entry.refcount -= 1
+            if entry.refcount == 0:
+                entry.released_at = time.time()
+                self.save()
+
+    """
+    Ficheros sin referencias que llevan más de grace_seconds sin usarse.
+    """
+    async def gc_candidates(self, grace_seconds: int) -> List[CachedFile]:
+        now = time.time()
+        return [e for e in self.entries.values() if e.refcount == 0 and now - e.released_at >= grace_seconds]
+
+    """
+    Retira el fichero del índice si sigue siendo el mismo y nadie lo ha vuelto a usar. Quien lo reclama lo elimina de OpenAI.
+    """
+    async def claim(self, entry: CachedFile, grace_seconds: int) -> bool:
+        current = self.entries.get(entry.digest)
+        if current is None or current.file_id != entry.file_id or current.refcount > 0 or time.time() - current.released_at < grace_seconds:
+            return False
+        await self.remove(entry.digest)
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    def load(self) -> None:
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    raw = loads(f.read())
+                # Las referencias eran de otro proceso: empiezan a contar desde ahora
+                self.entries = {d: CachedFile(**{**e, "refcount": 0, "released_at": time.time()}) for d, e in raw.items()}
+                self.logger.info(f"{file_name} => Índice de ficheros cargado ({len(self.entries)} entradas).")
+        except Exception as e:
+            self.logger.warning(f"{file_name} => No se pudo cargar el índice de ficheros, se empieza vacío: {e}")
+            self.entries = {}
+
+    def save(self) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(dumps_bytes({d: e.model_dump() for d, e in self.entries.items()}))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.warning(f"{file_name} => No se pudo guardar el índice de ficheros: {e}")
+
+"""
+Índice compartido en Redis entre workers y réplicas: cada worker sube y reutiliza los ficheros
+del resto y el GC de cualquiera de ellos solo elimina un fichero si nadie lo referencia.
+- <prefijo>index: digest -> entrada (id de fichero, nombre, estado en el vector store)
+- <prefijo>refs: digest -> nº de referencias de las peticiones en curso de todos los workers
+- <prefijo>released: digest -> momento en que dejó de usarse
+Los errores de Redis no rompen la petición: se registran y el fichero se sube de nuevo o no se recoge.
+"""
+class RedisFileCache(FileCache):
+    def __init__(self, client: Optional[Redis] = None, host: str = REDIS_HOST, port: int = REDIS_PORT, password: Optional[str] = REDIS_PASSWORD, prefix: str = FILE_INDEX_PREFIX, logger=base_logger):
+        self.client: Redis = client or Redis(host=host, port=port, password=password or None, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+        self.logger = logger
+        self.index_key = f"{prefix}index"
+        self.refs_key = f"{prefix}refs"
+        self.released_key = f"{prefix}released"
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def _dump(entry: CachedFile) -> str:
+        return dumps(entry.model_dump(exclude={"refcount", "released_at"}))
+
+    @staticmethod
+    def _load(raw: str, refs: Optional[str], released: Optional[str]) -> CachedFile:
+        return CachedFile(**loads(raw), refcount=int(refs or 0), released_at=float(released or 0))
+
+    async def get(self, digest: str) -> Optional[CachedFile]:
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hget(self.index_key, digest)
+                pipe.hget(self.refs_key, digest)
+                pipe.hget(self.released_key, digest)
+                raw, refs, released = await pipe.execute()
+            return self._load(raw, refs, released) if raw else None
+        except (RedisError, OSError, ValueError) as e:
+            self.logger.error(f"{file_name} => Error al leer el índice de ficheros de Redis: {e}")
+            return None
+
+    async def get_by_file_id(self, file_id: str) -> Optional[CachedFile]:
+        try:
+            entries = await self.all()
+        except (RedisError, OSError, ValueError) as e:
+            self.logger.error(f"{file_name} => Error al leer el índice de ficheros de Redis: {e}")
+            return None
+        return next((entry for entry in entries.values() if entry.file_id == file_id), None)
+
+    """
+    Índice completo. Los errores se propagan: con un índice vacío la reconciliación quitaría todo el vector store.
+    """
+    async def all(self) -> Dict[str, CachedFile]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.index_key)
+            pipe.hgetall(self.refs_key)
+            pipe.hgetall(self.released_key)
+            index, refs, released = await pipe.execute()
+        return {digest: self._load(raw, refs.get(digest), released.get(digest)) for digest, raw in index.items()}
+
+    async def put(self, entry: CachedFile) -> CachedFile:
+        try:
+            await self.client.hset(self.index_key, entry.digest, self._dump(entry))
+        except (RedisError, OSError) as e:
+            self.logger.error(f"{file_name} => Error al guardar en el índice de ficheros de Redis: {e}")
+        return entry
+
+    async def put_new(self, entry: CachedFile) -> CachedFile:
+        try:
+            if await self.client.hsetnx(self.index_key, entry.digest, self._dump(entry)):
+                return entry
+        except (RedisError, OSError) as e:
+            self.logger.error(f"{file_name} => Error al guardar en el índice de ficheros de Redis: {e}")
+            return entry
+        # Otro worker subió el mismo contenido a la vez
+        return await self.get(entry.digest) or await self.put(entry)
+
+    async def remove(self, digest: str) -> Optional[CachedFile]:
+        entry = await self.get(digest)
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hdel(self.index_key, digest)
+                pipe.hdel(self.refs_key, digest)
+                pipe.hdel(self.released_key, digest)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self.logger.error(f"{file_name} => Error al eliminar del índice de ficheros de Redis: {e}")
+        return entry
+
+    async def acquire(self, digest: str) -> bool:
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hincrby(self.refs_key, digest, 1)
+                pipe.hdel(self.released_key, digest)
+                pipe.hexists(self.index_key, digest)
+                _, _, exists = await pipe.execute()
+            if not exists:
+                await self.client.hincrby(self.refs_key, digest, -1)
+            return bool(exists)
+        except (RedisError, OSError) as e:
+            # Sin Redis tampoco hay GC que pueda eliminarlo: se usa igualmente
+            self.logger.error(f"{file_name} => Error al referenciar un fichero en Redis: {e}")
+            return True
+
+    async def release(self, digest: str) -> None:
+        try:
+            # El contador se queda en 0 (no se borra) para no perder una referencia tomada a la vez por otro worker
+            if await self.client.hincrby(self.refs_key, digest, -1) <= 0:
+                await self.client.hset(self.released_key, digest, time.time())
+        except (RedisError, OSError) as e:
+            self.logger.error(f"{file_name} => Error al liberar un fichero en Redis: {e}")
+
+    async def gc_candidates(self, grace_seconds: int) -> List[CachedFile]:
+        try:
+            entries = await self.all()
+            now = time.time()
+            candidates = []
+            for digest, entry in entries.items():
+                if entry.refcount > 0:
+                    continue
+                if not entry.released_at:
+                    # Sin fecha de liberación (p.ej. subida en curso): empieza a contar desde ahora
+                    await self.client.hsetnx(self.released_key, digest, now)
+                elif now - entry.released_at >= grace_seconds:
+                    candidates.append(entry)
+            return candidates
+        except (RedisError, OSError, ValueError) as e:
+            self.logger.error(f"{file_name} => Error al leer el índice de ficheros de Redis: {e}")
+            return []
+
+    """
+    Retira la entrada con WATCH/MULTI: si otro worker toma o suelta alguna referencia mientras tanto
+    la transacción se aborta y el fichero se deja para la siguiente recolección.
+    """
+    async def claim(self, entry: CachedFile, grace_seconds: int) -> bool:
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                await pipe.watch(self.index_key, self.refs_key, self.released_key)
+                raw = await pipe.hget(self.index_key, entry.digest)
+                refs = await pipe.hget(self.refs_key, entry.digest)
+                released = await pipe.hget(self.released_key, entry.digest)
+                if not raw or not released:
+                    return False
+                current = self._load(raw, refs, released)
+                if current.file_id != entry.file_id or current.refcount > 0 or time.time() - current.released_at < grace_seconds:
+                    return False
+                pipe.multi()
+                pipe.hdel(self.index_key, entry.digest)
+                pipe.hdel(self.refs_key, entry.digest)
+                pipe.hdel(self.released_key, entry.digest)
+                await pipe.execute()
+                return True
+        except WatchError:
+            return False
+        except (RedisError, OSError, ValueError) as e:
+            self.logger.error(f"{file_name} => Error al retirar un fichero del índice de Redis: {e}")
+            return False
+
+    async def close(self) -> None:
+        try:
+            await self.client.aclose()
+        except Exception as e:
+            self.logger.warning(f"{file_name} => Error al cerrar la conexión con Redis: {e}")
+
+"""
+Crea el índice configurado en FILE_INDEX_STORE ("redis" o "local").
+"""
+def create_file_cache(kind: str = FILE_INDEX_STORE, logger=base_logger) -> FileCache:
+    if kind == "redis":
+        return RedisFileCache(logger=logger)
+    return FileCache(logger=logger)
@@ -0,0 +1,513 @@
+# backend/python/src/services/llm_limiter.py
+import os
+import re
+import time
+import asyncio
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Literal, Optional, Tuple
+
+import httpx
+
+from src.logging.logger import base_logger
+from src.config.config import LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX, LLM_CONCURRENCY_INITIAL, LLM_CONCURRENCY_BACKOFF
+from src.config.config import LLM_LATENCY_TARGET, LLM_RPM_LIMIT, LLM_TPM_LIMIT, LLM_BACKGROUND_SHARE
+from src.config.config import MODEL, LLM_RATE_LIMIT_HEADERS, LLM_COMPLETION_TOKENS_ESTIMATE
+from src.utils.metrics import metrics
+from src.utils.serialization import loads
+from src.utils.tokens import count_tokens
+
+""" VARIABLES GLOBALES """
+Lane = Literal["interactive", "background"]
+LANES: List[Lane] = ["interactive", "background"] # Orden de prioridad
+WINDOW_SECONDS = 60 # Ventana de las tasas por minuto
+DECREASE_COOLDOWN = 2 # Segundos mínimos entre dos reducciones (varios 429 seguidos son una sola señal)
+CHARS_PER_TOKEN = 4
+EXACT_ESTIMATE_MAX_CHARS = 20000 # Textos más largos se estiman por nº de caracteres para no tokenizar en el event loop
+MESSAGE_TOKEN_OVERHEAD = 4 # Tokens de formato por mensaje de chat
+TOKEN_PATHS = ("/chat/completions", "/embeddings", "/runs") # Peticiones que consumen tokens del modelo
+USAGE_TAIL_BYTES = 4096 # Bytes finales de la respuesta donde se busca "usage" (chat, runs, embeddings)
+USAGE_RE = re.compile(rb'"total_tokens"\s*:\s*(\d+)')
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+# Carril de las llamadas de la tarea actual: las peticiones de usuarios son "interactive"; reconciliación y limpiezas, "background"
+current_lane: ContextVar[Lane] = ContextVar("llm_lane", default="interactive")
+# Sesión de la petición en curso: dentro de un carril los turnos se reparten por turnos entre sesiones
+current_session: ContextVar[str] = ContextVar("llm_session", default="anon")
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("llm_limiter_limit", "gauge", "Concurrencia máxima actual de llamadas a OpenAI (ajustada por AIMD)")
+metrics.describe("llm_limiter_in_flight", "gauge", "Llamadas a OpenAI en curso por carril")
+metrics.describe("llm_limiter_waiting", "gauge", "Llamadas a OpenAI esperando turno por carril")
+metrics.describe("llm_limiter_wait_seconds", "histogram", "Tiempo de espera hasta poder llamar a OpenAI por carril")
+metrics.describe("llm_limiter_requests_per_minute", "gauge", "Peticiones a OpenAI en el último minuto")
+metrics.describe("llm_limiter_tokens_per_minute", "gauge", "Tokens consumidos (estimados hasta conocer el uso real) en el último minuto")
+metrics.describe("llm_limiter_decreases_total", "counter", "Reducciones de la concurrencia por motivo (rate_limit, latency, timeout)")
+metrics.describe("llm_ratelimit_remaining", "gauge", "Peticiones y tokens restantes por modelo según las cabeceras x-ratelimit de OpenAI")
+metrics.describe("llm_ratelimit_delays_total", "counter", "Llamadas retenidas en cola por falta de cupo (bucket del modelo o ventana por minuto) antes de enviarlas")
+metrics.describe("llm_limiter_responses_total", "counter", "Respuestas de OpenAI por resultado (ok, rate_limited, server_error, connection_error)")
+
+@contextmanager
+def background_lane():
+    """
+    Las llamadas a OpenAI hechas dentro (y en las tareas creadas dentro) van por el carril de segundo plano.
+    """
+    token = current_lane.set("background")
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+def set_session(session_id: str) -> None:
+    """
+    Asocia las llamadas a OpenAI de la tarea actual a una sesión para el reparto equitativo de turnos.
+    """
+    current_session.set(session_id or "anon")
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Segundos de una duración de las cabeceras de OpenAI ("1s", "6m0s", "20ms", "1h2m3.5s").
+    """
+    if not value:
+        return None
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+"""
+Cubo de fichas que se rellena de forma continua. El nivel puede quedar negativo si una petición
+consume más de lo que había (la siguiente espera a que se recupere).
+"""
+class TokenBucket():
+    def __init__(self, capacity: float, refill_per_second: float, now: float):
+        self.capacity = capacity
+        self.rate = refill_per_second
+        self.level = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        needed = min(amount, self.capacity) # Una petición mayor que el cubo entero pasa cuando está lleno
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate if self.rate > 0 else WINDOW_SECONDS
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    """
+    Ajusta el cubo a lo que informa el servidor: límite, restante y tiempo hasta estar lleno.
+    Las peticiones locales enviadas después (pending) aún no se reflejan en el restante.
+    """
+    def sync(self, limit: float, remaining: float, reset_seconds: Optional[float], pending: float, now: float) -> None:
+        self.capacity = limit
+        self.rate = (limit - remaining) / reset_seconds if reset_seconds and remaining < limit else limit / WINDOW_SECONDS
+        self.rate = max(self.rate, limit / (WINDOW_SECONDS * 24 * 60)) # Límites diarios: nunca sin recarga
+        self.level = remaining - pending
+        self.updated = now
+
+"""
+Cupo de un modelo según las cabeceras x-ratelimit-*: cubo de peticiones, cubo de tokens y pausa tras un 429.
+"""
+class ModelRateLimit():
+    def __init__(self):
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def take(self, tokens: int, now: float) -> None:
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None:
+            self.tokens.take(tokens, now)
+
+"""
+Turno concedido a una llamada: carril, sesión, modelo, tokens reservados en la ventana y momento de inicio.
+"""
+class Ticket():
+    __slots__ = ("lane", "session", "model", "tokens", "start", "sequence", "entry", "future", "released")
+
+    def __init__(self, lane: Lane, tokens: int, model: Optional[str] = None, session: str = "anon"):
+        self.lane = lane
+        self.session = session
+        self.model = model
+        self.tokens = tokens
+        self.start = 0.0
+        self.sequence = 0 # Orden de envío
+        self.entry: Optional[List[float]] = None
+        self.future: Optional[asyncio.Future] = None
+        self.released = False
+
+"""
+Limitador adaptativo de las llamadas a OpenAI:
+- Concurrencia AIMD: sube de forma aditiva (+1 por "ronda" completa) mientras las respuestas llegan bien y con el
+  límite en uso, y se multiplica por LLM_CONCURRENCY_BACKOFF ante un 429, un timeout o una latencia mayor que
+  LLM_LATENCY_TARGET, siempre entre LLM_CONCURRENCY_MIN y LLM_CONCURRENCY_MAX.
+- Peticiones y tokens por minuto en una ventana deslizante; si hay límites configurados se espera a que haya hueco.
+- Cupo por modelo sincronizado con las cabeceras x-ratelimit-* de OpenAI (cubos de peticiones y de tokens): las
+  llamadas se retienen antes de enviarlas en lugar de recibir un 429. Los tokens se estiman antes de la llamada.
+- Carriles con prioridad: las llamadas interactivas pasan antes y las de segundo plano solo ocupan una fracción
+  LLM_BACKGROUND_SHARE de la concurrencia. Dentro de cada carril los turnos se reparten por rondas entre sesiones,
+  de modo que una sesión con muchas llamadas no deja esperando a las demás.
+"""
+class AdaptiveLimiter():
+    def __init__(self, minimum: int = LLM_CONCURRENCY_MIN, maximum: int = LLM_CONCURRENCY_MAX, initial: int = LLM_CONCURRENCY_INITIAL,
+                 backoff: float = LLM_CONCURRENCY_BACKOFF, latency_target: float = LLM_LATENCY_TARGET,
+                 rpm_limit: int = LLM_RPM_LIMIT, tpm_limit: int = LLM_TPM_LIMIT, background_share: float = LLM_BACKGROUND_SHARE, logger=base_logger):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit: float = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = min(max(backoff, 0.1), 0.9)
+        self.latency_target = latency_target
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.background_share = background_share
+        self.logger = logger
+        self.in_flight: Dict[Lane, int] = {lane: 0 for lane in LANES}
+        self._waiters: Dict[Lane, OrderedDict[str, Deque[Ticket]]] = {lane: OrderedDict() for lane in LANES} # Cola por sesión
+        self._running: set[Ticket] = set()
+        self.rate_limits: Dict[str, ModelRateLimit] = {}
+        self._window: Deque[List[float]] = deque() # [inicio, tokens] de cada petición del último minuto
+        self._window_tokens = 0
+        self._last_decrease = 0.0
+        self._sequence = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        metrics.set("llm_limiter_limit", int(self.limit))
+        metrics.register_collector("llm_limiter", self._collect)
+
+    @property
+    def total_in_flight(self) -> int:
+        return sum(self.in_flight.values())
+
+    """
+    Espera turno en el carril y la sesión de la tarea actual (o los indicados) reservando los tokens estimados de la llamada.
+    """
+    async def acquire(self, tokens: int = 0, model: Optional[str] = None, lane: Optional[Lane] = None, session: Optional[str] = None) -> Ticket:
+        ticket = Ticket(lane or current_lane.get(), tokens, model=model, session=session or current_session.get())
+        start = time.monotonic()
+        slot_free = not self._queued_ahead(ticket.lane) and self._slot_free(ticket.lane)
+        rate_wait = self._rate_wait(ticket, start) if slot_free else 0
+        if slot_free and rate_wait == 0:
+            self._start(ticket, start)
+        else:
+            if rate_wait > 0:
+                metrics.inc("llm_ratelimit_delays_total", model=model or "other")
+            ticket.future = asyncio.get_running_loop().create_future()
+            self._waiters[ticket.lane].setdefault(ticket.session, deque()).append(ticket)
+            metrics.add("llm_limiter_waiting", 1, lane=ticket.lane)
+            try:
+                self._wake()
+                await ticket.future
+            except asyncio.CancelledError:
+                if ticket.future.done() and not ticket.future.cancelled():
+                    self.release(ticket, tokens=0) # Turno concedido justo al cancelar
+                else:
+                    ticket.future.cancel()
+                raise
+            finally:
+                metrics.add("llm_limiter_waiting", -1, lane=ticket.lane)
+        metrics.observe("llm_limiter_wait_seconds", time.monotonic() - start, lane=ticket.lane)
+        return ticket
+
+    """
+    Señal de la respuesta (al llegar sus cabeceras): ajusta la concurrencia según el código y la latencia
+    y el cupo del modelo según las cabeceras x-ratelimit-*.
+    """
+    def on_response(self, ticket: Ticket, status_code: int, headers: Optional[httpx.Headers] = None) -> None:
+        now = time.monotonic()
+        latency = now - ticket.start
+        if headers is not None and ticket.model and LLM_RATE_LIMIT_HEADERS:
+            self._sync_rate_limit(ticket, status_code, headers, now)
+        if status_code == 429:
+            metrics.inc("llm_limiter_responses_total", outcome="rate_limited")
+            self._decrease("rate_limit")
+        elif status_code >= 500:
+            metrics.inc("llm_limiter_responses_total", outcome="server_error")
+        elif self.latency_target and latency > self.latency_target:
+            metrics.inc("llm_limiter_responses_total", outcome="ok")
+            self._decrease("latency")
+        else:
+            metrics.inc("llm_limiter_responses_total", outcome="ok")
+            self._increase()
+
+    """
+    La llamada no llegó a tener respuesta (error de conexión o timeout).
+    """
+    def on_error(self, ticket: Ticket, error: BaseException) -> None:
+        if isinstance(error, asyncio.CancelledError):
+            return
+        metrics.inc("llm_limiter_responses_total", outcome="connection_error")
+        if isinstance(error, httpx.TimeoutException):
+            self._decrease("timeout")
+
+    """
+    Libera el turno. Con los tokens reales de la llamada se corrige la reserva hecha en la ventana.
+    """
+    def release(self, ticket: Ticket, tokens: Optional[int] = None) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        self._running.discard(ticket)
+        self.in_flight[ticket.lane] -= 1
+        metrics.set("llm_limiter_in_flight", self.in_flight[ticket.lane], lane=ticket.lane)
+        # OpenAI descuenta su cupo con la estimación al recibir la petición, así que el cubo del modelo no se corrige
+        if tokens is not None and ticket.entry is not None and time.monotonic() - ticket.entry[0] < WINDOW_SECONDS:
+            self._window_tokens += tokens - ticket.entry[1]
+            ticket.entry[1] = tokens
+        self._wake()
+
+    def _sync_rate_limit(self, ticket: Ticket, status_code: int, headers: httpx.Headers, now: float) -> None:
+        rate_limit = self.rate_limits.setdefault(ticket.model, ModelRateLimit())
+        # Lo enviado después de esta petición y aún en curso no está descontado en el restante del servidor
+        later = [t for t in self._running if t.model == ticket.model and t.sequence > ticket.sequence]
+        for kind, pending in (("requests", len(later)), ("tokens", sum(t.tokens for t in later))):
+            limit, remaining = headers.get(f"x-ratelimit-limit-{kind}"), headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                limit, remaining = float(limit), float(remaining)
+            except (TypeError, ValueError):
+                continue
+            bucket = getattr(rate_limit, kind)
+            if bucket is None:
+                bucket = TokenBucket(limit, limit / WINDOW_SECONDS, now)
+                setattr(rate_limit, kind, bucket)
+            bucket.sync(limit, remaining, parse_duration(headers.get(f"x-ratelimit-reset-{kind}")), pending, now)
+            metrics.set("llm_ratelimit_remaining", remaining, model=ticket.model, kind=kind)
+        if status_code == 429:
+            retry_after = parse_duration(headers.get("retry-after-ms") and f'{headers["retry-after-ms"]}ms') or parse_duration(headers.get("retry-after"))
+            if retry_after:
+                rate_limit.blocked_until = max(rate_limit.blocked_until, now + retry_after)
+
+    def _queued_ahead(self, lane: Lane) -> bool:
+        if lane == "interactive":
+            return bool(self._waiters["interactive"])
+        return any(self._waiters.values())
+
+    def _slot_free(self, lane: Lane) -> bool:
+        limit = int(self.limit)
+        if self.total_in_flight >= limit:
+            return False
+        return lane == "interactive" or self.in_flight["background"] < max(1, int(limit * self.background_share))
+
+    def _prune(self, now: float) -> None:
+        while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+
+    """
+    Segundos hasta que la ventana del último minuto y el cupo del modelo admitan la petición (0 si cabe ya).
+    """
+    def _rate_wait(self, ticket: Ticket, now: float) -> float:
+        self._prune(now)
+        tokens = ticket.tokens
+        rate_limit = self.rate_limits.get(ticket.model) if ticket.model else None
+        wait = rate_limit.wait_time(tokens, now) if rate_limit is not None else 0.0
+        if self.rpm_limit and len(self._window) >= self.rpm_limit:
+            wait = max(wait, self._window[-self.rpm_limit][0] + WINDOW_SECONDS - now)
+        if self.tpm_limit and self._window and self._window_tokens + tokens > self.tpm_limit:
+            excess = self._window_tokens + tokens - self.tpm_limit
+            freed = 0
+            for started, used in self._window:
+                freed += used
+                if freed >= excess:
+                    wait = max(wait, started + WINDOW_SECONDS - now)
+                    break
+            else:
+                wait = max(wait, self._window[-1][0] + WINDOW_SECONDS - now)
+        return wait
+
+    def _start(self, ticket: Ticket, now: float) -> None:
+        self._sequence += 1
+        ticket.start = now
+        ticket.sequence = self._sequence
+        ticket.entry = [now, ticket.tokens]
+        self._window.append(ticket.entry)
+        self._window_tokens += ticket.tokens
+        rate_limit = self.rate_limits.get(ticket.model) if ticket.model else None
+        if rate_limit is not None:
+            rate_limit.take(ticket.tokens, now)
+        self._running.add(ticket)
+        self.in_flight[ticket.lane] += 1
+        metrics.set("llm_limiter_in_flight", self.in_flight[ticket.lane], lane=ticket.lane)
+
+    """
+    Concede turnos a los que esperan por orden de prioridad y, dentro de cada carril, por rondas entre sesiones.
+    Si lo que falta es cupo (ventana o cubos del modelo) se programa un nuevo intento para cuando lo haya.
+    """
+    def _wake(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        for lane in LANES:
+            sessions = self._waiters[lane]
+            while sessions and self._slot_free(lane):
+                ticket, wait = self._next_ticket(sessions, now)
+                if ticket is None:
+                    if wait > 0:
+                        self._timer = asyncio.get_running_loop().call_later(wait, self._wake)
+                    break
+                self._start(ticket, now)
+                ticket.future.set_result(None)
+            if sessions: # Las llamadas de menor prioridad no adelantan a las que siguen esperando
+                return
+
+    """
+    Primera llamada que puede salir ya, empezando por la sesión que lleva más tiempo sin turno; la sesión pasa
+    al final de la ronda. Si ninguna cabe en el cupo devuelve (None, segundos hasta que quepa la primera).
+    """
+    def _next_ticket(self, sessions: "OrderedDict[str, Deque[Ticket]]", now: float) -> Tuple[Optional[Ticket], float]:
+        min_wait = 0.0
+        for session, queue in list(sessions.items()):
+            while queue and queue[0].future.done(): # Canceladas mientras esperaban
+                queue.popleft()
+            if not queue:
+                del sessions[session]
+                continue
+            wait = self._rate_wait(queue[0], now)
+            if wait == 0:
+                ticket = queue.popleft()
+                if queue:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                return ticket, 0.0
+            min_wait = wait if not min_wait else min(min_wait, wait)
+        return None, min_wait
+
+    def _increase(self) -> None:
+        # Solo se sube si el límite actual se está usando entero (si no, no hay información de que quepa más)
+        if self.limit >= self.maximum or self.total_in_flight < int(self.limit):
+            return
+        previous = int(self.limit)
+        self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+        if int(self.limit) != previous:
+            metrics.set("llm_limiter_limit", int(self.limit))
+            self._wake()
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        previous = int(self.limit)
+        self.limit = max(float(self.minimum), self.limit * self.backoff)
+        metrics.inc("llm_limiter_decreases_total", reason=reason)
+        metrics.set("llm_limiter_limit", int(self.limit))
+        self.logger.warning(f"{file_name} => Concurrencia de OpenAI reducida de {previous} a {int(self.limit)} ({reason}).")
+
+    def _collect(self) -> None:
+        self._prune(time.monotonic())
+        metrics.set("llm_limiter_requests_per_minute", len(self._window))
+        metrics.set("llm_limiter_tokens_per_minute", self._window_tokens)
+
+def _text_tokens(value: Any, model: str) -> int:
+    if isinstance(value, str):
+        return count_tokens(value, model) if len(value) <= EXACT_ESTIMATE_MAX_CHARS else len(value) // CHARS_PER_TOKEN
+    if isinstance(value, list): # Contenido por partes ({"type": "text", "text": ...}) o lista de entradas de embeddings
+        return sum(_text_tokens(part.get("text", "") if isinstance(part, dict) else part, model) for part in value)
+    return 0
+
+def estimate_request(request: httpx.Request) -> Tuple[Optional[str], int]:
+    """
+    Modelo y coste estimado en tokens de una petición antes de enviarla: tokens de entrada (mensajes, instrucciones
+    o texto a vectorizar) más los de salida previstos (max_tokens o LLM_COMPLETION_TOKENS_ESTIMATE), que es como
+    los descuenta OpenAI de su cupo. Solo cuentan las peticiones al modelo (chat, embeddings, runs); el uso real
+    corrige la reserva al terminar.
+    """
+    if request.method != "POST" or not request.url.path.endswith(TOKEN_PATHS):
+        return None, 0
+    try:
+        body = loads(request.content)
+    except (httpx.RequestNotRead, ValueError):
+        return None, 0
+    if not isinstance(body, dict):
+        return None, 0
+    model = body.get("model") or MODEL # Los runs usan el modelo del assistant salvo que se indique otro
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or LLM_COMPLETION_TOKENS_ESTIMATE
+    if request.url.path.endswith("/embeddings"):
+        return model, _text_tokens(body.get("input"), model)
+    if request.url.path.endswith("/chat/completions"):
+        messages = body.get("messages") or []
+        prompt = sum(_text_tokens(message.get("content"), model) + MESSAGE_TOKEN_OVERHEAD for message in messages if isinstance(message, dict))
+        return model, prompt + completion
+    messages = body.get("additional_messages") or []
+    prompt = _text_tokens(body.get("instructions"), model) + sum(_text_tokens(message.get("content"), model) for message in messages if isinstance(message, dict))
+    return model, prompt + completion
+
+def usage_from_tail(tail: bytes) -> Optional[int]:
+    matches = USAGE_RE.findall(tail)
+    return int(matches[-1]) if matches else None
+
+"""
+Cuerpo de la respuesta que libera el turno al cerrarse (las respuestas en streaming mantienen el turno
+hasta el último evento) y guarda los últimos bytes para leer el uso real de tokens.
+"""
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[bytes], None]):
+        self._stream = stream
+        self._on_close: Optional[Callable[[bytes], None]] = on_close
+        self._tail = b""
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._tail = (self._tail + chunk)[-USAGE_TAIL_BYTES:]
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                on_close, self._on_close = self._on_close, None
+                on_close(self._tail)
+
+"""
+Transporte HTTP del cliente de OpenAI que pasa cada petición (chat, assistants, runs y sus sondeos, ficheros,
+vector stores, embeddings) por el limitador, de modo que ninguna llamada queda fuera.
+"""
+class LimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limiter: AdaptiveLimiter, transport: Optional[httpx.AsyncBaseTransport] = None, limits: Optional[httpx.Limits] = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport(limits=limits or httpx.Limits())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        model, tokens = estimate_request(request)
+        ticket = await self.limiter.acquire(tokens=tokens, model=model)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:
+            self.limiter.on_error(ticket, e)
+            self.limiter.release(ticket, tokens=0)
+            raise
+        self.limiter.on_response(ticket, response.status_code, response.headers)
+        # Los errores no consumen tokens del modelo; si la respuesta no trae el uso se mantiene la estimación
+        failed = response.status_code >= 400
+        on_close = lambda tail: self.limiter.release(ticket, tokens=0 if failed else usage_from_tail(tail))
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, on_close),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
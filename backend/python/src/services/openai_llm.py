@@ -1,25 +1,46 @@
 # backend/python/src/services/openai_llm.py
 import os
-import json
-import backoff
+import copy
+import time
 import asyncio
 from typing import Any, Optional, List, Tuple, Dict, Literal
-from openai import AsyncOpenAI, OpenAIError, RateLimitError, APITimeoutError, APIConnectionError
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError, NotFoundError
 
-from src.logging.logger import base_logger
+from src.logging.logger import base_logger, log_payload
 from src.constants.agent_prompts import PROMPTS
-from src.config.config import MODEL, MAX_CHAR_BOT_MESSAGE, MAX_CHAR_DATA, ASSISTANT_ID, VECTOR_STORE_ID
+from src.config.config import MODEL, MAX_CHAR_BOT_MESSAGE, ASSISTANT_ID, VECTOR_STORE_ID, FILE_GC_GRACE_SECONDS, FILE_GC_INTERVAL
+from src.config.config import AGENT_INIT_BACKGROUND, AGENT_INIT_CONCURRENCY, ANSWER_CACHE_EMBEDDING_MODEL, STATIC_TABLES_FORMAT
 from src.models.Files import File, FileList
-from src.utils.format import build_messages, build_prompt
+from src.models.QueryResult import QueryResult
+from src.services.file_cache import FileCache, CachedFile, create_file_cache
+from src.services.llm_limiter import AdaptiveLimiter, LimitedTransport, background_lane
+from src.models.AgentSession import AgentSession
+from src.utils.metrics import metrics
+from src.utils.format import build_messages, build_prompt, normalize_history, hash_text
+from src.utils.streaming import ResponseFieldExtractor, emit_event, is_streaming
+from src.utils.result_digest import should_summarize, digest_prompt
+from src.utils.result_format import serialize_table, records_size, upload_name
+from src.utils.serialization import loads
+from src.utils.tokens import count_tokens, data_token_budget, pack_parts
+from src.utils.tracing import traced, set_attributes
 
 """ VARIABLES GLOBALES """
+MAX_THREAD_CREATE_MESSAGES = 32 # Máximo de mensajes que acepta threads.create en una llamada
 MAX_RETRIES = 3
 TIMEOUT_SECONDS = 30
-LLM_CONCURRENCY_LIMIT = 3  # Máximo 3 llamadas concurrentes al LLM
-llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY_LIMIT)
+PART_PRIORITY = {"db_schema.txt": 0, "result.json": 1, "previous_result.json": 1} # Orden en que los datos entran en el prompt (el resto, 2)
+llm_limiter = AdaptiveLimiter() # Compartido por todos los clientes de OpenAI del proceso
 file_name = os.path.basename(__file__)
 """"""""""""""""""""""""""
 
+metrics.describe("llm_prompt_tokens_total", "counter", "Tokens de entrada enviados al LLM")
+metrics.describe("llm_completion_tokens_total", "counter", "Tokens generados por el LLM")
+metrics.describe("llm_cached_prompt_tokens_total", "counter", "Tokens de entrada servidos desde la caché de prompts del proveedor")
+metrics.describe("llm_file_uploads_total", "counter", "Datos del prompt enviados como fichero (uploaded: subida nueva, reused: contenido ya subido)")
+metrics.describe("llm_file_upload_bytes_total", "counter", "Bytes subidos a OpenAI como ficheros del vector store")
+metrics.describe("result_digest_total", "counter", "Respuestas construidas a partir de un resultado resumido (digest) o que necesitaron el resultado completo (full)")
+metrics.describe("prompt_serialization_saved_bytes_total", "counter", "Bytes ahorrados en el prompt al serializar datos tabulares en formato compacto en lugar de lista de dicts")
+
 """
 Objeto que representa un agente LLM con el que conversar.
 """
@@ -30,75 +51,216 @@ class OpenaiLLM():
         self.lang = lang
         self.limit = limit
         self.logger = logger
-        self.client: AsyncOpenAI = AsyncOpenAI(api_key=self.api_key)
+        # Todas las peticiones del cliente pasan por el limitador adaptativo (concurrencia, cupo por modelo, carriles y sesiones).
+        # Los 429 que aun así lleguen los reintenta el SDK respetando Retry-After, de nuevo a través del limitador.
+        self.client: AsyncOpenAI = AsyncOpenAI(api_key=self.api_key, max_retries=MAX_RETRIES, http_client=DefaultAsyncHttpxClient(transport=LimitedTransport(llm_limiter)))
         
         # Constantes que se deben inicializar
         self.assistant_id: str = ASSISTANT_ID
         self.vector_store_id: str = VECTOR_STORE_ID
         self.openai_files: FileList = FileList()
         self.vector_store_files: FileList = FileList()
+        self.file_cache: FileCache = create_file_cache(logger=logger)
+        self._gc_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._init_task: Optional[asyncio.Task] = None
         
-        # Variables para cada usuario
-        self.thread_id: str = ""
-        self.historial_añadido: bool = False
+        # Variables para cada usuario (ver bind)
+        self.session: AgentSession = AgentSession()
+        self._message_in_thread: bool = False # El mensaje de la petición actual ya está en el thread
+        self._acquired_digests: List[str] = [] # Ficheros del índice referenciados por la petición actual
+
+    @property
+    def thread_id(self) -> str:
+        return self.session.thread_id
+
+    @thread_id.setter
+    def thread_id(self, value: str):
+        self.session.thread_id = value
+
+    """
+    Devuelve una vista del agente ligada a una sesión. Comparte el cliente AsyncOpenAI, el assistant,
+    el vector store y las cachés de ficheros; solo el thread y el estado del historial son de la sesión.
+    """
+    def bind(self, session: AgentSession, logger=base_logger) -> "OpenaiLLM":
+        bound = copy.copy(self)
+        bound.session = session
+        bound.logger = logger
+        bound._message_in_thread = False
+        bound._acquired_digests = []
+        return bound
     
-    async def init(self, logger=base_logger):
+    """
+    Arranque rápido: solo asegura en primer plano el vector store y el assistant (si AGENT_INIT_BACKGROUND
+    es False) y reconcilia en segundo plano el vector store con el índice local de ficheros.
+    Las operaciones que necesitan el assistant esperan a que esté listo (wait_ready).
+    """
+    async def init(self, logger=base_logger, background: bool = AGENT_INIT_BACKGROUND):
         self.logger = logger
+        start = time.perf_counter()
         try:
-            self.logger.info(f"{file_name} => Inicializando variables...")            
-            # Obtenemos los ficheros guardados en OpenAI y los guardamos en local
-            self.openai_files = FileList()
-            files_result = await self.client.files.list()
-            files_list = files_result.data
-            for file in files_list:
-                self.openai_files.push(File(id=file.id, name=file.filename))
-                
-            # Obtenemos el Vector Store ya creado
-            vs = await self.client.vector_stores.retrieve(vector_store_id=self.vector_store_id)
-            # Sino crearemos uno nuevo
-            if not vs:
-                vs = await self.client.vector_stores.create(name="Vismel Data")
-                self.vector_store_id = vs.id
-            
-            # Recorremos los ficheros de vector store para eliminarlos todos
-            self.vector_store_files = FileList()
-            files_vs_result = await self.client.vector_stores.files.list(vector_store_id=self.vector_store_id)
-            files_vs_list = files_vs_result.data
-            for file in files_vs_list:
-                await self.client.vector_stores.files.delete(file_id=file.id, vector_store_id=self.vector_store_id)
-                
-            # Obtenemos el Assistente ya creado y le añadimos el vector store al que apuntar
-            assistant = await self.client.beta.assistants.retrieve(assistant_id=self.assistant_id)
-            # Si no crearemos uno nuevo
-            if not assistant:
-                assistant = await self.client.beta.assistants.create(
-                    name="ChatbotVismel",
-                    tools=[{"type": "file_search"}],
-                    model=MODEL,
-                    response_format={"type": "json_object"},
-                    tool_resources={"file_search": {"vector_store_ids":[self.vector_store_id]}}
-                )
-                self.assistant_id = assistant.id
-            else:
+            self.logger.info(f"{file_name} => Inicializando variables...")
+            self._ready = asyncio.Event()
+            self._init_task = asyncio.create_task(self._init_remote(start))
+            if not background:
+                await self._init_task
+            self.start_file_gc()
+        except Exception as e:
+            self.logger.error(f"{file_name} => Error inicializando variables: {e}")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.set("agent_startup_seconds", elapsed)
+            self.logger.info(f"{file_name} => OpenaiLLM.init completado en {elapsed:.3f}s")
+
+    """
+    Espera a que el assistant y el vector store estén listos.
+    """
+    async def wait_ready(self):
+        if self._ready is None or self._ready.is_set():
+            return
+        if self._init_task is not None and not self._init_task.done():
+            ready_wait = asyncio.ensure_future(self._ready.wait())
+            await asyncio.wait({ready_wait, self._init_task}, return_when=asyncio.FIRST_COMPLETED)
+            ready_wait.cancel()
+        if not self._ready.is_set():
+            # La inicialización en segundo plano falló: se reintenta en la propia petición
+            self.logger.warning(f"{file_name} => Assistant no inicializado, reintentando...")
+            await self._ensure_assistant()
+            self._ready.set()
+
+    async def _init_remote(self, start: float):
+        try:
+            await self._ensure_assistant()
+            self._ready.set()
+            metrics.set("agent_ready_seconds", time.perf_counter() - start)
+            self.logger.info(f"{file_name} => Assistant y vector store listos en {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            self.logger.exception(f"{file_name} => Error preparando el assistant: {e}")
+            raise
+        try:
+            with background_lane():
+                await self.reconcile_vector_store()
+            metrics.set("agent_reconcile_seconds", time.perf_counter() - start)
+        except Exception as e:
+            # La reconciliación no es crítica: el índice se corrige en la siguiente
+            self.logger.exception(f"{file_name} => Error reconciliando el vector store: {e}")
+
+    """
+    Obtiene (o crea) el vector store y el assistant, y enlaza ambos solo si hace falta.
+    """
+    async def _ensure_assistant(self):
+        async def retrieve_vs():
+            if not self.vector_store_id:
+                return None
+            try:
+                return await self.client.vector_stores.retrieve(vector_store_id=self.vector_store_id)
+            except NotFoundError:
+                return None
+
+        async def retrieve_assistant():
+            if not self.assistant_id:
+                return None
+            try:
+                return await self.client.beta.assistants.retrieve(assistant_id=self.assistant_id)
+            except NotFoundError:
+                return None
+
+        # Obtenemos el Vector Store y el Assistente ya creados en paralelo
+        vs, assistant = await asyncio.gather(retrieve_vs(), retrieve_assistant())
+        # Sino crearemos uno nuevo
+        if not vs:
+            vs = await self.client.vector_stores.create(name="Vismel Data")
+            self.vector_store_id = vs.id
+
+        if not assistant:
+            assistant = await self.client.beta.assistants.create(
+                name="ChatbotVismel",
+                tools=[{"type": "file_search"}],
+                model=MODEL,
+                response_format={"type": "json_object"},
+                tool_resources={"file_search": {"vector_store_ids":[self.vector_store_id]}}
+            )
+            self.assistant_id = assistant.id
+        else:
+            file_search = assistant.tool_resources.file_search if assistant.tool_resources else None
+            if not file_search or list(file_search.vector_store_ids or []) != [self.vector_store_id]:
                 await self.client.beta.assistants.update(
                     assistant_id=self.assistant_id,
                     tool_resources={"file_search": {"vector_store_ids":[self.vector_store_id]}}
                 )
-                
-            self.historial_añadido = False
-        except Exception as e:
-            self.logger.error(f"{file_name} => Error inicializando variables: {e}")
-            raise
-            
-    def log_backoff(self, details):
-        self.logger.warning(f"{file_name} => Reintentando por {details['exception']} (intento {details['tries']})")
-    
-    async def new_thread(self):
+
+    """
+    Reconciliación del vector store con el índice local en vez de vaciarlo:
+    - Los ficheros del vector store que están en el índice se conservan.
+    - Los que no están en el índice (contenido desconocido) se quitan del vector store con concurrencia limitada.
+    - Las entradas del índice cuyo fichero ya no existe en OpenAI se descartan.
+    Solo se corrigen las entradas tal y como estaban antes de los listados (bajo el lock de su digest):
+    las que una petición ha creado o añadido al vector store mientras tanto se respetan.
+    """
+    async def reconcile_vector_store(self):
+        start = time.perf_counter()
+        snapshot = {digest: (entry, entry.in_vector_store) for digest, entry in (await self.file_cache.all()).items()}
+        # Listados paginados completos
+        openai_files = FileList()
+        async for file in self.client.files.list(purpose="assistants"):
+            openai_files.push(File(id=file.id, name=file.filename))
+        vs_file_ids = [file.id async for file in self.client.vector_stores.files.list(vector_store_id=self.vector_store_id, limit=100)]
+
+        existing_ids = set(openai_files.get_all_files_ids())
+        for digest, (entry, in_vector_store) in snapshot.items():
+            async with self.file_cache.lock(digest):
+                current = await self.file_cache.get(digest)
+                if current is None or current.file_id != entry.file_id or current.in_vector_store != in_vector_store:
+                    continue # Modificada por una petición durante la reconciliación
+                if entry.file_id not in existing_ids:
+                    await self.file_cache.remove(digest)
+                    continue
+                if current.in_vector_store != (entry.file_id in vs_file_ids):
+                    current.in_vector_store = not current.in_vector_store
+                    await self.file_cache.put(current)
+
+        # Las subidas en curso pueden haber añadido al vector store ficheros que aún no están en el índice
+        await self.file_cache.wait_idle()
+        indexed_ids = {entry.file_id for entry in (await self.file_cache.all()).values()}
+
+        semaphore = asyncio.Semaphore(AGENT_INIT_CONCURRENCY)
+        async def remove_from_vs(file_id: str):
+            async with semaphore:
+                try:
+                    await self.client.vector_stores.files.delete(file_id=file_id, vector_store_id=self.vector_store_id)
+                except Exception as e:
+                    self.logger.warning(f"{file_name} => Error quitando {file_id} del vector store: {e}")
+
+        unknown = [file_id for file_id in vs_file_ids if file_id not in indexed_ids]
+        await asyncio.gather(*(remove_from_vs(file_id) for file_id in unknown))
+
+        # Publicamos las listas locales (se conservan los ficheros subidos durante la reconciliación)
+        for file in self.openai_files.files:
+            if not openai_files.is_file_in_list_by_id(file.id):
+                openai_files.push(file)
+        self.openai_files.files = openai_files.files
+        vector_store_files = FileList()
+        for entry in (await self.file_cache.all()).values():
+            if entry.in_vector_store:
+                vector_store_files.push(File(id=entry.file_id, name=entry.name, digest=entry.digest))
+        self.vector_store_files.files = vector_store_files.files
+
+        self.logger.info(f"{file_name} => Vector store reconciliado en {time.perf_counter() - start:.3f}s: {len(vs_file_ids) - len(unknown)} ficheros conservados, {len(unknown)} eliminados.")
+
+    async def new_thread(self, messages: List[Dict[str, str]] = []):
         try:
             self.logger.info(f"{file_name} => Creando nuevo thread...")
-            thread = await self.client.beta.threads.create()
+            # Los primeros mensajes viajan en la propia creación del thread (una sola llamada)
+            if messages:
+                thread = await self.client.beta.threads.create(messages=messages[:MAX_THREAD_CREATE_MESSAGES])
+            else:
+                thread = await self.client.beta.threads.create()
             self.thread_id = thread.id
-            self.historial_añadido = False
+            self.session.reset_thread_state()
+            self._message_in_thread = False
+            for msg in messages[MAX_THREAD_CREATE_MESSAGES:]:
+                await self._add_message_to_thread(message=msg["content"], role=msg["role"])
             return thread
         except Exception as e:
             self.logger.error(f"{file_name} => Error creando un nuevo thread: {e}")
@@ -121,12 +283,24 @@ class OpenaiLLM():
             if self.thread_id:
                 thread = await self.client.beta.threads.delete(self.thread_id)
             self.thread_id = ""
-            self.historial_añadido = False
+            self.session.reset_thread_state()
+            self._message_in_thread = False
             return thread
         except Exception as e:
             self.logger.error(f"{file_name} => Error cerrando un thread: {e}")
             raise 
         
+    """
+    Elimina un thread concreto (p.ej. el de una sesión expulsada) sin tocar el estado de este agente.
+    """
+    async def delete_thread(self, thread_id: str):
+        try:
+            self.logger.info(f"{file_name} => Eliminando thread {thread_id}...")
+            return await self.client.beta.threads.delete(thread_id)
+        except Exception as e:
+            self.logger.warning(f"{file_name} => Error eliminando el thread {thread_id}: {e}")
+            return None
+
     async def _add_message_to_thread(self, message: str, role: Literal['user','assistant'] = "user"):
         try:
             self.logger.info(f"{file_name} => Añadiendo un nuevo mensaje al thread...")
@@ -139,8 +313,13 @@ class OpenaiLLM():
             self.logger.error(f"{file_name} => Error añadiendo un nuevo mensaje al thread: {e}")
             raise 
         
-    async def _run_thread(self, prompt: str = ""):
+    @traced("llm.assistants_run")
+    async def _run_thread(self, prompt: str = "", stream_answer: bool = False):
         try:
+            set_attributes(route="assistants_thread", streamed=stream_answer and is_streaming())
+            if stream_answer and is_streaming():
+                return await self._stream_thread(prompt=prompt)
+
             self.logger.info(f"{file_name} => Corriendo thread...")
             if prompt:
                 run = await self.client.beta.threads.runs.create_and_poll(
@@ -154,59 +333,136 @@ class OpenaiLLM():
                     assistant_id=self.assistant_id,
                 )
                 
+            self._record_usage(run.usage, call="assistant")
             messages = await self.client.beta.threads.messages.list(
                 thread_id=self.thread_id,
                 run_id=run.id,
             )
-            self.logger.debug(f"{file_name} => Messages recibidos: {messages}")
+            log_payload(self.logger, "messages", f"{file_name} => Messages recibidos:", messages)
             msg = messages.data[0]
             return messages.data[0].content[0].text.value if msg else None
         except Exception as e:
             self.logger.error(f"{file_name} => Error obteniendo la respuesta de la run de un thread: {e}")
             raise
+
+    """
+    Corre el thread en streaming reenviando los tokens del campo "response" según se generan.
+    Devuelve el texto completo del mensaje del assistant.
+    """
+    async def _stream_thread(self, prompt: str = "") -> Optional[str]:
+        self.logger.info(f"{file_name} => Corriendo thread en streaming...")
+        extractor = ResponseFieldExtractor()
+        parts: List[str] = []
+        kwargs = {"instructions": prompt} if prompt else {}
+        async with self.client.beta.threads.runs.stream(thread_id=self.thread_id, assistant_id=self.assistant_id, **kwargs) as stream:
+            async for event in stream:
+                if event.event == "thread.run.completed":
+                    self._record_usage(event.data.usage, call="assistant")
+                if event.event != "thread.message.delta":
+                    continue
+                for block in event.data.delta.content or []:
+                    if block.type == "text" and block.text and block.text.value:
+                        parts.append(block.text.value)
+                        token = extractor.feed(block.text.value)
+                        if token:
+                            emit_event("token", text=token)
+        return "".join(parts) or None
             
-    async def _create_file(self, data: str | dict | list[dict], name: str, directory: str = "tmp") -> File:
+    """
+    Sube un contenido al vector store reutilizando el fichero si ese mismo contenido (digest) ya se subió.
+    El fichero queda referenciado por la petición hasta que se llama a release_files.
+    """
+    @traced("llm.file_upload")
+    async def _create_file(self, data: str | dict | list[dict], name: str) -> File:
         try:
-            # Asegura que el directorio exista
-            os.makedirs(directory, exist_ok=True)
+            await self.wait_ready()
+            payload, digest = self.file_cache.serialize(data, name)
+            # Las peticiones concurrentes con el mismo contenido esperan a la primera subida y la reutilizan
+            async with self.file_cache.lock(digest):
+                entry = await self.file_cache.get(digest)
+                # La referencia se toma antes de usarlo: si el GC de otro worker lo acaba de retirar se sube de nuevo
+                if entry and not await self.file_cache.acquire(digest):
+                    entry = None
+                reused = entry is not None
+                if reused:
+                    self._acquired_digests.append(digest)
+                set_attributes(file=name, bytes=len(payload), reused=reused)
+                metrics.inc("llm_file_uploads_total", result="reused" if reused else "uploaded")
 
-            # Construir ruta final
-            file_path = os.path.join(directory, f"{name}")
-            
-            exist_file_in_openai = self.openai_files.get_file_by_name(name)
-            # Si existe el fichero en openai lo recuperamos
-            if exist_file_in_openai:
-                exist_file_in_vs = self.vector_store_files.get_file_by_id(exist_file_in_openai.id)
-                if not exist_file_in_vs: # Si no existe en el vector store lo guaramos porque lo vamos a usar
-                    await self.client.vector_stores.files.create(vector_store_id=self.vector_store_id, file_id=exist_file_in_openai.id)
-                    self.vector_store_files.push(exist_file_in_openai)
-                self.logger.info(f"{file_name} => Usando archivo existente...")
-                return exist_file_in_openai # Devolvemos el fichero existente
-            else:# Si NO existe el fichero en openai lo creamos
-                self.logger.info(f"{file_name} => Generando nuevo fichero...")
-                # Escribir contenido
-                with open(file_path, "w", encoding="utf-8") as f:
-                    if "json" in name:
-                        json.dump(data, f, ensure_ascii=False, indent=4)
+                if not reused: # Contenido nuevo: lo subimos con un nombre que incluye el digest
+                    file_upload_name = self.file_cache.build_name(name, digest)
+                    self.logger.info(f"{file_name} => Generando nuevo fichero: {file_upload_name}")
+                    file_openai = await self.client.files.create(file=(file_upload_name, payload), purpose="assistants")
+                    metrics.inc("llm_file_upload_bytes_total", len(payload))
+                    self.logger.info(f"{file_name} => Archivo subido correctamente: {file_openai.id} - {file_upload_name}")
+
+                    # Se registra en el índice antes de añadirlo al vector store para que la reconciliación no lo tome por desconocido
+                    entry = await self.file_cache.put_new(CachedFile(digest=digest, file_id=file_openai.id, name=file_upload_name, size=len(payload)))
+                    if entry.file_id != file_openai.id: # Otro worker subió el mismo contenido a la vez: usamos el suyo
+                        await self.client.files.delete(file_id=file_openai.id)
                     else:
-                        f.write(str(data))
+                        self.openai_files.push(file=File(id=entry.file_id, name=entry.name, digest=digest))
+                    await self.file_cache.acquire(digest)
+                    self._acquired_digests.append(digest)
 
-                # Lo creamos en openai y recuperamos su id
-                file_openai = await self.client.files.create(file=open(file_path, "rb"), purpose="assistants")
-                file_id = file_openai.id
-                
-                # Lo creamos en el vector store porque lo vamos a usar
-                await self.client.vector_stores.files.create(vector_store_id=self.vector_store_id, file_id=file_id)
-
-                self.logger.info(f"{file_name} => Archivo temporal subido correctamente: {file_id} - {name}")
-                f = File(id=file_id, name=name)
-                # Guardamos los ficheros en sus respectivas caches
-                self.openai_files.push(file=f)
-                self.vector_store_files.push(file=f)
-                return f
+                if not entry.in_vector_store: # Si no existe en el vector store lo guardamos porque lo vamos a usar
+                    await self.client.vector_stores.files.create(vector_store_id=self.vector_store_id, file_id=entry.file_id)
+                    entry.in_vector_store = True
+                    await self.file_cache.put(entry)
+                    self.vector_store_files.push(File(id=entry.file_id, name=entry.name, digest=digest))
+                if reused:
+                    self.logger.info(f"{file_name} => Usando archivo existente: {entry.file_id} - {entry.name}")
+                return File(id=entry.file_id, name=entry.name, digest=digest)
         except Exception as e:
             self.logger.error(f"{file_name} => Error al crear un nuevo archivo: {e}")
             raise
+
+    """
+    Libera las referencias a ficheros tomadas durante la petición. Se eliminarán más tarde
+    si nadie los vuelve a usar en FILE_GC_GRACE_SECONDS segundos.
+    """
+    async def release_files(self):
+        for digest in self._acquired_digests:
+            await self.file_cache.release(digest)
+        self._acquired_digests = []
+
+    def start_file_gc(self):
+        if FILE_GC_INTERVAL > 0 and (self._gc_task is None or self._gc_task.done()):
+            self._gc_task = asyncio.create_task(self._file_gc_loop())
+
+    async def _file_gc_loop(self):
+        while True:
+            await asyncio.sleep(FILE_GC_INTERVAL)
+            try:
+                with background_lane():
+                    await self.collect_garbage_files()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.exception(f"{file_name} => Error en la recolección de ficheros: {e}")
+
+    """
+    Elimina de OpenAI (y del vector store) los ficheros sin referencias que llevan tiempo sin usarse.
+    """
+    async def collect_garbage_files(self, grace_seconds: int = FILE_GC_GRACE_SECONDS) -> int:
+        removed = 0
+        for entry in await self.file_cache.gc_candidates(grace_seconds):
+            async with self.file_cache.lock(entry.digest):
+                # Una petición (de este u otro worker) pudo volver a usarlo mientras se eliminaban los anteriores
+                if not await self.file_cache.claim(entry, grace_seconds):
+                    continue
+                try:
+                    if entry.in_vector_store:
+                        await self.client.vector_stores.files.delete(vector_store_id=self.vector_store_id, file_id=entry.file_id)
+                    await self.client.files.delete(file_id=entry.file_id)
+                except Exception as e:
+                    self.logger.warning(f"{file_name} => Error al eliminar el fichero {entry.file_id}: {e}")
+                self.vector_store_files.delete_file_by_id(entry.file_id)
+                self.openai_files.delete_file_by_id(entry.file_id)
+                removed += 1
+        if removed:
+            self.logger.info(f"{file_name} => {removed} ficheros sin uso eliminados.")
+        return removed
         
     async def _delete_file_from_op(self, id: str = "", name: str = "") -> File | None:
         try:
@@ -244,7 +500,7 @@ class OpenaiLLM():
             self.logger.error(f"{file_name} => Error al eliminar un archivo del vector store: {e}")
             raise
         
-    async def _delete_file(self, id: str = "", name: str = "", directory: str = "tmp"):
+    async def _delete_file(self, id: str = "", name: str = ""):
         file: File | None = None
         try:
             file_o = await self._delete_file_from_op(id=id, name=name)
@@ -254,109 +510,215 @@ class OpenaiLLM():
             elif file_v:
                 file = file_v
             
-            if file and file.name:
-                file_path = os.path.join(directory, f"{file.name}")
-                os.remove(path=file_path)
+            # Lo quitamos también del índice local
+            entry = await self.file_cache.get_by_file_id(file.id) if file else None
+            if entry:
+                await self.file_cache.remove(entry.digest)
         except Exception as e:
             self.logger.warning(f"{file_name} => Error al eliminar un archivo por completo: {e}")
         finally:
             return file
 
-    @backoff.on_exception(
-        backoff.expo,
-        (RateLimitError, APIConnectionError, APITimeoutError),
-        max_tries=MAX_RETRIES,
-        on_backoff=log_backoff
-    )
-    async def _call_openai(self, messages: list[dict]) -> Optional[str]:
+    @traced("llm.chat_completion")
+    async def _call_openai(self, messages: list[dict], stream_answer: bool = False) -> Optional[str]:
         res = None
-        async with llm_semaphore:
-            try:
+        set_attributes(route="chat", streamed=stream_answer and is_streaming(), messages=len(messages))
+        try:
+            if stream_answer and is_streaming():
+                res = await self._stream_openai(messages=messages)
+            else:
                 response = await self.client.chat.completions.create(
                     model=MODEL,
                     messages=messages,
                     response_format={"type": "json_object"},
                 )
                 res = response.choices[0].message.content
-                self.logger.debug(f"{file_name} => _call_openai res: {res}")
-            except OpenAIError as e:
-                self.logger.error(f"{file_name} => Error en _call_openai (OpenAIError): {e}")
-            except Exception as e:
-                self.logger.exception(f"{file_name} => Error inesperado en _call_openai: {e}")
-            finally:
-                return res
+                self._record_usage(response.usage, call="chat")
+            log_payload(self.logger, "response", f"{file_name} => _call_openai res:", res)
+        except asyncio.CancelledError:
+            raise # La petición se ha cancelado (cliente desconectado, timeout): no se convierte en respuesta vacía
+        except OpenAIError as e:
+            self.logger.error(f"{file_name} => Error en _call_openai (OpenAIError): {e}")
+        except Exception as e:
+            self.logger.exception(f"{file_name} => Error inesperado en _call_openai: {e}")
+        return res
             
     """
-    Procesa un fragmento del prompt. Si es muy largo, lo guarda en un archivo.
+    Registra los tokens de una llamada, incluidos los servidos desde la caché de prompts del proveedor (cached_tokens).
+    """
+    def _record_usage(self, usage, call: str) -> None:
+        if not usage:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        metrics.inc("llm_prompt_tokens_total", usage.prompt_tokens or 0, call=call)
+        metrics.inc("llm_completion_tokens_total", usage.completion_tokens or 0, call=call)
+        metrics.inc("llm_cached_prompt_tokens_total", cached_tokens, call=call)
+        set_attributes(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0, cached_tokens=cached_tokens)
+        self.logger.debug(f"{file_name} => Tokens ({call}): prompt={usage.prompt_tokens} (cacheados={cached_tokens}), completion={usage.completion_tokens}")
+
+    """
+    Devuelve el embedding de un texto, o None si falla.
     """
-    async def _process_prompt_part(self, name: str, content: str | dict | list[dict], max_length: int) -> str:
+    @traced("llm.embed")
+    async def embed(self, text: str, model: str = ANSWER_CACHE_EMBEDDING_MODEL) -> Optional[List[float]]:
         try:
-            if len(str(content)) > max_length:
-                file = await self._create_file(content, name=name)
-                return f"In the file with id: {file.id}"
-            return str(content)
+            response = await self.client.embeddings.create(model=model, input=text)
+            return response.data[0].embedding
+        except OpenAIError as e:
+            self.logger.error(f"{file_name} => Error al obtener el embedding (OpenAIError): {e}")
         except Exception as e:
-            self.logger.error(f"{file_name} => Error al procesar una parte del prompt: {e}")
-            raise
+            self.logger.exception(f"{file_name} => Error inesperado al obtener el embedding: {e}")
+        return None
+
+    """
+    Llamada a chat.completions en streaming: reenvía los tokens del campo "response" según llegan
+    y devuelve el contenido completo para procesarlo igual que en _call_openai.
+    """
+    async def _stream_openai(self, messages: list[dict]) -> Optional[str]:
+        extractor = ResponseFieldExtractor()
+        parts: List[str] = []
+        stream = await self.client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        # Cerrar la respuesta libera el turno del limitador aunque se cancele la petición o falle a mitad
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(chunk.usage, call="chat")
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    token = extractor.feed(delta)
+                    if token:
+                        emit_event("token", text=token)
+        return "".join(parts) or None
+
+    @staticmethod
+    def _part_format(content: Any) -> str:
+        return content.format if isinstance(content, QueryResult) else STATIC_TABLES_FORMAT
+
+    """
+    Serializa una parte tabular del prompt en el formato compacto configurado y registra cuánto ocupa menos que la lista de dicts.
+    """
+    def _serialize_part(self, name: str, content: Any, fmt: str) -> str:
+        text = serialize_table(content, fmt)
+        saved = records_size(content, text) - len(text.encode("utf-8"))
+        if saved > 0:
+            metrics.inc("prompt_serialization_saved_bytes_total", saved, format=fmt)
+        self.logger.debug(f"{file_name} => {name} serializado como {fmt}: {len(text)} caracteres ({saved} bytes menos que la lista de dicts).")
+        return text
 
     """
-    Procesa múltiples fragmentos de datos, asegurando que el total no exceda el máximo.
+    Decide qué datos van en línea en el prompt y cuáles se suben como fichero. Cada parte se serializa y se
+    tokeniza una sola vez y se incluyen por prioridad (esquema, resultados, tablas estáticas) mientras quepan en el
+    presupuesto de tokens del modelo; solo las que no caben se suben al vector store.
     """
-    async def _process_prompts(self, prompt_parts: List[Tuple[str, str | dict | list[dict]]], max_length: int) -> Dict[str, str]:
+    async def _process_prompts(self, prompt_parts: List[Tuple[str, Any]], budget: Optional[int] = None) -> Dict[str, str]:
         try:
-            processed = {name: await self._process_prompt_part(name, content, max_length)
-                        for name, content in prompt_parts}
+            budget = data_token_budget() if budget is None else budget
+            formats = {name: self._part_format(content) for name, content in prompt_parts}
+            texts = {name: content if isinstance(content, str) else self._serialize_part(name, content, formats[name]) for name, content in prompt_parts}
+            tokens = {name: count_tokens(text) for name, text in texts.items()}
+            inline, overflow = pack_parts([(name, PART_PRIORITY.get(name, 2), tokens[name]) for name in texts], budget)
+            self.logger.debug(f"{file_name} => Tokens de datos: {sum(tokens[n] for n in inline)}/{budget} en línea, a fichero: {overflow}")
 
-            total_length = sum(len(p) for p in processed.values())
-            
-            # Si aún combinados sobrepasan el límite, dividir más
-            if total_length > max_length:
-                for name, original_content in prompt_parts:
-                    if not processed[name].startswith("In the file"):
-                        file = await self._create_file(original_content, name=name)
-                        processed[name] = f"In the file with id: {file.id}"
-                        total_length = sum(len(p) for p in processed.values())
-                        if total_length <= max_length:
-                            break
-            return processed
+            processed = {name: texts[name] for name in inline}
+            for name, content in prompt_parts:
+                if name in overflow:
+                    file = await self._create_file(texts[name], name=name if isinstance(content, str) else upload_name(name, formats[name]))
+                    processed[name] = f"In the file with id: {file.id}"
+            return {name: processed[name] for name, _ in prompt_parts}
         except Exception as e:
             self.logger.error(f"{file_name} => Error al procesar el prompt: {e}")
             raise
     
-    async def _insert_history_messages_in_thread(self, history):
+    """
+    Prepara el thread de la sesión para una run: sincroniza solo las interacciones del historial que aún
+    no están en el thread y añade el mensaje actual. Si no hay thread se crea con todo en una única llamada.
+    """
+    @traced("llm.sync_thread")
+    async def _sync_thread(self, history, message: str):
         try:
-            if not self.historial_añadido:
-                self.logger.info(f"{file_name} => Añadiendo el historial...")
-                for interaction in history:
-                    user_msg = interaction.get("user")
-                    bot_msg = interaction.get("bot")
+            await self.wait_ready()
+            # El historial llega de la más reciente a la más antigua; el thread se construye en orden cronológico
+            turns = [(t.get("user") or "", t.get("bot") or "") for t in reversed(normalize_history(history))]
+            turn_hashes = [hash_text(user_msg, bot_msg) for user_msg, bot_msg in turns]
+            synced = set(self.session.history_hashes)
+
+            # Si el historial ya no contiene nada de lo enviado, la conversación se ha reiniciado
+            if self.thread_id and synced and not synced.intersection(turn_hashes):
+                self.logger.info(f"{file_name} => El historial no coincide con el thread, se crea uno nuevo.")
+                old_thread_id = self.thread_id
+                self.thread_id = ""
+                await self.delete_thread(old_thread_id)
+
+            if not self.thread_id:
+                messages = []
+                for user_msg, bot_msg in turns:
+                    if user_msg:
+                        messages.append({"role": "user", "content": user_msg})
+                    if bot_msg:
+                        messages.append({"role": "assistant", "content": bot_msg})
+                messages.append({"role": "user", "content": message})
+                self.logger.info(f"{file_name} => Creando thread con {len(turns)} interacciones del historial...")
+                await self.new_thread(messages=messages)
+                self.session.history_hashes = turn_hashes
+            else:
+                # La interacción cuya pregunta ya se añadió en la run anterior ya está en el thread
+                pending = self.session.pending_message_hash
+                delta = []
+                for (user_msg, bot_msg), turn_hash in zip(turns, turn_hashes):
+                    if turn_hash in synced:
+                        continue
+                    if pending and hash_text(user_msg) == pending:
+                        # Solo falta la respuesta final que vio el usuario
+                        pending = ""
+                        delta.append(("", bot_msg))
+                    else:
+                        delta.append((user_msg, bot_msg))
+                    self.session.history_hashes.append(turn_hash)
+                    synced.add(turn_hash)
+
+                self.logger.info(f"{file_name} => Sincronizando {len(delta)} interacciones nuevas del historial...")
+                for user_msg, bot_msg in delta:
                     if user_msg:
                         await self._add_message_to_thread(message=user_msg, role='user')
                     if bot_msg:
                         await self._add_message_to_thread(message=bot_msg, role='assistant')
-            else:
-                self.logger.info(f"{file_name} => No hace falta añadir el historial")
-            self.historial_añadido = True
+                if not self._message_in_thread:
+                    await self._add_message_to_thread(message=message, role='user')
+
+            self._message_in_thread = True
+            self.session.pending_message_hash = hash_text(message)
         except Exception as e:
-            self.logger.error(f"{file_name} => Error al añadir los mensajes del historial a un thread: {e}")
-    
+            self.logger.error(f"{file_name} => Error al sincronizar el historial con el thread: {e}")
+            raise
+
     """
     El agente genera una query SQL para extraer los datos necesarios, o directamente, genera una respuesta según el mensaje del usuario. 
     """
+    @traced("llm.get_response")
     async def get_response(self, message: str, db_schema: str = "NO DATA", static_tables: dict = {}, history: dict | list[dict] = []) -> Optional[str]:
         try:
             self.logger.debug(f"{file_name} => Iniciando get_response...")
                 
-            prompt_parts: List[Tuple[str, str | dict | list[dict]]] = [("db_schema.txt", str(db_schema))]
-            for table_name, table_data in static_tables.items():
+            prompt_parts: List[Tuple[str, Any]] = [("db_schema.txt", str(db_schema))]
+            for table_name, table_data in sorted(static_tables.items()):
                 prompt_parts.append((f"{table_name}.json", table_data))
             
-            processed_prompts = await self._process_prompts(prompt_parts, MAX_CHAR_DATA)
+            processed_prompts = await self._process_prompts(prompt_parts)
             db_schema_prompt = processed_prompts["db_schema.txt"]
             static_tables_prompt = "\n---\n".join(f"{k}\n{v}" for k, v in processed_prompts.items() if k != "db_schema.txt")
             
-            self.logger.debug(f"{file_name} => db_schema_prompt: {db_schema_prompt}")
-            self.logger.debug(f"{file_name} => static_tables_prompt: {static_tables_prompt}")
+            log_payload(self.logger, "schema", f"{file_name} => db_schema_prompt:", db_schema_prompt)
+            log_payload(self.logger, "static_tables", f"{file_name} => static_tables_prompt:", static_tables_prompt)
             
             prompt = build_prompt(PROMPTS["get_response"], {
                 "db_schema": db_schema_prompt, 
@@ -365,15 +727,13 @@ class OpenaiLLM():
                 "limit": self.limit
             })
             
-            self.logger.debug(f"{file_name} => attachments: {self.openai_files.files}")
-            self.logger.debug(f"{file_name} => attachments vs: {self.vector_store_files.files}")
-            self.logger.debug(f"{file_name} => prompt: {prompt}")
+            log_payload(self.logger, "attachments", f"{file_name} => attachments:", self.openai_files.files)
+            log_payload(self.logger, "attachments", f"{file_name} => attachments vs:", self.vector_store_files.files)
+            log_payload(self.logger, "prompt", f"{file_name} => prompt:", prompt)
             
             # Si alguno de los datos se ha guardado en un fichero se llamara al assistant, sino será una consulta normal
             if any(value.startswith("In the file") for value in processed_prompts.values()):
-                await self.continue_thread()
-                await self._insert_history_messages_in_thread(history=history)
-                await self._add_message_to_thread(message=message, role='user')
+                await self._sync_thread(history=history, message=message)
                 return await self._run_thread(prompt=prompt)
             else:
                 messages = build_messages(prompt=prompt, message=message, history=history)
@@ -385,21 +745,17 @@ class OpenaiLLM():
     """
     El agente genera una query SQL para extraer los datos necesarios a partir de una query previa debido a la indeterminación o ambigüedad de los datos como podría ser un nombre.
     """
-    async def get_query_from_previous_data(self, message: str, db_schema: str = "NO DATA", static_tables: dict = {}, previous_sql="NO DATA", previous_result: list[dict] | Any = "NO DATA", history: dict | list[dict] = []) -> Optional[str]:
+    @traced("llm.get_query_from_previous_data")
+    async def get_query_from_previous_data(self, message: str, db_schema: str = "NO DATA", static_tables: dict = {}, previous_sql="NO DATA", previous_result: QueryResult | list[dict] | Any = "NO DATA", history: dict | list[dict] = []) -> Optional[str]:
         try:
             self.logger.debug(f"{file_name} => Iniciando get_query_from_previous_data...")
             
-            # Eliminamos el fichero previous_result por si hay restos
-            file_previous_results = self.openai_files.get_file_by_name(name="previous_result.json")
-            if file_previous_results:
-                await self._delete_file(id=file_previous_results.id, name=file_previous_results.name)
-            
-            prompt_parts: List[Tuple[str, str | dict | list[dict]]] = [("db_schema.txt", str(db_schema)), ("previous_result.json", previous_result)]
-            for table_name, table_data in static_tables.items():
+            prompt_parts: List[Tuple[str, Any]] = [("db_schema.txt", str(db_schema)), ("previous_result.json", previous_result)]
+            for table_name, table_data in sorted(static_tables.items()):
                 prompt_parts.append((f"{table_name}.json", table_data))
 
             # Aqui decidimos si guardar el contenido en un fichero o pasarlo directamente en el prompt
-            processed_prompts = await self._process_prompts(prompt_parts, MAX_CHAR_DATA)
+            processed_prompts = await self._process_prompts(prompt_parts)
             
             db_schema_prompt = processed_prompts["db_schema.txt"]
             previous_result_prompt = processed_prompts["previous_result.json"]
@@ -418,19 +774,12 @@ class OpenaiLLM():
 
             # Si alguno de los datos se ha guardado en un fichero se llamara al assistant, sino será una consulta normal
             if any(value.startswith("In the file") for value in processed_prompts.values()):
-                await self.continue_thread()
-                await self._insert_history_messages_in_thread(history=history)
-                await self._add_message_to_thread(message=message, role='user')
+                await self._sync_thread(history=history, message=message)
                 res = await self._run_thread(prompt=prompt)
             else:
                 messages = build_messages(prompt=prompt, message=message, history=history)
                 res = await self._call_openai(messages=messages)
                 
-            # Eliminamos el fichero de previous_result
-            file_previous_results = self.openai_files.get_file_by_name(name="previous_result.json")
-            if file_previous_results:
-                await self._delete_file(id=file_previous_results.id, name=file_previous_results.name)
-                
             return res
         except Exception as e:
             self.logger.exception(f"{file_name} => Error inesperado en get_query_from_previous_data: {e}")
@@ -440,20 +789,21 @@ class OpenaiLLM():
     """
     El agente genera una respuesta a partir del mensaje del usuario y de los datos obtenidos de la DB.
     """
-    async def build_answer_from_query(self, result: list[dict[str, Any]], message: str, db_schema: str = "NO DATA", static_tables: dict = {}, sql_query: str = "NO DATA", history: dict | list[dict] = []) -> Optional[str]:
+    @traced("llm.build_answer_from_query")
+    async def build_answer_from_query(self, result: QueryResult | list[dict[str, Any]] | dict[str, Any], message: str, db_schema: str = "NO DATA", static_tables: dict = {}, sql_query: str = "NO DATA", history: dict | list[dict] = [], summarize: bool = True) -> Optional[str]:
         try:
             self.logger.debug(f"{file_name} => Iniciando build_answer_from_query...")
             
-            # Eliminamos el fichero result por si hay restos
-            file_result = self.openai_files.get_file_by_name(name="result.json")
-            if file_result:
-                await self._delete_file(id=file_result.id, name=file_result.name)
-            
-            prompt_parts: List[Tuple[str, str | dict | list[dict]]] = [("db_schema.txt", str(db_schema)), ("result.json", result)]
-            for table_name, table_data in static_tables.items():
+            # Los resultados grandes se resumen (estadísticas, totales por grupo y una muestra) en lugar de enviar todas las filas
+            summarized = summarize and isinstance(result, QueryResult) and should_summarize(result)
+            if summarized:
+                self.logger.info(f"{file_name} => Resultado de {result.row_count} filas resumido para el agente.")
+                emit_event("result_summarized", rows=result.row_count, step="answer")
+            prompt_parts: List[Tuple[str, Any]] = [("db_schema.txt", str(db_schema)), ("result.json", digest_prompt(result) if summarized else result)]
+            for table_name, table_data in sorted(static_tables.items()):
                 prompt_parts.append((f"{table_name}.json", table_data))
 
-            processed_prompts = await self._process_prompts(prompt_parts, MAX_CHAR_DATA)
+            processed_prompts = await self._process_prompts(prompt_parts)
             db_schema_prompt = processed_prompts["db_schema.txt"]
             result_prompt = processed_prompts["result.json"]
             static_tables_prompt = "\n---\n".join(
@@ -469,26 +819,31 @@ class OpenaiLLM():
                 "limit": self.limit
             })
 
+            # Con el resumen el agente puede pedir el resultado completo y se repetiría la respuesta: solo se emiten
+            # tokens en la pasada definitiva (la respuesta resumida llega igualmente en el evento "answer")
+            stream_answer = not summarized
             # Si alguno de los datos se ha guardado en un fichero se llamara al assistant, sino será una consulta normal
             if any(value.startswith("In the file") for value in processed_prompts.values()):
-                await self.continue_thread()
-                await self._insert_history_messages_in_thread(history=history)
-                await self._add_message_to_thread(message=message, role='user')
-                res = await self._run_thread(prompt=prompt)
+                await self._sync_thread(history=history, message=message)
+                res = await self._run_thread(prompt=prompt, stream_answer=stream_answer)
             else:
                 messages = build_messages(prompt=prompt, message=message, history=history)
-                res = await self._call_openai(messages=messages)
-
-            # Eliminamos el fichero result por si hay restos
-            file_result = self.openai_files.get_file_by_name(name="result.json")
-            if file_result:
-                await self._delete_file(id=file_result.id, name=file_result.name)
+                res = await self._call_openai(messages=messages, stream_answer=stream_answer)
 
             try:
-                res_json = json.loads(res) if res else {}
+                res_json = loads(res) if res else {}
                 response = res_json.get("response", "")
             except Exception as e:
+                res_json = {}
                 response = res
+
+            if summarized:
+                # El agente pide las filas completas cuando el resumen y la muestra no bastan (p. ej. un listado entero)
+                need_full_result = bool(res_json.get("need_full_result")) if isinstance(res_json, dict) else False
+                metrics.inc("result_digest_total", outcome="full" if need_full_result else "digest")
+                if need_full_result:
+                    self.logger.info(f"{file_name} => El agente necesita el resultado completo, se repite con todas las filas.")
+                    return await self.build_answer_from_query(result=result, message=message, db_schema=db_schema, static_tables=static_tables, sql_query=sql_query, history=history, summarize=False)
                 
             return str(response)
         except Exception as e:
@@ -498,15 +853,16 @@ class OpenaiLLM():
     """
     El agente genera una respuesta a partir del mensaje del usuario sin tener los datos de la DB.
     """
-    async def build_answer_without_query(self, message: str, db_schema: str = "NO DATA", static_tables: dict = {}, sql_query: str = "NO DATA", history: dict | list[dict] = []) -> Optional[str]:
+    @traced("llm.build_answer_without_query")
+    async def build_answer_without_query(self, message: str, db_schema: str = "NO DATA", static_tables: dict = {}, sql_query: str = "NO DATA", history: dict | list[dict] = [], reason: str = "NONE") -> Optional[str]:
         try:
             self.logger.debug(f"{file_name} => Iniciando build_answer_without_query...")
             
-            prompt_parts: List[Tuple[str, str | dict | list[dict]]] = [("db_schema.txt", str(db_schema))]
-            for table_name, table_data in static_tables.items():
+            prompt_parts: List[Tuple[str, Any]] = [("db_schema.txt", str(db_schema))]
+            for table_name, table_data in sorted(static_tables.items()):
                 prompt_parts.append((f"{table_name}.json", table_data))
 
-            processed_prompts = await self._process_prompts(prompt_parts, MAX_CHAR_DATA)
+            processed_prompts = await self._process_prompts(prompt_parts)
             db_schema_prompt = processed_prompts["db_schema.txt"]
             static_tables_prompt = "\n---\n".join(
                 f"{k}\n{v}" for k, v in processed_prompts.items() if k != "db_schema.txt"
@@ -516,22 +872,21 @@ class OpenaiLLM():
                 "db_schema": db_schema_prompt,
                 "static_tables": static_tables_prompt,
                 "sql_query": sql_query,
+                "reason": reason or "NONE",
                 "lang": self.lang,
                 "limit": self.limit
             })
 
             # Si alguno de los datos se ha guardado en un fichero se llamara al assistant, sino será una consulta normal
             if any(value.startswith("In the file") for value in processed_prompts.values()):
-                await self.continue_thread()
-                await self._insert_history_messages_in_thread(history=history)
-                await self._add_message_to_thread(message=message, role='user')
-                res = await self._run_thread(prompt=prompt)
+                await self._sync_thread(history=history, message=message)
+                res = await self._run_thread(prompt=prompt, stream_answer=True)
             else:
                 messages = build_messages(prompt=prompt, message=message, history=history)
-                res = await self._call_openai(messages=messages)
+                res = await self._call_openai(messages=messages, stream_answer=True)
 
             try:
-                res_json = json.loads(res) if res else {}
+                res_json = loads(res) if res else {}
                 response = res_json.get("response", "")
             except Exception as e:
                 response = res
@@ -0,0 +1,94 @@
+# backend/python/src/services/plan_cache.py
+import os
+import random
+from typing import Any, Dict, Optional
+
+from src.logging.logger import base_logger
+from src.config.config import PLAN_CACHE, PLAN_CACHE_TTL, PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_VERIFY_RATE, ANSWER_CACHE_IGNORE_HISTORY
+from src.services.answer_cache import cache_scope
+from src.utils.cache import TTLCache
+from src.utils.format import normalize_question, hash_text
+from src.utils.metrics import metrics
+from src.utils.serialization import loads
+from src.utils.sql import canonicalize_sql
+
+""" VARIABLES GLOBALES """
+ROUTING_KEYS = ("sql_query", "extra_sql_query")
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("plan_cache_total", "counter", "Búsquedas en la caché de planes de get_response (hit, miss)")
+metrics.describe("plan_cache_verifications_total", "counter", "Aciertos de la caché de planes contrastados con una llamada nueva (match, drift)")
+metrics.describe("plan_cache_hit_ratio", "gauge", "Proporción de aciertos de la caché de planes desde el arranque")
+
+"""
+Caché de planes: guarda la salida de get_response (la SQL o extra SQL generada y la decisión de ruta) por
+pregunta normalizada, versión del esquema y de las tablas estáticas y contexto del historial, de modo que
+las preguntas repetidas se saltan esa llamada al LLM. Solo se cachean las decisiones que llevan SQL;
+las respuestas directas dependen demasiado de la conversación.
+Una fracción de los aciertos (PLAN_CACHE_VERIFY_RATE) se contrasta con una llamada nueva para detectar deriva.
+"""
+class PlanCache():
+    def __init__(self, enabled: bool = PLAN_CACHE, ttl: int = PLAN_CACHE_TTL, max_entries: int = PLAN_CACHE_MAX_ENTRIES, verify_rate: float = PLAN_CACHE_VERIFY_RATE, ignore_history: bool = ANSWER_CACHE_IGNORE_HISTORY):
+        self.enabled = enabled and ttl > 0
+        self.verify_rate = verify_rate
+        self.ignore_history = ignore_history
+        self.plans = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.hits: int = 0
+        self.lookups: int = 0
+
+    def key(self, message: str, history, schema_version: str, static_tables_version: str) -> str:
+        return hash_text(normalize_question(message), cache_scope(history, schema_version, static_tables_version, self.ignore_history))
+
+    """
+    Devuelve la salida cacheada de get_response para la pregunta, o None.
+    """
+    def get(self, key: str, logger=base_logger) -> Optional[str]:
+        if not self.enabled:
+            return None
+        plan = self.plans.get(key)
+        self.lookups += 1
+        if plan is not None:
+            self.hits += 1
+            logger.info(f"{file_name} => Plan encontrado en la caché, se omite get_response.")
+        metrics.inc("plan_cache_total", result="hit" if plan is not None else "miss")
+        metrics.set("plan_cache_hit_ratio", self.hits / self.lookups)
+        return plan
+
+    """
+    Indica si un acierto debe contrastarse con una llamada nueva al LLM.
+    """
+    def should_verify(self) -> bool:
+        return self.verify_rate > 0 and random.random() < self.verify_rate
+
+    def put(self, key: str, raw_response: str) -> None:
+        if self.enabled and self._routing(raw_response) is not None:
+            self.plans.set(key, raw_response)
+
+    """
+    Compara el plan cacheado con uno recién generado y registra si coinciden. El plan nuevo sustituye al cacheado.
+    """
+    def verify(self, key: str, cached: str, fresh: str, logger=base_logger) -> bool:
+        match = self._routing(cached) == self._routing(fresh)
+        metrics.inc("plan_cache_verifications_total", result="match" if match else "drift")
+        if not match:
+            logger.warning(f"{file_name} => Deriva en la caché de planes: el plan cacheado no coincide con el nuevo.")
+            self.plans.pop(key)
+        self.put(key, fresh)
+        return match
+
+    """
+    Decisión de ruta de una salida de get_response: (tipo, SQL canónica), o None si no lleva SQL.
+    """
+    @staticmethod
+    def _routing(raw_response: str) -> Optional[tuple[str, str]]:
+        try:
+            response: Dict[str, Any] = loads(raw_response)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(response, dict):
+            return None
+        for routing_key in ROUTING_KEYS:
+            if response.get(routing_key):
+                return routing_key, canonicalize_sql(str(response[routing_key]))
+        return None
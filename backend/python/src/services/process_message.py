@@ -1,27 +1,62 @@
 # backend/python/src/services/process_message.py
 import os
-import json
 from typing import Optional
-import asyncio
 
 from src.logging.logger import base_logger
 from src.config.config import DB_HOST, DB_PORT, DB_NAME, DB_SCHEMA, OPENAI_API_KEY, DB_BOT_PASSWORD
 from src.db.database import Database
+from src.db.static_tables import StaticTablesStore
+from src.db.cost_gate import QueryCostGate
+from src.db.result_cache import QueryResultCache
+from src.db.session_store import create_session_store
 from src.services.openai_llm import OpenaiLLM
+from src.services.llm_limiter import set_session
+from src.services.session_manager import SessionManager
+from src.services.answer_cache import AnswerCache, CachedAnswer
+from src.services.plan_cache import PlanCache
+from src.models.AgentSession import AgentSession
+from src.utils.metrics import metrics
+from src.utils.serialization import loads, JSONDecodeError
+from src.utils.streaming import emit_event
+from src.utils.tracing import traced, set_attributes
 
 """ VARIABLES GLOBALES """
 agent: Optional[OpenaiLLM] = None
+session_manager: Optional[SessionManager] = None
+answer_cache: Optional[AnswerCache] = None
+plan_cache: Optional[PlanCache] = None
 db: Optional[Database] = None
+static_tables_store: Optional[StaticTablesStore] = None
+cost_gate: Optional[QueryCostGate] = None
+result_cache: Optional[QueryResultCache] = None
 file_name = os.path.basename(__file__)
 """"""""""""""""""""""""""
 
+metrics.describe("agent_branch_total", "counter", "Rama seguida por handle_agent_response (direct, sql_query, extra_sql_query, fallback)")
+
+def record_branch(branch: str) -> None:
+    metrics.inc("agent_branch_total", branch=branch)
+    set_attributes(branch=branch)
+
 async def init_agent():
-    global agent
+    global agent, session_manager, answer_cache, plan_cache
     agent = OpenaiLLM(api_key=OPENAI_API_KEY)
     await agent.init()
-    
+    answer_cache = AnswerCache(embedder=agent.embed)
+    plan_cache = PlanCache()
+    session_manager = SessionManager(agent, store=create_session_store())
+    session_manager.start()
+
+async def close_agent():
+    global session_manager
+    if session_manager:
+        await session_manager.stop()
+        session_manager = None
+    if agent:
+        await agent.file_cache.close()
+
 async def init_database():
-    global db
+    global db, static_tables_store, cost_gate, result_cache
     db = Database(
         user="bot",
         password=DB_BOT_PASSWORD,
@@ -30,8 +65,27 @@ async def init_database():
         name=DB_NAME,
         schema=DB_SCHEMA,
     )
+    db.start_health_monitor()
+    cost_gate = QueryCostGate(db)
+    result_cache = QueryResultCache(db)
+    static_tables_store = StaticTablesStore(db)
+    await static_tables_store.start()
 
-async def process_message(message: str, history: dict | list[dict], logger=base_logger):
+async def close_database():
+    global db, static_tables_store, cost_gate, result_cache
+    if static_tables_store:
+        await static_tables_store.stop()
+        static_tables_store = None
+    cost_gate = None
+    if result_cache:
+        await result_cache.close()
+        result_cache = None
+    if db:
+        await db.close()
+        db = None
+
+@traced("pipeline.process_message")
+async def process_message(message: str, history: dict | list[dict], logger=base_logger, session_id: str = "anon"):
     """
     Procesa un mensaje entrante.
     Intenta obtener respuesta desde la DB mediante queries. Si falla, responde sin datos.
@@ -44,6 +98,7 @@ async def process_message(message: str, history: dict | list[dict], logger=base_
             await init_database()
         
         logger.info(f"{file_name} => Inicio process_message...")
+        set_session(session_id) # Reparto equitativo de las llamadas a OpenAI entre sesiones
         if not history:
             history = {}
         else:
@@ -51,48 +106,82 @@ async def process_message(message: str, history: dict | list[dict], logger=base_
         logger.debug(f"{file_name} => Mensaje recibido: {message}")
         
         if agent and db:
-            # 1. Verificar conexión a la base de datos
-            if not await db.test_connection(logger):
-                logger.warning(f"{file_name} => No se pudo conectar a la base de datos.")
-                return await agent.build_answer_without_query(message=message, history=history)
-
-            # 2. Obtener esquema de la base de datos
-            db_schema = await db.get_schema(logger=logger)
-            static_tables = await db.get_static_tables(logger=logger)
-            if not db_schema:
-                logger.error(f"{file_name} => No se pudo obtener el esquema de la base de datos.")
-                return await agent.build_answer_without_query(message=message, db_schema="NO DATA", static_tables=static_tables, history=history)
-
-            logger.debug(f"{file_name} => Esquema de DB obtenido correctamente.")
-
-            # 3. Obtener respuesta del agente
-            raw_response = await agent.get_response(message, db_schema=db_schema, static_tables=static_tables, history=history)
-            if not raw_response:
-                logger.error(f"{file_name} => Respuesta del agente vacía.")
-                return await agent.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
+            # Vista del agente con el estado (thread, historial) propio de la sesión
+            session = await session_manager.get(session_id, logger=logger) if session_manager else AgentSession(session_id=session_id)
+            llm = agent.bind(session=session, logger=logger)
 
-            try:
-                agent_response = json.loads(raw_response)
-            except json.JSONDecodeError as jde:
-                logger.error(f"{file_name} => Error al parsear JSON: {jde}")
-                agent_response = raw_response
+            async with session.lock:
+                # Otro worker pudo usar la sesión desde que está en la caché local
+                if session_manager:
+                    await session_manager.refresh(session, logger=logger)
+                try:
+                    # 1. Verificar conexión a la base de datos (estado cacheado, sin ir a la DB)
+                    if not db.is_available():
+                        logger.warning(f"{file_name} => La base de datos no está disponible (circuito {db.health.state}).")
+                        return await llm.build_answer_without_query(message=message, history=history)
+
+                    # 2. Obtener esquema de la base de datos
+                    db_schema = await db.get_schema(logger=logger)
+                    static_tables = (await static_tables_store.get_snapshot(logger=logger)).tables if static_tables_store else {}
+                    if not db_schema:
+                        logger.error(f"{file_name} => No se pudo obtener el esquema de la base de datos.")
+                        return await llm.build_answer_without_query(message=message, db_schema="NO DATA", static_tables=static_tables, history=history)
+
+                    logger.debug(f"{file_name} => Esquema de DB obtenido correctamente.")
+                    emit_event("schema_loaded", schema_version=db.schema_version)
+
+                    # 3. Pregunta ya respondida con los mismos datos: se reutiliza su SQL (y su respuesta si el resultado no ha cambiado)
+                    cached = await answer_cache.lookup(message, history, *data_versions(), logger=logger) if answer_cache else None
+                    if cached and cached.sql_query:
+                        set_attributes(answer_cache="hit")
+                        emit_event("answer_cache_hit", question=cached.question)
+                        return await run_query_and_build_answer(cached.sql_query, message, db_schema, static_tables=static_tables, history=history, logger=logger, llm=llm, cached=cached)
 
-            return await handle_agent_response(agent_response, message, db_schema, static_tables=static_tables, history=history, logger=logger)
+                    # 4. Obtener respuesta del agente (o el plan cacheado para la misma pregunta)
+                    plan_key = plan_cache.key(message, history, *data_versions()) if plan_cache else ""
+                    cached_plan = plan_cache.get(plan_key, logger=logger) if plan_cache else None
+                    set_attributes(plan_cache="hit" if cached_plan else "miss")
+                    if cached_plan and not plan_cache.should_verify():
+                        raw_response = cached_plan
+                    else:
+                        raw_response = await llm.get_response(message, db_schema=db_schema, static_tables=static_tables, history=history)
+                        if plan_cache and raw_response:
+                            if cached_plan:
+                                plan_cache.verify(plan_key, cached_plan, raw_response, logger=logger)
+                            else:
+                                plan_cache.put(plan_key, raw_response)
+                    if not raw_response:
+                        logger.error(f"{file_name} => Respuesta del agente vacía.")
+                        return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
+
+                    try:
+                        agent_response = loads(raw_response)
+                    except JSONDecodeError as jde:
+                        logger.error(f"{file_name} => Error al parsear JSON: {jde}")
+                        agent_response = raw_response
+
+                    return await handle_agent_response(agent_response, message, db_schema, static_tables=static_tables, history=history, logger=logger, llm=llm)
+                finally:
+                    await llm.release_files()
+                    # Guardamos el estado de la sesión para el resto de workers
+                    if session_manager:
+                        session.schema_version, session.static_tables_version = data_versions()
+                        await session_manager.save(session, logger=logger)
 
     except Exception as e:
         logger.exception(f"{file_name} => Excepción en process_message: {e}")
         raise  # Re-lanzamos para que el endpoint maneje la excepción
-    finally:
-        try:
-            if agent:
-                loop = asyncio.get_event_loop()
-                loop.create_task(agent.close_thread())
-        except Exception as e:
-            logger.exception(f"{file_name} => No se ha podido cerrar el cliente del agente OpenaiLLM: {e}")
-            raise  # Re-lanzamos para que el endpoint maneje la excepción
 
 
-async def handle_agent_response(agent_response, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger):
+def data_versions() -> tuple[str, str]:
+    """
+    Versión actual del esquema y de las tablas estáticas.
+    """
+    return (db.schema_version if db else "", static_tables_store.snapshot.version if static_tables_store else "")
+
+
+@traced("pipeline.handle_agent_response")
+async def handle_agent_response(agent_response, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger, llm: Optional[OpenaiLLM] = None):
     """
     Maneja la respuesta del agente y construye la respuesta final.
     """
@@ -101,6 +190,7 @@ async def handle_agent_response(agent_response, message, db_schema, static_table
             await init_agent()
         if not db:
             await init_database()
+        llm = llm or agent
             
         logger.debug(f"{file_name} => Inicio handle_agent_response...")
         if isinstance(agent_response, dict):
@@ -113,37 +203,44 @@ async def handle_agent_response(agent_response, message, db_schema, static_table
             extra_sql_query = ""
 
         if query:
+            record_branch("sql_query")
             return await run_query_and_build_answer(
                 query, 
                 message, 
                 db_schema, 
                 static_tables=static_tables, 
                 history=history, 
-                logger=logger
+                logger=logger,
+                llm=llm
             )
 
         elif extra_sql_query:
+            record_branch("extra_sql_query")
             return await handle_extra_query(
                 extra_sql_query,
                 message, 
                 db_schema, 
                 static_tables=static_tables, 
                 history=history, 
-                logger=logger
+                logger=logger,
+                llm=llm
             )
 
         elif response:
+            record_branch("direct")
             return response
 
+        record_branch("fallback")
         logger.warning(f"{file_name} => La respuesta del agente no contiene ni query ni respuesta directa.")
-        return await agent.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history) if agent else None
+        return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history) if llm else None
     
     except Exception as e:
         logger.exception(f"{file_name} => Excepción en handle_agent_response: {e}")
         raise  # Re-lanzamos para que el endpoint maneje la excepción
 
 
-async def handle_extra_query(extra_query, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger):
+@traced("pipeline.handle_extra_query")
+async def handle_extra_query(extra_query, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger, llm: Optional[OpenaiLLM] = None):
     """
     Maneja el flujo cuando se necesita una query adicional antes de construir la final.
     """
@@ -152,14 +249,30 @@ async def handle_extra_query(extra_query, message, db_schema, static_tables: dic
             await init_agent()
         if not db:
             await init_database()
+        llm = llm or agent
             
         logger.debug(f"{file_name} => Inicio handle_extra_query...")
         
-        if agent and db:
-            results = await db.query(extra_query, logger=logger)
+        if llm and db:
+            emit_event("sql_generated", sql=extra_query, step="extra_sql_query")
+            check = await cost_gate.check(extra_query, session_id=llm.session.session_id, logger=logger) if cost_gate else None
+            if check and not check.allowed:
+                emit_event("query_rejected", reason=check.reason, step="extra_sql_query")
+                return await llm.build_answer_without_query(
+                    message=message,
+                    db_schema=db_schema,
+                    static_tables=static_tables,
+                    sql_query=extra_query,
+                    history=history,
+                    reason=check.reason
+                )
+            extra_query = check.query if check else extra_query
+            results = await (result_cache.fetch if result_cache else db.stream_query)(extra_query, session_id=llm.session.session_id, logger=logger)
+            emit_event("rows_fetched", rows=results.row_count if results else 0, truncated=bool(results and results.truncated), step="extra_sql_query")
+            set_attributes(rows=results.row_count if results else 0, truncated=bool(results and results.truncated))
             if not results:
                 logger.warning(f"{file_name} => Sin resultados para extra_sql_query.")
-                return await agent.build_answer_without_query(
+                return await llm.build_answer_without_query(
                     message=message, 
                     db_schema=db_schema, 
                     static_tables=static_tables, 
@@ -167,7 +280,7 @@ async def handle_extra_query(extra_query, message, db_schema, static_tables: dic
                     history=history
                 )
 
-            res2 = await agent.get_query_from_previous_data(
+            res2 = await llm.get_query_from_previous_data(
                 message=message,
                 db_schema=db_schema,
                 static_tables=static_tables,
@@ -178,11 +291,11 @@ async def handle_extra_query(extra_query, message, db_schema, static_tables: dic
 
             if not res2:
                 logger.error(f"{file_name} => Respuesta del agente tras extra_query vacía.")
-                return await agent.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
+                return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
 
             try:
-                agent_response2 = json.loads(res2)
-            except json.JSONDecodeError as jde:
+                agent_response2 = loads(res2)
+            except JSONDecodeError as jde:
                 logger.error(f"{file_name} => Error al parsear JSON del segundo paso: {jde}")
                 agent_response2 = res2
 
@@ -200,37 +313,57 @@ async def handle_extra_query(extra_query, message, db_schema, static_tables: dic
                     db_schema, 
                     static_tables=static_tables, 
                     history=history, 
-                    logger=logger
+                    logger=logger,
+                    llm=llm
                 )
             elif response:
                 return response
 
             logger.warning(f"{file_name} => Sin query ni respuesta tras extra_sql_query.")
-            return await agent.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
+            return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, history=history)
         
     except Exception as e:
         logger.exception(f"{file_name} => Excepción en handle_extra_query: {e}")
         raise  # Re-lanzamos para que el endpoint maneje la excepción
 
-async def run_query_and_build_answer(query, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger):
+@traced("pipeline.run_query_and_build_answer")
+async def run_query_and_build_answer(query, message, db_schema, static_tables: dict, history: dict | list[dict], logger=base_logger, llm: Optional[OpenaiLLM] = None, cached: Optional[CachedAnswer] = None):
     """
     Ejecuta una query y construye una respuesta a partir de sus resultados.
+    Si viene de la caché de respuestas y el resultado no ha cambiado se devuelve la respuesta cacheada.
     """
     try:
         if not agent:
             await init_agent()
         if not db:
             await init_database()
+        llm = llm or agent
             
         logger.debug(f"{file_name} => Inicio run_query_and_build_answer...")
         
-        if agent and db:
-            results = await db.query(query, logger=logger)
+        if llm and db:
+            emit_event("sql_generated", sql=query, step="sql_query")
+            check = await cost_gate.check(query, session_id=llm.session.session_id, logger=logger) if cost_gate else None
+            if check and not check.allowed:
+                emit_event("query_rejected", reason=check.reason, step="sql_query")
+                return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, sql_query=query, history=history, reason=check.reason)
+            query = check.query if check else query
+            results = await (result_cache.fetch if result_cache else db.stream_query)(query, session_id=llm.session.session_id, logger=logger)
+            emit_event("rows_fetched", rows=results.row_count if results else 0, truncated=bool(results and results.truncated), step="sql_query")
+            set_attributes(rows=results.row_count if results else 0, truncated=bool(results and results.truncated))
             if results:
-                return await agent.build_answer_from_query(result=results, message=message, db_schema=db_schema, static_tables=static_tables, sql_query=query, history=history)
+                result_hash = results.digest()
+                if cached and cached.result_hash == result_hash:
+                    logger.info(f"{file_name} => Mismo resultado que la respuesta cacheada, se reutiliza.")
+                    return cached.answer
+
+                answer = await llm.build_answer_from_query(result=results, message=message, db_schema=db_schema, static_tables=static_tables, sql_query=query, history=history)
+                if answer_cache and answer:
+                    await answer_cache.store(message, history, *data_versions(), sql_query=query, result_hash=result_hash, answer=answer, logger=logger)
+                return answer
             else:
                 logger.warning(f"{file_name} => Query ejecutada pero sin resultados.")
-                return await agent.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, sql_query=query, history=history)
+                return await llm.build_answer_without_query(message=message, db_schema=db_schema, static_tables=static_tables, sql_query=query, history=history)
             
     except Exception as e:
         logger.exception(f"{file_name} => Excepción en run_query_and_build_answer: {e}")
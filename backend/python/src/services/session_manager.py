@@ -0,0 +1,146 @@
+# backend/python/src/services/session_manager.py
+import os
+import asyncio
+from typing import Dict, Optional, Set
+
+from src.logging.logger import base_logger
+from src.config.config import AGENT_MAX_SESSIONS, AGENT_SESSION_TTL, AGENT_SESSION_SWEEP_INTERVAL
+from src.db.session_store import SessionStore, MemorySessionStore
+from src.models.AgentSession import AgentSession
+from src.services.openai_llm import OpenaiLLM
+from src.services.llm_limiter import background_lane
+from src.utils.cache import TTLCache
+
+""" VARIABLES GLOBALES """
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+"""
+Gestiona el estado del agente por sesión. Las sesiones se mantienen en una caché local (LRU/TTL)
+respaldada por un SessionStore compartido (Redis), de modo que cualquier worker puede continuar
+el thread de una sesión. Las sesiones inactivas más de AGENT_SESSION_TTL segundos se eliminan
+junto con su thread de Assistants. Una sesión con el lock tomado (petición en curso) no se expulsa.
+"""
+class SessionManager():
+    def __init__(self, agent: OpenaiLLM, store: Optional[SessionStore] = None, max_sessions: int = AGENT_MAX_SESSIONS, ttl: int = AGENT_SESSION_TTL, sweep_interval: int = AGENT_SESSION_SWEEP_INTERVAL, logger=base_logger):
+        self.agent = agent
+        self.store: SessionStore = store or MemorySessionStore()
+        self.ttl = ttl
+        self.logger = logger
+        self.sweep_interval = sweep_interval
+        self.sessions = TTLCache(maxsize=max_sessions, ttl=ttl, sliding=True, on_evict=self._on_evict, pinned=lambda _, session: session.lock.locked())
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._cleanup_tasks: Set[asyncio.Task] = set()
+        self._expiring: Dict[str, asyncio.Event] = {} # Sesiones caducadas cuya limpieza aún no ha decidido si borra el estado
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    """
+    Devuelve la sesión asociada al identificador. Si no está en la caché local se recupera del store
+    y, si tampoco existe, se crea una nueva. Si la sesión acaba de caducar se espera a que su limpieza
+    decida si borra el estado, para no recuperar un thread que se está eliminando.
+    """
+    async def get(self, session_id: str, logger=base_logger) -> AgentSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            expiring = self._expiring.get(session_id)
+            if expiring is not None:
+                await expiring.wait()
+            state = await self.store.load(session_id, logger=logger)
+            # Otra petición de la misma sesión pudo crearla mientras se esperaba: se comparte (y con ella su lock)
+            session = self.sessions.get(session_id)
+            if session is None:
+                if state:
+                    session = AgentSession.model_validate({**state, "session_id": session_id})
+                    logger.debug(f"{file_name} => Sesión {session_id} recuperada del store (thread {session.thread_id or '-'}).")
+                else:
+                    session = AgentSession(session_id=session_id)
+                    logger.debug(f"{file_name} => Nueva sesión de agente: {session_id}")
+                self.sessions.set(session_id, session)
+        session.touch()
+        return session
+
+    """
+    Recarga el estado de la sesión desde el store. Debe llamarse con el lock de la sesión tomado:
+    otro worker pudo atender peticiones de la misma sesión (nuevo thread, historial sincronizado)
+    desde que se cargó en la caché local. Si el store no tiene la sesión se conserva el estado local.
+    """
+    async def refresh(self, session: AgentSession, logger=base_logger) -> None:
+        state = await self.store.load(session.session_id, logger=logger)
+        if state:
+            session.apply_state(state)
+        session.touch()
+
+    """
+    Persiste el estado de la sesión para que lo vean el resto de workers.
+    """
+    async def save(self, session: AgentSession, logger=base_logger) -> None:
+        session.touch()
+        await self.store.save(session.session_id, session.to_state(), ttl=self.ttl, logger=logger)
+
+    def start(self) -> None:
+        if self.sweep_interval > 0 and (self._sweep_task is None or self._sweep_task.done()):
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    """
+    Detiene la limpieza periódica. Las sesiones siguen en el store para otros workers o el próximo arranque.
+    """
+    async def stop(self) -> None:
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+        self.sessions.clear()
+        if self._cleanup_tasks:
+            await asyncio.gather(*self._cleanup_tasks, return_exceptions=True)
+        await self.store.close()
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            expired = self.sessions.expire()
+            if expired:
+                self.logger.info(f"{file_name} => {len(expired)} sesiones inactivas expulsadas.")
+
+    def _on_evict(self, session_id, session: AgentSession, reason: str) -> None:
+        self.logger.debug(f"{file_name} => Sesión {session_id} expulsada de la caché local ({reason}).")
+        # Por LRU o al parar solo se libera memoria local: el estado sigue en el store
+        if reason != "expired":
+            return
+        try:
+            loop = asyncio.get_running_loop()
+            self._expiring[session_id] = asyncio.Event()
+            task = loop.create_task(self._cleanup_expired(session))
+            self._cleanup_tasks.add(task)
+            task.add_done_callback(self._cleanup_tasks.discard)
+        except RuntimeError:
+            # Sin event loop no se puede limpiar; el TTL del store y OpenAI acabarán expirando
+            pass
+
+    """
+    Elimina la sesión y su thread salvo que se haya vuelto a crear en este worker o que otro worker
+    la haya usado más recientemente.
+    """
+    async def _cleanup_expired(self, session: AgentSession) -> None:
+        expiring = self._expiring.get(session.session_id)
+        delete_thread = False
+        try:
+            state = await self.store.load(session.session_id, logger=self.logger)
+            if session.session_id in self.sessions or session.lock.locked():
+                return
+            if state and float(state.get("last_used", 0)) > session.last_used:
+                return
+            await self.store.delete(session.session_id, logger=self.logger)
+            delete_thread = bool(session.thread_id)
+        finally:
+            if expiring is not None:
+                if self._expiring.get(session.session_id) is expiring:
+                    self._expiring.pop(session.session_id)
+                expiring.set()
+        if delete_thread:
+            with background_lane():
+                await self.agent.delete_thread(session.thread_id)
@@ -0,0 +1,26 @@
+import pytest
+
+from src.constants.agent_prompts import PROMPTS, STABLE_PREFIX
+from src.utils.format import build_prompt, build_messages
+
+CONTEXT = {"db_schema": "vismel.usuario(id integer, nombre text)", "static_tables": "rol.json\nid\tnombre\n1\ttécnico", "lang": "Spanish", "limit": 500}
+
+@pytest.mark.parametrize("name", sorted(PROMPTS))
+def test_prompts_share_stable_prefix(name):
+    assert PROMPTS[name].startswith(STABLE_PREFIX)
+
+def test_get_response_prompt_contains_schema_and_static_tables():
+    prompt = build_prompt(PROMPTS["get_response"], dict(CONTEXT))
+    assert CONTEXT["db_schema"] in prompt
+    assert CONTEXT["static_tables"] in prompt
+    assert "{db_schema}" not in prompt and "{static_tables}" not in prompt
+
+def test_messages_put_system_prompt_first_and_history_oldest_first():
+    history = [{"user": "segunda", "bot": "respuesta 2"}, {"user": "primera", "bot": "respuesta 1"}] # Más reciente primero
+    messages = build_messages("prompt", "tercera", history=history)
+    assert [(m["role"], m["content"]) for m in messages] == [
+        ("system", "prompt"),
+        ("user", "primera"), ("assistant", "respuesta 1"),
+        ("user", "segunda"), ("assistant", "respuesta 2"),
+        ("user", "tercera"),
+    ]
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+from src.services.answer_cache import AnswerCache, cache_scope
+
+HISTORY = [{"user": "¿Y en Sevilla?", "bot": "12 máquinas"}, {"user": "¿Cuántas máquinas hay en Madrid?", "bot": "30 máquinas"}]
+
+class FakeEmbedder():
+    """
+    Embeddings fijos por pregunta normalizada.
+    """
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    async def __call__(self, text: str):
+        self.calls += 1
+        return self.vectors.get(text)
+
+def store(cache: AnswerCache, message: str, answer: str = "30 máquinas", history=[], schema_version: str = "s1"):
+    return cache.store(message, history, schema_version, "t1", sql_query="SELECT 1", result_hash="r1", answer=answer)
+
+def test_exact_hit_ignores_case_accents_and_punctuation():
+    cache = AnswerCache(enabled=True, ttl=60, semantic=False)
+
+    async def run():
+        await store(cache, "¿Cuántas máquinas hay en Madrid?")
+        entry = await cache.lookup("cuantas maquinas hay en madrid", [], "s1", "t1")
+        assert entry is not None and entry.answer == "30 máquinas" and entry.sql_query == "SELECT 1"
+    asyncio.run(run())
+
+def test_scope_depends_on_versions_and_last_turn():
+    cache = AnswerCache(enabled=True, ttl=60, semantic=False, ignore_history=False)
+
+    async def run():
+        await store(cache, "Total recaudado", history=HISTORY)
+        assert await cache.lookup("Total recaudado", HISTORY, "s2", "t1") is None # Otro esquema
+        assert await cache.lookup("Total recaudado", HISTORY[1:], "s1", "t1") is None # Otra conversación
+        assert await cache.lookup("Total recaudado", HISTORY, "s1", "t1") is not None
+    asyncio.run(run())
+    # Solo cuenta la interacción más reciente (la primera del historial)
+    assert cache_scope(HISTORY, "s1", "t1", ignore_history=False) == cache_scope(HISTORY[:1], "s1", "t1", ignore_history=False)
+    assert cache_scope(HISTORY, "s1", "t1", ignore_history=True) == cache_scope([], "s1", "t1", ignore_history=True)
+
+def test_semantic_hit_and_eviction():
+    pytest.importorskip("numpy")
+    embedder = FakeEmbedder({
+        "cuantas maquinas hay en madrid": [1.0, 0.0],
+        "numero de maquinas en madrid": [0.99, 0.05],
+        "precio medio": [0.0, 1.0],
+    })
+    cache = AnswerCache(embedder=embedder, enabled=True, ttl=60, max_entries=1, semantic=True, min_similarity=0.9)
+
+    async def run():
+        await store(cache, "¿Cuántas máquinas hay en Madrid?")
+        entry = await cache.lookup("Número de máquinas en Madrid", [], "s1", "t1")
+        assert entry is not None and entry.question == "cuantas maquinas hay en madrid"
+        assert await cache.lookup("Precio medio", [], "s1", "t1") is None
+        await store(cache, "Precio medio", answer="12 €") # Expulsa la primera entrada (max_entries=1) y su vector
+        assert len(cache.index) == 1
+        assert await cache.lookup("Número de máquinas en Madrid", [], "s1", "t1") is None
+    asyncio.run(run())
+    assert embedder.calls == 3 # El embedding de la pregunta se reutiliza al guardarla
+
+def test_disabled_or_empty_answers_are_not_stored():
+    async def run():
+        disabled = AnswerCache(enabled=False, ttl=60, semantic=False)
+        await store(disabled, "Total")
+        assert await disabled.lookup("Total", [], "s1", "t1") is None
+        cache = AnswerCache(enabled=True, ttl=60, semantic=False)
+        await store(cache, "Total", answer="")
+        assert len(cache.entries) == 0
+    asyncio.run(run())
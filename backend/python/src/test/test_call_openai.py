@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from src.services.openai_llm import OpenaiLLM
+
+class SlowCompletions():
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def create(self, **kwargs):
+        self.started.set()
+        await asyncio.sleep(10)
+
+def build_llm(completions) -> OpenaiLLM:
+    llm = OpenaiLLM(api_key="test")
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return llm
+
+def test_call_openai_propagates_cancellation():
+    completions = SlowCompletions()
+    llm = build_llm(completions)
+
+    async def run():
+        task = asyncio.create_task(llm._call_openai(messages=[{"role": "user", "content": "hola"}]))
+        await completions.started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import asyncio
+
+from src.db.cost_gate import QueryCostGate
+
+class FakeDatabase():
+    schema_version = "v1"
+
+    def __init__(self, total_cost: float, plan_rows: int):
+        self.plan = {"Plan": {"Total Cost": total_cost, "Plan Rows": plan_rows}}
+
+    async def explain(self, query, session_id="anon", logger=None):
+        return self.plan
+
+def check(total_cost: float, plan_rows: int):
+    gate = QueryCostGate(FakeDatabase(total_cost, plan_rows), enabled=True, max_cost=1000, max_rows=100, action="reject")
+    return asyncio.run(gate.check("SELECT * FROM t"))
+
+def test_allowed_below_limits():
+    result = check(10, 5)
+    assert result.allowed and not result.reason
+
+def test_reason_names_only_cost():
+    result = check(5000, 5)
+    assert not result.allowed
+    assert "Estimated cost 5000 (max 1000) exceeds the allowed limit." in result.reason
+    assert "rows" not in result.reason
+
+def test_reason_names_only_rows():
+    result = check(10, 500)
+    assert "Estimated rows 500 (max 100) exceeds the allowed limit." in result.reason
+    assert "cost" not in result.reason
+
+def test_reason_names_both():
+    result = check(5000, 500)
+    assert "Estimated cost 5000 (max 1000) and estimated rows 500 (max 100) exceed the allowed limits." in result.reason
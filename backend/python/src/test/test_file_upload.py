@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from fakeredis import aioredis
+
+from src.services.file_cache import FileCache, RedisFileCache
+from src.services.openai_llm import OpenaiLLM
+
+class FakeClient():
+    """
+    Imita las llamadas de ficheros y vector store de AsyncOpenAI.
+    """
+    def __init__(self):
+        self.uploads = []
+        self.vector_store = []
+        self.deleted = []
+        self.list_delay = 0
+        self.files = SimpleNamespace(create=self.create_file, delete=self.delete_file, list=self.list_files)
+        self.vector_stores = SimpleNamespace(files=SimpleNamespace(create=self.add_to_vs, delete=self.remove_from_vs, list=self.list_vs))
+
+    async def create_file(self, file, purpose):
+        await asyncio.sleep(0.01)
+        self.uploads.append(file[0])
+        return SimpleNamespace(id=f"file-{len(self.uploads)}")
+
+    async def add_to_vs(self, vector_store_id, file_id):
+        self.vector_store.append(file_id)
+        await asyncio.sleep(0.01)
+
+    async def remove_from_vs(self, vector_store_id, file_id):
+        await asyncio.sleep(0.01)
+        self.vector_store.remove(file_id)
+
+    async def delete_file(self, file_id):
+        self.deleted.append(file_id)
+
+    async def list_files(self, purpose):
+        names = list(self.uploads)
+        await asyncio.sleep(self.list_delay)
+        for i, name in enumerate(names):
+            yield SimpleNamespace(id=f"file-{i + 1}", filename=name)
+
+    async def list_vs(self, vector_store_id, limit):
+        file_ids = list(self.vector_store)
+        await asyncio.sleep(self.list_delay)
+        for file_id in file_ids:
+            yield SimpleNamespace(id=file_id)
+
+def build_llm(tmp_path, client=None, redis=None) -> OpenaiLLM:
+    llm = OpenaiLLM(api_key="test")
+    llm.client = client or FakeClient()
+    llm.file_cache = RedisFileCache(client=redis) if redis else FileCache(path=str(tmp_path / "index.json"))
+    return llm
+
+@pytest.fixture(params=["local", "redis"])
+def build(request, tmp_path):
+    redis = aioredis.FakeRedis(decode_responses=True) if request.param == "redis" else None
+    return lambda: build_llm(tmp_path, redis=redis)
+
+def test_concurrent_identical_uploads_upload_once(build):
+    llm = build()
+    data = [{"id": 1, "name": "a"}]
+
+    async def run():
+        agents = [llm.bind(llm.session) for _ in range(5)]
+        files = await asyncio.gather(*(agent._create_file(data, name="result.json") for agent in agents))
+        assert len(llm.client.uploads) == 1
+        assert len({file.id for file in files}) == 1
+        assert (await llm.file_cache.get(files[0].digest)).refcount == 5
+    asyncio.run(run())
+
+def test_gc_skips_file_reused_meanwhile(build):
+    llm = build()
+
+    async def run():
+        old = await llm._create_file("old", name="a.txt")
+        new = await llm._create_file("new", name="b.txt")
+        await llm.release_files()
+        # Mientras el GC borra el primero, una petición vuelve a usar el segundo
+        gc = asyncio.create_task(llm.collect_garbage_files(grace_seconds=0))
+        await asyncio.sleep(0.005)
+        await llm.bind(llm.session)._create_file("new", name="b.txt")
+        assert await gc == 1
+        assert llm.client.deleted == [old.id]
+        assert (await llm.file_cache.get(new.digest)) is not None
+    asyncio.run(run())
+
+def test_reconcile_keeps_files_uploaded_meanwhile(build):
+    llm = build()
+
+    async def run():
+        old = await llm._create_file("old", name="a.txt")
+        llm.client.vector_store.append("file-unknown") # Fichero del vector store que no está en el índice
+        llm.client.list_delay = 0.02
+        reconcile = asyncio.create_task(llm.reconcile_vector_store())
+        await asyncio.sleep(0.005)
+        new = await llm.bind(llm.session)._create_file("new", name="b.txt") # Subida posterior a los listados
+        await reconcile
+        assert (await llm.file_cache.get(new.digest)).in_vector_store
+        assert (await llm.file_cache.get(old.digest)).in_vector_store
+        assert sorted(llm.client.vector_store) == sorted([old.id, new.id])
+        assert {file.id for file in llm.vector_store_files.files} == {old.id, new.id}
+    asyncio.run(run())
+
+def test_reconcile_waits_for_uploads_in_flight(build):
+    llm = build()
+
+    async def run():
+        # La subida ya está en el vector store cuando termina el listado, pero aún no en el índice
+        upload = asyncio.create_task(llm._create_file("data", name="a.txt"))
+        await asyncio.sleep(0.015)
+        await llm.reconcile_vector_store()
+        file = await upload
+        assert llm.client.vector_store == [file.id]
+        assert (await llm.file_cache.get(file.digest)).in_vector_store
+    asyncio.run(run())
+
+def test_gc_keeps_file_used_by_another_worker(tmp_path):
+    client, redis = FakeClient(), aioredis.FakeRedis(decode_responses=True) # OpenAI y Redis compartidos
+    worker_a = build_llm(tmp_path, client=client, redis=redis)
+    worker_b = build_llm(tmp_path, client=client, redis=redis)
+
+    async def run():
+        file = await worker_a._create_file("data", name="a.txt")
+        await worker_a.release_files()
+        reused = await worker_b._create_file("data", name="a.txt")
+        assert reused.id == file.id and len(client.uploads) == 1
+        assert await worker_a.collect_garbage_files(grace_seconds=0) == 0 # B sigue usándolo
+        await worker_b.release_files()
+        assert await worker_a.collect_garbage_files(grace_seconds=0) == 1
+        assert client.deleted == [file.id]
+        assert await worker_b.file_cache.get(file.digest) is None
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from sqlalchemy.exc import DBAPIError
+
+from src.db import database
+from src.db.database import ConnectionHealthMonitor, Database
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(database.time, "monotonic", clock)
+    return clock
+
+def test_opens_after_threshold(clock):
+    health = ConnectionHealthMonitor(failure_threshold=3, open_seconds=10)
+    health.record_failure("x")
+    health.record_failure("x")
+    assert health.is_available()
+    health.record_failure("x")
+    assert health.state == "open"
+    assert not health.is_available()
+
+def test_half_open_allows_single_probe(clock):
+    health = ConnectionHealthMonitor(failure_threshold=1, open_seconds=10, probe_timeout=5)
+    health.record_failure("x")
+    clock.now += 10
+    assert health.is_available() # Sondeo
+    assert health.state == "half_open"
+    assert not health.is_available() # El resto falla rápido mientras el sondeo está en curso
+    assert not health.is_available()
+
+def test_probe_success_closes(clock):
+    health = ConnectionHealthMonitor(failure_threshold=1, open_seconds=10)
+    health.record_failure("x")
+    clock.now += 10
+    assert health.is_available()
+    health.record_success()
+    assert health.state == "closed"
+    assert health.is_available() and health.is_available()
+
+def test_probe_failure_reopens(clock):
+    health = ConnectionHealthMonitor(failure_threshold=1, open_seconds=10)
+    health.record_failure("x")
+    clock.now += 10
+    assert health.is_available()
+    health.record_failure("y")
+    assert health.state == "open"
+    assert not health.is_available()
+    clock.now += 10
+    assert health.is_available() # Nuevo sondeo tras otro periodo abierto
+
+def test_stalled_probe_is_replaced(clock):
+    health = ConnectionHealthMonitor(failure_threshold=1, open_seconds=10, probe_timeout=5)
+    health.record_failure("x")
+    clock.now += 10
+    assert health.is_available()
+    clock.now += 4
+    assert not health.is_available()
+    clock.now += 1
+    assert health.is_available() # El sondeo anterior no informó a tiempo
+
+def test_failed_query_counts_one_failure():
+    # Puerto cerrado: la conexión se rechaza al instante
+    db = Database(user="u", password="p", host="127.0.0.1", port=1, name="test", schema="vismel")
+
+    async def run():
+        assert await db.stream_query("SELECT 1", lane="internal") is None
+        await db.close()
+    asyncio.run(run())
+    assert db.health.consecutive_failures == 1
+
+def test_disconnect_during_query_counts_one_failure(monkeypatch):
+    db = Database(user="u", password="p", host="127.0.0.1", port=1, name="test", schema="vismel")
+
+    async def checkout(session, pool):
+        pass
+
+    async def fetch_bounded(*args):
+        # Como SQLAlchemy ante una desconexión: avisa a los listeners de handle_error y lanza el error invalidando la conexión
+        original = ConnectionResetError("connection lost")
+        db.engine.sync_engine.dialect.dispatch.handle_error(SimpleNamespace(is_disconnect=True, original_exception=original))
+        raise DBAPIError("SELECT 1", None, original, connection_invalidated=True)
+
+    monkeypatch.setattr(db, "_checkout", checkout)
+    monkeypatch.setattr(db, "_fetch_bounded", fetch_bounded)
+
+    async def run():
+        assert await db.stream_query("SELECT 1", lane="internal") is None
+        await db.close()
+    asyncio.run(run())
+    assert db.health.consecutive_failures == 1
@@ -0,0 +1,132 @@
+import asyncio
+import httpx
+import pytest
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from src.services import llm_limiter
+from src.services.llm_limiter import AdaptiveLimiter, LimitedTransport, background_lane, current_lane
+from src.services.openai_llm import OpenaiLLM
+from src.utils.serialization import dumps
+from src.utils.streaming import PipelineStream, current_stream
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_limiter.time, "monotonic", clock)
+    return clock
+
+def build_limiter(**kwargs) -> AdaptiveLimiter:
+    options = {"minimum": 1, "maximum": 8, "initial": 2, "backoff": 0.5, "latency_target": 0, "rpm_limit": 0, "tpm_limit": 0, "background_share": 0.5}
+    return AdaptiveLimiter(**{**options, **kwargs})
+
+def test_aimd_increases_only_when_limit_is_used(clock):
+    async def run():
+        limiter = build_limiter(initial=2)
+        first = await limiter.acquire()
+        limiter.on_response(first, 200)
+        assert limiter.limit == 2 # Con un solo turno en curso no hay información de que quepan más
+        second = await limiter.acquire()
+        limiter.on_response(first, 200)
+        assert limiter.limit == pytest.approx(2.5) # +1/límite por respuesta: cada ronda completa suma ~1
+        limiter.on_response(second, 200)
+        limiter.on_response(second, 200)
+        assert int(limiter.limit) == 3
+    asyncio.run(run())
+
+def test_decrease_on_rate_limit_with_cooldown(clock):
+    async def run():
+        limiter = build_limiter(initial=8)
+        ticket = await limiter.acquire()
+        limiter.on_response(ticket, 429)
+        limiter.on_response(ticket, 429) # Varios 429 seguidos son una sola señal
+        assert limiter.limit == 4
+        clock.now += llm_limiter.DECREASE_COOLDOWN
+        limiter.on_response(ticket, 429)
+        limiter.release(ticket)
+        assert limiter.limit == 2
+    asyncio.run(run())
+
+def test_latency_above_target_decreases(clock):
+    async def run():
+        limiter = build_limiter(initial=4, latency_target=5)
+        ticket = await limiter.acquire()
+        clock.now += 6
+        limiter.on_response(ticket, 200)
+        assert limiter.limit == 2
+    asyncio.run(run())
+
+def test_interactive_goes_before_background_and_background_is_capped(clock):
+    async def run():
+        limiter = build_limiter(initial=2, background_share=0.5)
+        with background_lane():
+            assert current_lane.get() == "background"
+            running = await limiter.acquire()
+            queued_background = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not queued_background.done() # Solo la mitad de la concurrencia es para segundo plano
+        interactive = await limiter.acquire()
+        assert limiter.in_flight == {"interactive": 1, "background": 1}
+        limiter.release(running)
+        await asyncio.sleep(0)
+        assert queued_background.done()
+        limiter.release(interactive)
+        limiter.release(queued_background.result())
+        assert limiter.total_in_flight == 0
+    asyncio.run(run())
+
+def test_tpm_window_holds_calls_until_tokens_free_up(clock):
+    async def run():
+        limiter = build_limiter(initial=8, tpm_limit=1000)
+        first = await limiter.acquire(tokens=800)
+        limiter.release(first, tokens=900) # El uso real corrige la reserva de la ventana
+        assert limiter._rate_wait(llm_limiter.Ticket("interactive", 200), clock.now) == 60
+        clock.now += 30
+        assert limiter._rate_wait(llm_limiter.Ticket("interactive", 100), clock.now) == 0
+        clock.now += 30
+        assert limiter._rate_wait(llm_limiter.Ticket("interactive", 1000), clock.now) == 0 # El primero sale de la ventana
+    asyncio.run(run())
+
+def test_cancelled_waiter_does_not_take_the_slot(clock):
+    async def run():
+        limiter = build_limiter(initial=1, maximum=1)
+        running = await limiter.acquire()
+        cancelled = asyncio.create_task(limiter.acquire(session="a"))
+        waiting = asyncio.create_task(limiter.acquire(session="b"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        limiter.release(running)
+        ticket = await waiting
+        assert ticket.session == "b" and limiter.total_in_flight == 1
+    asyncio.run(run())
+
+def test_cancelled_stream_releases_the_slot():
+    async def run():
+        limiter = build_limiter(initial=4)
+        sent = asyncio.Event()
+
+        async def body():
+            chunk = {"id": "c1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o", "choices": [{"index": 0, "delta": {"content": "{\"response\": \"Ho"}, "finish_reason": None}]}
+            yield f"data: {dumps(chunk)}\n\n".encode("utf-8")
+            sent.set()
+            await asyncio.sleep(10) # El resto de la respuesta no llega antes de la cancelación
+
+        transport = LimitedTransport(limiter, transport=httpx.MockTransport(lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body())))
+        llm = OpenaiLLM(api_key="test")
+        llm.client = AsyncOpenAI(api_key="test", max_retries=0, http_client=DefaultAsyncHttpxClient(transport=transport))
+        current_stream.set(PipelineStream())
+        task = asyncio.create_task(llm._stream_openai(messages=[{"role": "user", "content": "hola"}]))
+        await sent.wait()
+        assert limiter.total_in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert limiter.total_in_flight == 0
+    asyncio.run(run())
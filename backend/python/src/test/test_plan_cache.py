@@ -0,0 +1,35 @@
+from src.services.plan_cache import PlanCache
+from src.utils.serialization import dumps
+
+def plan(**response) -> str:
+    return dumps({"sql_query": "", "response": "", "extra_sql_query": "", **response})
+
+def test_only_sql_plans_are_cached():
+    cache = PlanCache(enabled=True, ttl=60, verify_rate=0)
+    key = cache.key("¿Cuántas máquinas hay?", [], "s1", "t1")
+    cache.put(key, plan(response="Hola"))
+    assert cache.get(key) is None
+    cache.put(key, plan(sql_query="SELECT count(*) FROM vismel.maquina"))
+    assert cache.get(key) == plan(sql_query="SELECT count(*) FROM vismel.maquina")
+    assert (cache.hits, cache.lookups) == (1, 2)
+
+def test_key_normalizes_question_and_depends_on_versions():
+    cache = PlanCache(enabled=True, ttl=60)
+    assert cache.key("¿Cuántas máquinas hay?", [], "s1", "t1") == cache.key("cuantas maquinas hay", [], "s1", "t1")
+    assert cache.key("cuantas maquinas hay", [], "s1", "t1") != cache.key("cuantas maquinas hay", [], "s1", "t2")
+
+def test_verify_detects_drift():
+    cache = PlanCache(enabled=True, ttl=60)
+    key = cache.key("Total", [], "s1", "t1")
+    cached = plan(sql_query="SELECT sum(amount) FROM vismel.weekly_collection")
+    cache.put(key, cached)
+    # La misma SQL con otro formato no es deriva
+    assert cache.verify(key, cached, plan(sql_query="select SUM(amount)  from vismel.weekly_collection"))
+    assert not cache.verify(key, cached, plan(extra_sql_query="SELECT nombre FROM vismel.usuario"))
+    assert cache.get(key) == plan(extra_sql_query="SELECT nombre FROM vismel.usuario") # El plan nuevo sustituye al cacheado
+
+def test_disabled_cache():
+    cache = PlanCache(enabled=False, ttl=60)
+    key = cache.key("Total", [], "s1", "t1")
+    cache.put(key, plan(sql_query="SELECT 1"))
+    assert cache.get(key) is None
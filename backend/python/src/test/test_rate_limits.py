@@ -0,0 +1,178 @@
+import time
+import asyncio
+from collections import Counter, OrderedDict, deque
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError
+
+from src.services.llm_limiter import AdaptiveLimiter, LimitedTransport, ModelRateLimit, Ticket, TokenBucket, set_session
+from src.services.llm_limiter import parse_duration, estimate_request, MESSAGE_TOKEN_OVERHEAD
+from src.utils.serialization import dumps
+from src.utils.tokens import count_tokens
+
+@pytest.mark.parametrize("value, seconds", [("1s", 1), ("6m0s", 360), ("20ms", 0.02), ("1h2m3.5s", 3723.5), ("2.5", 2.5), (None, None), ("", None), ("soon", None)])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+def test_token_bucket_sync_uses_server_state():
+    bucket = TokenBucket(capacity=10, refill_per_second=1, now=0)
+    bucket.sync(limit=100, remaining=40, reset_seconds=30, pending=10, now=5)
+    assert (bucket.capacity, bucket.rate, bucket.level, bucket.updated) == (100, 2.0, 30, 5)
+    assert bucket.wait_time(50, now=5) == pytest.approx(10) # Faltan 20 fichas a 2 por segundo
+
+def test_token_bucket_sync_without_reset_refills_per_minute():
+    bucket = TokenBucket(capacity=10, refill_per_second=1, now=0)
+    bucket.sync(limit=600, remaining=600, reset_seconds=None, pending=0, now=0)
+    assert bucket.rate == 10
+    bucket.sync(limit=600, remaining=0, reset_seconds=None, pending=0, now=0)
+    assert bucket.rate == 10 and bucket.wait_time(1000, now=0) == pytest.approx(60) # Más que el cubo entero: espera a que se llene
+
+def chat_request(path: str = "/v1/chat/completions", method: str = "POST", **body) -> httpx.Request:
+    return httpx.Request(method, f"https://api.openai.com{path}", content=dumps(body).encode("utf-8") if body else b"")
+
+def test_estimate_chat_request():
+    messages = [{"role": "system", "content": "Eres un asistente."}, {"role": "user", "content": "¿Cuántas máquinas hay en Madrid?"}]
+    model, tokens = estimate_request(chat_request(model="gpt-4o", max_tokens=50, messages=messages))
+    assert model == "gpt-4o"
+    assert tokens == sum(count_tokens(m["content"], "gpt-4o") + MESSAGE_TOKEN_OVERHEAD for m in messages) + 50
+
+def test_estimate_embeddings_and_runs():
+    assert estimate_request(chat_request("/v1/embeddings", model="text-embedding-3-small", input=["hola", "adiós"])) == ("text-embedding-3-small", count_tokens("hola", "text-embedding-3-small") + count_tokens("adiós", "text-embedding-3-small"))
+    model, tokens = estimate_request(chat_request("/v1/threads/t1/runs", model="gpt-4o", max_completion_tokens=100, instructions="Responde en JSON"))
+    assert (model, tokens) == ("gpt-4o", count_tokens("Responde en JSON", "gpt-4o") + 100)
+
+def test_estimate_ignores_calls_without_model_tokens():
+    assert estimate_request(chat_request("/v1/files", model="gpt-4o")) == (None, 0)
+    assert estimate_request(chat_request("/v1/chat/completions", method="GET")) == (None, 0)
+
+def test_next_ticket_round_robin_between_sessions():
+    async def run():
+        limiter = AdaptiveLimiter(minimum=1, maximum=1, initial=1)
+        loop = asyncio.get_running_loop()
+        sessions: "OrderedDict[str, deque]" = OrderedDict()
+        for session, count in (("heavy", 3), ("light", 1), ("other", 1)):
+            for i in range(count):
+                ticket = Ticket("interactive", tokens=0, session=session)
+                ticket.future = loop.create_future()
+                ticket.model = f"{session}-{i}"
+                sessions.setdefault(session, deque()).append(ticket)
+        sessions["other"][0].future.cancel() # Cancelada mientras esperaba: se descarta
+        order = []
+        while sessions:
+            ticket, wait = limiter._next_ticket(sessions, time.monotonic())
+            assert wait == 0
+            order.append(ticket.model)
+        return order
+    assert asyncio.run(run()) == ["heavy-0", "light-0", "heavy-1", "heavy-2"]
+
+def test_next_ticket_waits_for_model_quota():
+    async def run():
+        limiter = AdaptiveLimiter(minimum=1, maximum=1, initial=1)
+        now = time.monotonic()
+        limiter.rate_limits["gpt-4o"] = ModelRateLimit()
+        limiter.rate_limits["gpt-4o"].blocked_until = now + 2 # Pausa tras un 429
+        ticket = Ticket("interactive", tokens=10, model="gpt-4o", session="s1")
+        ticket.future = asyncio.get_running_loop().create_future()
+        sessions = OrderedDict({"s1": deque([ticket])})
+        next_ticket, wait = limiter._next_ticket(sessions, now)
+        assert next_ticket is None and wait == pytest.approx(2)
+        assert limiter._next_ticket(sessions, now + 2) == (ticket, 0.0)
+    asyncio.run(run())
+
+# Script manual (python -m src.test.test_rate_limits): servidor local que imita a OpenAI con límites pequeños (sin llamadas reales ni coste)
+HOST = "127.0.0.1"
+PORT = 8765
+MODEL = "gpt-4o"
+RPM = 60
+TPM = 6000
+SESSIONS = {"heavy": 40, "light-1": 3, "light-2": 3} # Llamadas por sesión
+MAX_TOKENS = 50
+
+app = FastAPI()
+server_state = {"requests": 0, "rejected": 0}
+buckets = {"requests": [RPM, time.monotonic()], "tokens": [TPM, time.monotonic()]}
+
+def refill(kind: str, limit: int) -> float:
+    level, updated = buckets[kind]
+    now = time.monotonic()
+    level = min(limit, level + (now - updated) * limit / 60)
+    buckets[kind] = [level, now]
+    return level
+
+def rate_headers() -> dict:
+    requests, tokens = refill("requests", RPM), refill("tokens", TPM)
+    return {
+        "x-ratelimit-limit-requests": str(RPM),
+        "x-ratelimit-remaining-requests": str(int(requests)),
+        "x-ratelimit-reset-requests": f"{(RPM - requests) * 60 / RPM:.3f}s",
+        "x-ratelimit-limit-tokens": str(TPM),
+        "x-ratelimit-remaining-tokens": str(int(tokens)),
+        "x-ratelimit-reset-tokens": f"{(TPM - tokens) * 60 / TPM:.3f}s",
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    cost = sum(len(m["content"]) for m in body["messages"]) // 4 + body.get("max_tokens", 0)
+    server_state["requests"] += 1
+    if refill("requests", RPM) < 1 or refill("tokens", TPM) < cost:
+        server_state["rejected"] += 1
+        return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, status_code=429, headers={**rate_headers(), "retry-after-ms": "1000"})
+    buckets["requests"][0] -= 1
+    buckets["tokens"][0] -= cost
+    await asyncio.sleep(0.05)
+    return JSONResponse({
+        "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{\"response\": \"ok\"}"}}],
+        "usage": {"prompt_tokens": cost - MAX_TOKENS, "completion_tokens": 10, "total_tokens": cost - MAX_TOKENS + 10},
+    }, headers=rate_headers())
+
+async def main():
+    server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    limiter = AdaptiveLimiter(minimum=1, maximum=16, initial=4)
+    client = AsyncOpenAI(api_key="mock", base_url=f"http://{HOST}:{PORT}/v1", max_retries=3, http_client=DefaultAsyncHttpxClient(transport=LimitedTransport(limiter)))
+    finished = []
+    start = time.monotonic()
+
+    async def call(session_id: str):
+        try:
+            await client.chat.completions.create(model=MODEL, max_tokens=MAX_TOKENS, messages=[{"role": "user", "content": "x" * 400}])
+            finished.append((session_id, time.monotonic() - start))
+        except RateLimitError:
+            finished.append((f"{session_id} (429)", time.monotonic() - start))
+
+    # La sesión "heavy" lanza todas sus llamadas a la vez; las ligeras, una detrás de otra
+    async def session(session_id: str, calls: int):
+        set_session(session_id)
+        if session_id == "heavy":
+            await asyncio.gather(*(call(session_id) for _ in range(calls)))
+        else:
+            await asyncio.sleep(0.5)
+            for _ in range(calls):
+                await call(session_id)
+
+    await asyncio.gather(*(session(session_id, calls) for session_id, calls in SESSIONS.items()))
+    elapsed = time.monotonic() - start
+
+    print(f"Llamadas terminadas: {Counter(session_id for session_id, _ in finished)}")
+    print(f"Peticiones al servidor: {server_state['requests']}, rechazadas con 429: {server_state['rejected']}")
+    print(f"Tiempo total: {elapsed:.1f}s")
+    for session_id in SESSIONS:
+        times = [t for s, t in finished if s == session_id]
+        if times:
+            print(f"  {session_id}: última llamada a los {max(times):.1f}s")
+    print(f"Cupo local del modelo: {vars(limiter.rate_limits[MODEL].tokens) if MODEL in limiter.rate_limits else None}")
+
+    await client.close()
+    server.should_exit = True
+    await server_task
+
+if __name__ == "__main__":
+    asyncio.run(main())
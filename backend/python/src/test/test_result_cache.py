@@ -0,0 +1,33 @@
+import uuid
+import asyncio
+import datetime
+import pytest
+from decimal import Decimal
+
+from src.db.result_cache import QueryResultCache
+from src.db.kv_store import RedisKVStore
+from src.models.QueryResult import QueryResult
+from src.utils.serialization import dumps, loads, encode_typed, decode_typed
+
+ROW = (1, "Madrid", Decimal("1234.50"), datetime.date(2024, 3, 1), datetime.datetime(2024, 3, 1, 10, 30, tzinfo=datetime.timezone.utc), datetime.time(8, 15), datetime.timedelta(hours=2), uuid.UUID(int=7), b"\x00\xff", None, True, 2.5)
+
+def test_typed_codec_roundtrip():
+    assert tuple(decode_typed(loads(dumps(encode_typed(ROW))))) == ROW
+    assert [type(value) for value in decode_typed(loads(dumps(encode_typed(ROW))))] == [type(value) for value in ROW]
+
+def test_typed_codec_leaves_plain_dicts():
+    value = {"__type__": "decimal", "value": "1", "other": 2}
+    assert decode_typed(loads(dumps(encode_typed(value)))) == value
+
+def test_redis_result_cache_keeps_types():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisKVStore(prefix="result:", client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+    cache = QueryResultCache(db=None, enabled=True, ttl=60, store=store)
+    result = QueryResult(columns=["id", "city", "amount", "day", "at", "hour", "duration", "ref", "raw", "empty", "flag", "ratio"], rows=[ROW, ROW], truncated=True, truncated_reason="max_rows")
+
+    async def run():
+        await cache._set("key", result, ttl=60)
+        return await cache._get("key")
+    cached = asyncio.run(run())
+    assert cached == result
+    assert isinstance(cached.rows[0][2], Decimal) and isinstance(cached.rows[0][3], datetime.date)
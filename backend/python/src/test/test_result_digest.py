@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+from decimal import Decimal
+
+from src.models.QueryResult import QueryResult
+from src.services.openai_llm import OpenaiLLM
+from src.utils.result_digest import should_summarize, summarize, digest_prompt
+from src.utils.serialization import dumps
+
+def sales(rows: int = 300) -> QueryResult:
+    cities = ["Madrid", "Sevilla", "Bilbao"]
+    return QueryResult(
+        columns=["city", "day", "amount", "units"],
+        rows=[(cities[i % 3], datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 10), Decimal("1.50"), i) for i in range(rows)],
+    )
+
+def test_should_summarize_only_large_results():
+    assert should_summarize(sales(300), enabled=True, min_rows=200)
+    assert not should_summarize(sales(100), enabled=True, min_rows=200)
+    assert not should_summarize(sales(300), enabled=False)
+
+def test_summary_stats_cover_all_rows():
+    digest = summarize(sales(300), sample_rows=10, top_k=2, max_groups=5)
+    assert digest["row_count"] == 300
+    assert digest["columns"]["amount"] == {"type": "number", "nulls": 0, "distinct": 1, "min": Decimal("1.50"), "max": Decimal("1.50"), "sum": Decimal("450.00"), "mean": 1.5}
+    assert digest["columns"]["units"]["sum"] == sum(range(300))
+    assert digest["columns"]["day"]["min"] == datetime.date(2024, 1, 1)
+    assert [group["count"] for group in digest["groups"]["city"]] == [100, 100, 100]
+    assert sum(group["sum_amount"] for group in digest["groups"]["city"]) == Decimal("450.00")
+    assert len(digest["sample"]) == 10 and digest["sample"][:5] == sales(300).rows[:5]
+
+def test_digest_prompt_contains_stats_and_sample():
+    prompt = digest_prompt(sales(300), sample_rows=10)
+    assert prompt.startswith("<digest>\n")
+    assert '<sample rows="10" of="300">' in prompt
+    assert dumps({"type": "number"})[1:-1] in prompt
+
+def test_only_final_pass_is_streamed(monkeypatch):
+    llm = OpenaiLLM(api_key="test")
+    calls = []
+    replies = iter(['{"response": "", "need_full_result": true}', '{"response": "Listado completo"}'])
+
+    async def process_prompts(parts):
+        return {name: str(data) for name, data in parts}
+
+    async def call_openai(messages, stream_answer=False):
+        calls.append((stream_answer, "<sample rows=" in messages[0]["content"]))
+        return next(replies)
+
+    monkeypatch.setattr(llm, "_process_prompts", process_prompts)
+    monkeypatch.setattr(llm, "_call_openai", call_openai)
+    monkeypatch.setattr("src.services.openai_llm.should_summarize", lambda result: True)
+    response = asyncio.run(llm.build_answer_from_query(result=sales(300), message="Lista todas las ventas"))
+    assert response == "Listado completo"
+    assert calls == [(False, True), (True, False)]
+
+def test_answer_without_query_is_streamed(monkeypatch):
+    llm = OpenaiLLM(api_key="test")
+    calls = []
+
+    async def process_prompts(parts):
+        return {name: str(data) for name, data in parts}
+
+    async def call_openai(messages, stream_answer=False):
+        calls.append(stream_answer)
+        return '{"response": "La base de datos no está disponible."}'
+
+    monkeypatch.setattr(llm, "_process_prompts", process_prompts)
+    monkeypatch.setattr(llm, "_call_openai", call_openai)
+    response = asyncio.run(llm.build_answer_without_query(message="¿Cuántas máquinas hay?", reason="DB unavailable"))
+    assert response == "La base de datos no está disponible."
+    assert calls == [True]
@@ -0,0 +1,44 @@
+import datetime
+import pytest
+from decimal import Decimal
+
+from src.models.QueryResult import QueryResult
+from src.utils.result_format import serialize_table, to_table, upload_name, records_size
+from src.utils.serialization import loads
+
+RESULT = QueryResult(
+    columns=["id", "nombre", "importe", "dia", "activo", "nota"],
+    rows=[(1, "Juan", Decimal("1E+2"), datetime.date(2024, 3, 1), True, None), (2, "Ana\tMaría", Decimal("0.50"), datetime.date(2024, 3, 2), False, "a|b")],
+)
+
+def test_tsv_header_once_and_compact_values():
+    assert serialize_table(RESULT, "tsv") == "id\tnombre\timporte\tdia\tactivo\tnota\n1\tJuan\t100\t2024-03-01\ttrue\t\n2\tAna María\t0.50\t2024-03-02\tfalse\ta|b"
+
+def test_csv_and_markdown_escape_separators():
+    assert serialize_table(RESULT, "csv").splitlines()[2] == "2,Ana\tMaría,0.50,2024-03-02,false,a|b"
+    assert serialize_table(RESULT, "markdown").splitlines()[1:3] == ["|---|---|---|---|---|---|", "| 1 | Juan | 100 | 2024-03-01 | true |  |"]
+    assert serialize_table(RESULT, "markdown").endswith("| a\\|b |")
+
+def test_json_formats_keep_all_values():
+    columnar = loads(serialize_table(RESULT, "columnar"))
+    assert columnar["columns"] == RESULT.columns and columnar["rows"][0] == [1, "Juan", "100", "2024-03-01", True, None]
+    assert loads(serialize_table(RESULT, "records"))[1] == {"id": 2, "nombre": "Ana\tMaría", "importe": "0.50", "dia": "2024-03-02", "activo": False, "nota": "a|b"}
+
+def test_truncated_result_is_flagged():
+    truncated = RESULT.model_copy(update={"truncated": True, "truncated_reason": "max_rows"})
+    assert serialize_table(truncated, "tsv").startswith("# truncated: showing the first 2 rows (max_rows)\nid\t")
+
+def test_records_input_uses_union_of_keys():
+    columns, rows, note = to_table([{"a": 1}, {"b": 2, "a": 3}])
+    assert (columns, rows, note) == (["a", "b"], [(1, None), (3, 2)], None)
+    assert serialize_table({"a": 1}, "unknown") == "a\n1" # Formato desconocido: tsv
+
+@pytest.mark.parametrize("fmt, name", [("tsv", "result.txt"), ("markdown", "result.md"), ("columnar", "result.json")])
+def test_upload_name(fmt, name):
+    assert upload_name("result.json", fmt) == name
+
+def test_tsv_is_smaller_than_records():
+    rows = QueryResult(columns=["identificador", "nombre_completo"], rows=[(i, f"Usuario {i}") for i in range(100)])
+    serialized = serialize_table(rows, "tsv")
+    assert records_size(rows, serialized) > len(serialized)
+    assert len(serialize_table(rows, "records")) > len(serialized)
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+
+from src.db import database
+from src.db.database import Database
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakeSchemaSource():
+    """
+    Sustituye las consultas del esquema y su huella a la DB.
+    """
+    def __init__(self):
+        self.schema = "vismel.usuario(id integer, nombre text)"
+        self.fingerprint = "f1"
+        self.loads = 0
+        self.fingerprints = 0
+
+    async def load(self, logger=None):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return self.schema
+
+    async def get_fingerprint(self, logger=None):
+        self.fingerprints += 1
+        return self.fingerprint
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(database.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture
+def db(monkeypatch):
+    db = Database(user="u", password="p", host="localhost", port=5432, name="test", schema="vismel")
+    db.schema_cache_ttl = 100
+    db.schema_fingerprint_interval = 10
+    db.source = FakeSchemaSource()
+    monkeypatch.setattr(db, "_load_schema", db.source.load)
+    monkeypatch.setattr(db, "_get_schema_fingerprint", db.source.get_fingerprint)
+    return db
+
+def test_schema_is_cached_within_ttl(db, clock):
+    async def run():
+        first = await db.get_schema()
+        version = db.schema_version
+        clock.now += 5
+        assert await db.get_schema() == first
+        assert db.schema_version == version and version
+    asyncio.run(run())
+    assert db.source.loads == 1
+
+def test_concurrent_requests_load_once(db, clock):
+    async def run():
+        return await asyncio.gather(*(db.get_schema() for _ in range(5)))
+    assert len(set(asyncio.run(run()))) == 1
+    assert db.source.loads == 1
+
+def test_schema_change_invalidates_cache(db, clock):
+    async def run():
+        await db.get_schema()
+        db.source.schema = "vismel.usuario(id integer, nombre text, rol text)"
+        db.source.fingerprint = "f2"
+        clock.now += 5
+        assert "rol" not in await db.get_schema() # La huella solo se consulta cada schema_fingerprint_interval
+        clock.now += 10
+        assert "rol" in await db.get_schema()
+    asyncio.run(run())
+    assert db.source.loads == 2
+
+def test_expired_schema_is_reloaded_and_kept_on_error(db, clock):
+    async def run():
+        first = await db.get_schema()
+        clock.now += 100
+        db.source.schema = None # La DB no responde: se reutiliza la versión cacheada
+        assert await db.get_schema() == first
+        db.invalidate_schema_cache()
+        assert db.schema_version == ""
+    asyncio.run(run())
+    assert db.source.loads == 2
@@ -0,0 +1,81 @@
+import asyncio
+
+from src.db.session_store import MemorySessionStore
+from src.services.session_manager import SessionManager
+from src.utils import cache
+
+class FakeAgent():
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_thread(self, thread_id: str):
+        await asyncio.sleep(0)
+        self.deleted.append(thread_id)
+
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_locked_session_is_not_evicted(monkeypatch):
+    now = clock(monkeypatch)
+
+    async def run():
+        manager = SessionManager(FakeAgent(), store=MemorySessionStore(), max_sessions=1, ttl=10, sweep_interval=0)
+        busy = await manager.get("busy")
+        async with busy.lock:
+            other = await manager.get("other") # Supera maxsize pero la sesión ocupada no se expulsa
+            assert "busy" in manager.sessions
+            now[0] += 20
+            assert manager.sessions.expire() == ["other"]
+            assert await manager.get("busy") is busy
+        assert other is not busy
+    asyncio.run(run())
+
+def test_expired_session_is_not_reloaded_during_cleanup(monkeypatch):
+    now = clock(monkeypatch)
+
+    async def run():
+        agent = FakeAgent()
+        store = MemorySessionStore()
+        manager = SessionManager(agent, store=store, ttl=10, sweep_interval=0)
+        session = await manager.get("s1")
+        session.thread_id = "thread-old"
+        await manager.save(session)
+        now[0] += 20
+        again = await manager.get("s1") # Caduca aquí: no debe recuperar el thread que se está borrando
+        assert again is not session
+        assert again.thread_id == ""
+        await asyncio.gather(*manager._cleanup_tasks)
+        assert agent.deleted == ["thread-old"]
+    asyncio.run(run())
+
+def test_concurrent_gets_share_the_session():
+    async def run():
+        manager = SessionManager(FakeAgent(), store=MemorySessionStore(), sweep_interval=0)
+        first, second = await asyncio.gather(manager.get("s1"), manager.get("s1"))
+        assert first is second
+    asyncio.run(run())
+
+def test_refresh_sees_changes_from_other_workers():
+    async def run():
+        store = MemorySessionStore() # Compartido, como Redis entre workers
+        worker_a = SessionManager(FakeAgent(), store=store, sweep_interval=0)
+        worker_b = SessionManager(FakeAgent(), store=store, sweep_interval=0)
+        session_a = await worker_a.get("s1")
+        session_a.thread_id = "thread-a"
+        await worker_a.save(session_a)
+
+        session_b = await worker_b.get("s1")
+        async with session_b.lock:
+            await worker_b.refresh(session_b)
+            session_b.thread_id = "thread-b"
+            session_b.history_hashes = ["h1"]
+            await worker_b.save(session_b)
+
+        session_a = await worker_a.get("s1") # Sigue en la caché local de A con el estado antiguo
+        async with session_a.lock:
+            await worker_a.refresh(session_a)
+            assert session_a.thread_id == "thread-b"
+            assert session_a.history_hashes == ["h1"]
+    asyncio.run(run())
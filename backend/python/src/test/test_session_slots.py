@@ -0,0 +1,48 @@
+import asyncio
+
+from src.db.database import Database
+from src.utils import cache
+from src.utils.cache import TTLCache
+
+def build_db(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    db = Database(user="u", password="p", host="localhost", port=5432, name="test", schema="vismel")
+    db.session_concurrency = 1
+    db._session_semaphores = TTLCache(maxsize=1, ttl=10, sliding=True, pinned=lambda session_id, _: session_id in db._session_users)
+    return db, now
+
+def test_held_semaphore_is_not_evicted(monkeypatch):
+    db, now = build_db(monkeypatch)
+    entered = []
+
+    async def query(session_id: str):
+        async with db._session_slot(session_id):
+            entered.append(session_id)
+
+    async def run():
+        async with db._session_slot("busy"):
+            await query("other") # Supera maxsize: la sesión ocupada no se expulsa
+            now[0] += 20
+            db._session_semaphores.expire()
+            assert "busy" in db._session_semaphores
+            # Una segunda query de la misma sesión espera al mismo semáforo
+            second = asyncio.create_task(query("busy"))
+            for _ in range(3):
+                await asyncio.sleep(0)
+            assert entered == ["other"]
+        await second
+        assert entered == ["other", "busy"]
+        assert db._session_users == {}
+    asyncio.run(run())
+
+def test_idle_semaphore_expires(monkeypatch):
+    db, now = build_db(monkeypatch)
+
+    async def run():
+        async with db._session_slot("s1"):
+            pass
+        assert db._session_users == {}
+        now[0] += 20
+        assert db._session_semaphores.expire() == ["s1"]
+    asyncio.run(run())
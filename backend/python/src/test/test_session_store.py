@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+
+from src.db import session_store
+from src.db.session_store import SessionStore, MemorySessionStore, RedisSessionStore
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+def test_memory_store_roundtrip_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    store = MemorySessionStore()
+
+    async def run():
+        await store.save("s1", {"thread_id": "t1"}, ttl=10)
+        assert await store.load("s1") == {"thread_id": "t1"}
+        now[0] += 10
+        assert await store.load("s1") is None
+        await store.save("s2", {"thread_id": "t2"})
+        await store.delete("s2")
+        assert await store.load("s2") is None
+    asyncio.run(run())
+
+def test_redis_store_roundtrip():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        store = RedisSessionStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True), prefix="test:")
+        await store.save("s1", {"thread_id": "t1", "synced_turns": 3}, ttl=60)
+        assert await store.load("s1") == {"thread_id": "t1", "synced_turns": 3}
+        await store.delete("s1")
+        assert await store.load("s1") is None
+        await store.close()
+    asyncio.run(run())
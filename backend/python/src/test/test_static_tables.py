@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+
+from src.db.static_tables import StaticTablesStore
+
+class FakeDatabase():
+    def __init__(self):
+        self.tables = {"rol": [{"id": 1, "nombre": "técnico"}], "familia": [{"id": 1, "nombre": "grúas"}]}
+        self.fingerprint = {"rol": "1:100", "familia": "1:200"}
+        self.loads = 0
+
+    async def get_static_tables_fingerprint(self, tables, logger=None):
+        return dict(self.fingerprint) if self.fingerprint is not None else None
+
+    async def get_static_tables(self, tables, logger=None):
+        # Como Database.get_static_tables: las tablas cuya consulta falla vienen con None
+        self.loads += 1
+        return {name: list(self.tables[name]) if self.tables is not None and self.tables.get(name) is not None else None for name in tables}
+
+def build_store() -> StaticTablesStore:
+    return StaticTablesStore(FakeDatabase(), tables=["rol", "familia"], refresh_interval=0)
+
+def test_snapshot_is_loaded_once_and_immutable():
+    store = build_store()
+
+    async def run():
+        snapshot = await store.get_snapshot()
+        assert list(snapshot.tables) == ["familia", "rol"]
+        assert await store.get_snapshot() is snapshot
+        with pytest.raises(AttributeError):
+            snapshot.version = "x"
+        with pytest.raises(TypeError):
+            snapshot.tables["rol"] = ()
+    asyncio.run(run())
+    assert store.db.loads == 1
+
+def test_refresh_publishes_only_on_change():
+    store = build_store()
+
+    async def run():
+        await store.start()
+        version = store.snapshot.version
+        assert not await store.refresh() # Misma huella: no se consultan las tablas
+        assert store.db.loads == 1
+        store.db.tables["rol"].append({"id": 2, "nombre": "comercial"})
+        store.db.fingerprint["rol"] = "2:101"
+        assert await store.refresh()
+        assert store.snapshot.version != version
+        assert len(store.snapshot.tables["rol"]) == 2
+    asyncio.run(run())
+
+def test_failed_load_keeps_previous_snapshot():
+    store = build_store()
+
+    async def run():
+        await store.start()
+        snapshot = store.snapshot
+        store.db.tables = None
+        store.db.fingerprint = None
+        assert not await store.refresh()
+        assert store.snapshot is snapshot
+    asyncio.run(run())
+
+def test_partial_failure_keeps_previous_snapshot():
+    store = build_store()
+
+    async def run():
+        await store.start()
+        snapshot = store.snapshot
+        store.db.tables["rol"] = None
+        store.db.fingerprint["familia"] = "2:201"
+        assert not await store.refresh()
+        assert store.snapshot is snapshot and len(snapshot.tables["rol"]) == 1
+    asyncio.run(run())
+
+def test_db_down_at_boot_publishes_nothing():
+    store = build_store()
+    store.db.tables = None
+    store.db.fingerprint = None
+
+    async def run():
+        await store.start()
+        assert store.snapshot.is_empty()
+        store.db.tables = {"rol": [], "familia": [{"id": 1, "nombre": "grúas"}]} # Una tabla vacía sí es una carga válida
+        snapshot = await store.get_snapshot()
+        assert not snapshot.is_empty() and snapshot.tables["rol"] == ()
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.services.openai_llm import OpenaiLLM
+from src.utils import tokens
+from src.utils.tokens import pack_parts, data_token_budget, context_window, count_tokens
+
+def test_pack_parts_by_priority_then_size():
+    parts = [("result.json", 1, 600), ("db_schema.txt", 0, 300), ("familia.json", 2, 50), ("rol.json", 2, 20)]
+    assert pack_parts(parts, budget=1000) == (["db_schema.txt", "result.json", "rol.json", "familia.json"], [])
+    # Lo que no cabe va a fichero, pero las partes siguientes más pequeñas aún pueden entrar
+    assert pack_parts(parts, budget=350) == (["db_schema.txt", "rol.json"], ["result.json", "familia.json"])
+    assert pack_parts(parts, budget=0) == ([], ["db_schema.txt", "result.json", "rol.json", "familia.json"])
+
+def test_data_token_budget_respects_context_window():
+    assert context_window("gpt-4o-mini") == 128000
+    assert context_window("gpt-4.1-mini") == 1047576
+    assert context_window("unknown-model") == tokens.DEFAULT_CONTEXT_WINDOW
+    assert data_token_budget("gpt-4o", budget=50000, reserved=8000) == 50000
+    assert data_token_budget("gpt-3.5-turbo", budget=50000, reserved=8000) == 16385 - 8000
+
+def test_count_tokens_without_tokenizer(monkeypatch):
+    monkeypatch.setitem(tokens._encodings, "no-tokenizer", None)
+    assert count_tokens("x" * 10, model="no-tokenizer") == 3 # Redondeo hacia arriba de 10 / CHARS_PER_TOKEN
+
+def test_process_prompts_sends_overflow_to_files(monkeypatch):
+    llm = OpenaiLLM(api_key="test")
+    uploaded = []
+
+    async def create_file(data, name):
+        uploaded.append(name)
+        return SimpleNamespace(id=f"file-{len(uploaded)}")
+
+    monkeypatch.setattr(llm, "_create_file", create_file)
+    result = [{"id": i, "city": "Madrid"} for i in range(200)]
+    parts = [("db_schema.txt", "vismel.usuario(id integer)"), ("result.json", result), ("rol.json", [{"id": 1, "nombre": "técnico"}])]
+    budget = count_tokens("vismel.usuario(id integer)") + 100
+    processed = asyncio.run(llm._process_prompts(parts, budget=budget))
+    assert list(processed) == ["db_schema.txt", "result.json", "rol.json"]
+    assert processed["db_schema.txt"] == "vismel.usuario(id integer)"
+    assert processed["result.json"] == "In the file with id: file-1"
+    assert not processed["rol.json"].startswith("In the file")
+    assert len(uploaded) == 1 and uploaded[0] != "result.json" # Con la extensión de su formato
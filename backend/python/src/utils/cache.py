@@ -0,0 +1,91 @@
+# backend/python/src/utils/cache.py
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+"""
+Caché en memoria con política LRU (tamaño máximo) y TTL.
+Si sliding=True el TTL se renueva en cada acceso (expiración por inactividad).
+on_evict(key, value, reason) se llama cuando una entrada sale de la caché por "lru", "expired" o "deleted".
+pinned(key, value) indica entradas en uso que no se expulsan por LRU ni caducan mientras lo estén
+(la caché puede superar maxsize temporalmente si todas lo están).
+"""
+class TTLCache():
+    def __init__(self, maxsize: int = 1024, ttl: float = 0, sliding: bool = False, on_evict: Optional[Callable[[Hashable, Any, str], None]] = None, pinned: Optional[Callable[[Hashable, Any], bool]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self.on_evict = on_evict
+        self.pinned = pinned
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and not self._is_stale(key, item)
+
+    def _is_expired(self, expires_at: float) -> bool:
+        return expires_at > 0 and time.monotonic() >= expires_at
+
+    def _is_pinned(self, key: Hashable, value: Any) -> bool:
+        return self.pinned is not None and self.pinned(key, value)
+
+    def _is_stale(self, key: Hashable, item: Tuple[Any, float]) -> bool:
+        return self._is_expired(item[1]) and not self._is_pinned(key, item[0])
+
+    def _expires_at(self, ttl: Optional[float] = None) -> float:
+        ttl = self.ttl if ttl is None else ttl
+        return time.monotonic() + ttl if ttl and ttl > 0 else 0.0
+
+    def _evict(self, key: Hashable, reason: str) -> None:
+        value, _ = self._data.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value, reason)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, _ = item
+        if self._is_stale(key, item):
+            self._evict(key, "expired")
+            return default
+        self._data.move_to_end(key)
+        if self.sliding:
+            self._data[key] = (value, self._expires_at())
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._data:
+            self._data.pop(key)
+        self._data[key] = (value, self._expires_at(ttl))
+        while self.maxsize > 0 and len(self._data) > self.maxsize:
+            oldest = next((k for k, (v, _) in self._data.items() if k != key and not self._is_pinned(k, v)), None)
+            if oldest is None:
+                break
+            self._evict(oldest, "lru")
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            return default
+        value, _ = self._data[key]
+        self._evict(key, "deleted")
+        return value
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self._evict(key, "deleted")
+
+    """
+    Elimina las entradas caducadas y devuelve sus claves.
+    """
+    def expire(self) -> List[Hashable]:
+        expired = [key for key, item in self._data.items() if self._is_stale(key, item)]
+        for key in expired:
+            self._evict(key, "expired")
+        return expired
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        return [(key, item[0]) for key, item in self._data.items() if not self._is_stale(key, item)]
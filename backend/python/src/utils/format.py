@@ -1,14 +1,34 @@
 # backend/python/src/utils/format.py
+import re
+import hashlib
+import unicodedata
 from typing import Any
 from datetime import datetime
 
 def build_prompt(template: str, context: dict[str, Any]) -> str:
-        context["current_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Precisión de día: el prompt no cambia en cada petición
+        context["current_date"] = datetime.now().strftime("%Y-%m-%d")
         return template.format(**context)
     
+def normalize_history(history) -> list[dict[str, Any]]:
+        # El historial puede llegar como una única interacción (dict) o como lista de interacciones
+        if isinstance(history, dict):
+            return [history] if history else []
+        return [h for h in history if isinstance(h, dict)] if history else []
+
+def hash_text(*parts: str) -> str:
+        return hashlib.sha256("\x00".join(p or "" for p in parts).encode("utf-8")).hexdigest()[:16]
+
+def normalize_question(text: str) -> str:
+        # Minúsculas, sin tildes ni signos de puntuación y con los espacios colapsados
+        text = unicodedata.normalize("NFKD", (text or "").lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()
+
 def format_history_for_openai(history) -> list[dict[str, Any]]:
+        # El historial llega de la más reciente a la más antigua; los mensajes van en orden cronológico
         messages = []
-        for interaction in history:
+        for interaction in reversed(normalize_history(history)):
             user_msg = interaction.get("user")
             bot_msg = interaction.get("bot", interaction.get("assistant"))
             if user_msg:
@@ -18,10 +38,9 @@ def format_history_for_openai(history) -> list[dict[str, Any]]:
         return messages
     
 def build_messages(prompt: str, message: str, history: dict | list[dict] = []) -> list[dict[str, Any]]:
-    messages:  list[dict[str, Any]] = []
+    # El prompt de sistema va primero: su prefijo estable se comparte entre peticiones (prompt caching)
+    messages:  list[dict[str, Any]] = [{"role": "system", "content": prompt}]
     if history: # Añadimos el historial si existe
         messages.extend(format_history_for_openai(history)) 
-    # Para Assistants solo se permite el rol "user" o "assistant"
-    messages.append({"role": "system", "content": prompt})
     messages.append({"role": "user", "content": message})
     return messages
\ No newline at end of file
@@ -0,0 +1,135 @@
+# backend/python/src/utils/metrics.py
+import threading
+from typing import Callable, Dict, List, Literal, Tuple
+
+""" VARIABLES GLOBALES """
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+""""""""""""""""""""""""""
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    labels = key + extra
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}" if labels else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+"""
+Histograma acumulado (estilo Prometheus) de una serie concreta.
+"""
+class Histogram():
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+"""
+Registro de métricas en memoria del proceso (contadores, gauges e histogramas con etiquetas).
+"""
+class MetricsRegistry():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.descriptions: Dict[str, Tuple[Literal["counter", "gauge", "histogram"], str]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+        self.collectors: Dict[str, Callable[[], None]] = {}
+
+    def describe(self, name: str, kind: Literal["counter", "gauge", "histogram"], help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.descriptions[name] = (kind, help)
+        if kind == "histogram":
+            self.buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def add(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.gauges.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram(self.buckets.get(name, DEFAULT_BUCKETS))
+            series[key].observe(value)
+
+    """
+    Registra una función que actualiza gauges justo antes de exportar (estado del pool, colas...).
+    Se identifica por nombre para que una instancia nueva sustituya a la anterior.
+    """
+    def register_collector(self, name: str, collector: Callable[[], None]):
+        self.collectors[name] = collector
+
+    def unregister_collector(self, name: str):
+        self.collectors.pop(name, None)
+
+    """
+    Exporta todas las series en el formato de texto de Prometheus.
+    """
+    def render(self) -> str:
+        for collector in list(self.collectors.values()):
+            try:
+                collector()
+            except Exception:
+                pass # Un collector roto no debe impedir exportar el resto de métricas
+        lines: List[str] = []
+        with self._lock:
+            families = [(name, "counter", series) for name, series in self.counters.items()]
+            families += [(name, "gauge", series) for name, series in self.gauges.items()]
+            for name, kind, series in sorted(families, key=lambda family: family[0]):
+                self._render_header(lines, name, kind)
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, series in sorted(self.histograms.items()):
+                self._render_header(lines, name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(float(bound))),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def _render_header(self, lines: List[str], name: str, kind: str):
+        help = self.descriptions.get(name, (kind, ""))[1]
+        if help:
+            lines.append(f"# HELP {name} {_escape(help)}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def get(self, name: str, **labels) -> float:
+        key = _label_key(labels)
+        if name in self.counters:
+            return self.counters[name].get(key, 0)
+        return self.gauges.get(name, {}).get(key, 0)
+
+metrics = MetricsRegistry()
@@ -1,12 +1,21 @@
 # backend/python/src/utils/response.py
-from typing import Any
+from typing import Any, Dict, Optional
 from fastapi.responses import JSONResponse
 
 from src.models.Response import APIResponse
+from src.utils.serialization import dumps_bytes
 
-def success_response(message: str = "", data: Any = None, status_code: int = 200):
-    return JSONResponse(
+"""
+JSONResponse que serializa con orjson (o json si no está instalado) y entiende Decimal y fechas de la DB.
+"""
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+def success_response(message: str = "", data: Any = None, status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+    return ORJSONResponse(
         status_code=status_code,
+        headers=headers,
         content=APIResponse(
             status="success",
             message=message,
@@ -14,9 +23,10 @@ def success_response(message: str = "", data: Any = None, status_code: int = 200
         ).model_dump()
     )
 
-def error_response(message: str = "", errors: Any = None, status_code: int = 400):
-    return JSONResponse(
+def error_response(message: str = "", errors: Any = None, status_code: int = 400, headers: Optional[Dict[str, str]] = None):
+    return ORJSONResponse(
         status_code=status_code,
+        headers=headers,
         content=APIResponse(
             status="error",
             message=message,
@@ -0,0 +1,113 @@
+# backend/python/src/utils/result_digest.py
+import os
+import datetime
+from decimal import Decimal
+from collections import Counter
+from typing import Any, Dict, List
+
+from src.config.config import RESULT_DIGEST, RESULT_DIGEST_MIN_ROWS, RESULT_DIGEST_SAMPLE_ROWS, RESULT_DIGEST_TOP_K, RESULT_DIGEST_MAX_GROUPS
+from src.models.QueryResult import QueryResult
+from src.utils.result_format import serialize_table
+from src.utils.serialization import dumps
+
+""" VARIABLES GLOBALES """
+MAX_GROUP_COLUMNS = 3 # Columnas por las que se agrupa como mucho
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+def should_summarize(result: QueryResult, enabled: bool = RESULT_DIGEST, min_rows: int = RESULT_DIGEST_MIN_ROWS) -> bool:
+    return enabled and result.row_count > max(min_rows, RESULT_DIGEST_SAMPLE_ROWS)
+
+def _kind(values: List[Any]) -> str:
+    if not values:
+        return "empty"
+    if all(isinstance(v, bool) for v in values):
+        return "boolean"
+    if all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in values):
+        return "number"
+    if all(isinstance(v, (datetime.date, datetime.time)) for v in values):
+        return "date"
+    return "text"
+
+def _hashable(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, Decimal, bool, datetime.date, datetime.time)) else dumps(value, sort_keys=True)
+
+def _add(a: Any, b: Any) -> Any:
+    try:
+        return a + b
+    except TypeError: # Decimal + float
+        return float(a) + float(b)
+
+def _column_stats(values: List[Any], top_k: int) -> Dict[str, Any]:
+    present = [v for v in values if v is not None]
+    kind = _kind(present)
+    counts = Counter(_hashable(v) for v in present)
+    stats: Dict[str, Any] = {"type": kind, "nulls": len(values) - len(present), "distinct": len(counts)}
+    if kind == "number":
+        total = 0
+        for v in present:
+            total = _add(total, v)
+        stats.update({"min": min(present), "max": max(present), "sum": total, "mean": round(float(total) / len(present), 4)})
+    elif kind == "date":
+        stats.update({"min": min(present), "max": max(present)})
+    if kind in ("text", "boolean", "date") and len(counts) < len(present):
+        stats["top"] = [[value, count] for value, count in counts.most_common(top_k)]
+    return stats
+
+def _group_totals(columns: List[str], rows: List[tuple], stats: Dict[str, Dict[str, Any]], max_groups: int) -> Dict[str, Any]:
+    """
+    Recuento y suma de cada columna numérica por los valores de las columnas con pocos valores distintos.
+    """
+    measures = [i for i, c in enumerate(columns) if stats[c]["type"] == "number"]
+    keys = [i for i, c in enumerate(columns) if stats[c]["type"] in ("text", "boolean", "date") and 1 < stats[c]["distinct"] <= max_groups]
+    groups: Dict[str, Any] = {}
+    for key in keys[:MAX_GROUP_COLUMNS]:
+        totals: Dict[Any, List[Any]] = {}
+        for row in rows:
+            group = totals.setdefault(_hashable(row[key]), [0] + [0] * len(measures))
+            group[0] += 1
+            for j, m in enumerate(measures, start=1):
+                if row[m] is not None:
+                    group[j] = _add(group[j], row[m])
+        groups[columns[key]] = [
+            {"value": value, "count": values[0], **{f"sum_{columns[m]}": values[j] for j, m in enumerate(measures, start=1)}}
+            for value, values in sorted(totals.items(), key=lambda item: -item[1][0])
+        ]
+    return groups
+
+def _sample(rows: List[tuple], size: int) -> List[tuple]:
+    """
+    Primeras filas (el orden de la query suele importar) y el resto repartido uniformemente por el resultado.
+    """
+    if len(rows) <= size:
+        return list(rows)
+    head = size // 2
+    rest = size - head
+    step = (len(rows) - head) / rest
+    return rows[:head] + [rows[head + int(i * step)] for i in range(rest)]
+
+def summarize(result: QueryResult, sample_rows: int = RESULT_DIGEST_SAMPLE_ROWS, top_k: int = RESULT_DIGEST_TOP_K, max_groups: int = RESULT_DIGEST_MAX_GROUPS) -> Dict[str, Any]:
+    """
+    Resumen calculado sobre todas las filas del resultado: estadísticas por columna, totales por grupo
+    y una muestra acotada de filas.
+    """
+    stats = {column: _column_stats([row[i] for row in result.rows], top_k) for i, column in enumerate(result.columns)}
+    return {
+        "row_count": result.row_count,
+        "truncated": result.truncated_reason if result.truncated else False,
+        "columns": stats,
+        "groups": _group_totals(result.columns, result.rows, stats, max_groups),
+        "sample": _sample(result.rows, sample_rows),
+    }
+
+def digest_prompt(result: QueryResult, **kwargs) -> str:
+    """
+    Texto del resumen para el prompt: estadísticas en JSON compacto y la muestra en el formato del resultado.
+    """
+    digest = summarize(result, **kwargs)
+    sample = QueryResult(columns=result.columns, rows=digest.pop("sample"), format=result.format)
+    stats = dumps(digest)
+    return (
+        f"<digest>\n{stats}\n</digest>\n"
+        f"<sample rows=\"{sample.row_count}\" of=\"{result.row_count}\">\n{serialize_table(sample, result.format)}\n</sample>"
+    )
@@ -0,0 +1,97 @@
+# backend/python/src/utils/result_format.py
+import io
+import os
+import csv
+import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, get_args
+
+from src.models.QueryResult import QueryResult, ResultFormat
+from src.utils.serialization import default, dumps
+
+""" VARIABLES GLOBALES """
+RESULT_FORMATS = get_args(ResultFormat)
+DEFAULT_FORMAT = "tsv"
+# Extensión del fichero cuando los datos no caben en el prompt y se suben al vector store
+FORMAT_EXTENSIONS = {"tsv": ".txt", "csv": ".txt", "markdown": ".md", "columnar": ".json", "records": ".json"}
+SCALAR_TYPES = (Decimal, datetime.date, datetime.time, bytes, bytearray, memoryview)
+JSON_ROW_OVERHEAD = 4 # Comillas, dos puntos y coma de cada clave en la forma lista de dicts
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+def format_value(value: Any) -> Any:
+    """
+    Valor escalar en su forma más corta sin perder información: decimales sin notación científica,
+    fechas en ISO 8601 y bytes en hexadecimal.
+    """
+    return default(value) if isinstance(value, SCALAR_TYPES) else value
+
+def _to_text(value: Any) -> str:
+    value = format_value(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return str(value)
+
+def to_table(data: QueryResult | List[Dict[str, Any]] | Dict[str, Any]) -> Tuple[List[str], List[tuple], Optional[str]]:
+    """
+    Normaliza los datos a (columnas, filas, nota de truncado). Acepta un QueryResult, una lista de dicts
+    (las columnas son la unión de las claves en orden de aparición) o un único dict.
+    """
+    if isinstance(data, QueryResult):
+        note = f"truncated: showing the first {data.row_count} rows ({data.truncated_reason})" if data.truncated else None
+        return list(data.columns), list(data.rows), note
+    records = [data] if isinstance(data, dict) else list(data or [])
+    columns: Dict[str, None] = {}
+    for record in records:
+        columns.update(dict.fromkeys(record))
+    names = list(columns)
+    return names, [tuple(record.get(column) for column in names) for record in records], None
+
+def serialize_table(data: QueryResult | List[Dict[str, Any]] | Dict[str, Any], fmt: str = DEFAULT_FORMAT) -> str:
+    """
+    Serializa datos tabulares para el prompt. Los formatos de texto (tsv, csv, markdown) escriben los nombres
+    de columna una sola vez en la cabecera; "columnar" es JSON con columnas y filas y "records" la lista de dicts.
+    Si el resultado está truncado se indica en la primera línea.
+    """
+    fmt = fmt if fmt in RESULT_FORMATS else DEFAULT_FORMAT
+    columns, rows, note = to_table(data)
+
+    if fmt == "records":
+        body = dumps([dict(zip(columns, row)) for row in rows])
+    elif fmt == "columnar":
+        body = dumps({"columns": columns, "rows": rows})
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows([_to_text(v) for v in row] for row in rows)
+        body = buffer.getvalue().rstrip("\n")
+    elif fmt == "markdown":
+        def cells(values):
+            return "| " + " | ".join(_to_text(v).replace("|", "\\|").replace("\n", " ") for v in values) + " |"
+        body = "\n".join([cells(columns), "|" + "---|" * len(columns)] + [cells(row) for row in rows])
+    else:
+        def cells(values):
+            return "\t".join(_to_text(v).replace("\t", " ").replace("\r", " ").replace("\n", " ") for v in values)
+        body = "\n".join([cells(columns)] + [cells(row) for row in rows])
+
+    return f"# {note}\n{body}" if note else body
+
+def upload_name(name: str, fmt: str) -> str:
+    """
+    Nombre del fichero para una parte del prompt con la extensión que corresponde a su formato.
+    """
+    stem, _ = os.path.splitext(name)
+    return f"{stem}{FORMAT_EXTENSIONS.get(fmt, FORMAT_EXTENSIONS[DEFAULT_FORMAT])}"
+
+def records_size(data: QueryResult | List[Dict[str, Any]] | Dict[str, Any], serialized: str) -> int:
+    """
+    Tamaño aproximado (bytes) que habrían ocupado los mismos datos como lista de dicts, para medir el ahorro.
+    """
+    columns, rows, _ = to_table(data)
+    values_size = data.size_bytes if isinstance(data, QueryResult) and data.size_bytes else len(serialized.encode("utf-8"))
+    return values_size + len(rows) * sum(len(column) + JSON_ROW_OVERHEAD for column in columns)
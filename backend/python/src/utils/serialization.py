@@ -0,0 +1,103 @@
+# backend/python/src/utils/serialization.py
+import json
+import uuid
+import datetime
+from decimal import Decimal
+from typing import Any
+
+try:
+    import orjson
+except ImportError: # Sin orjson se usa el módulo json de la librería estándar (mismo formato de salida)
+    orjson = None
+
+"""
+Serialización JSON única para toda la aplicación: orjson si está instalado y json de la librería estándar si no.
+Ambos caminos producen la misma salida (UTF-8 sin escapar, sin espacios) y tratan igual los tipos que devuelve asyncpg:
+Decimal como texto sin notación científica, fechas en ISO 8601 y el resto de tipos desconocidos con str().
+"""
+
+JSONDecodeError = json.JSONDecodeError # orjson.JSONDecodeError hereda de esta clase
+
+def default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return format(value, "f")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+def dumps_bytes(data: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, default=default, option=option)
+        except TypeError: # Enteros de más de 64 bits o claves no soportadas: se resuelve con la librería estándar
+            pass
+    return _dumps_std(data, sort_keys, indent).encode("utf-8")
+
+def dumps(data: Any, sort_keys: bool = False, indent: bool = False) -> str:
+    if orjson is not None:
+        return dumps_bytes(data, sort_keys=sort_keys, indent=indent).decode("utf-8")
+    return _dumps_std(data, sort_keys, indent)
+
+def _dumps_std(data: Any, sort_keys: bool, indent: bool) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=sort_keys, default=default, indent=2 if indent else None, separators=(",", ": ") if indent else (",", ":"))
+
+def loads(data: str | bytes | bytearray) -> Any:
+    """
+    Los errores de formato son ValueError en ambos caminos (json.JSONDecodeError / orjson.JSONDecodeError).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+"""
+Codificación con tipo para guardar valores de asyncpg en un almacén JSON (Redis) y recuperarlos tal cual:
+Decimal, fechas, horas, intervalos, UUID y bytes viajan como {"__type__": <tipo>, "value": <texto>}.
+"""
+TYPED_ENCODERS = {
+    Decimal: ("decimal", lambda value: format(value, "f")),
+    datetime.datetime: ("datetime", lambda value: value.isoformat()),
+    datetime.date: ("date", lambda value: value.isoformat()),
+    datetime.time: ("time", lambda value: value.isoformat()),
+    datetime.timedelta: ("timedelta", lambda value: value.total_seconds()),
+    uuid.UUID: ("uuid", str),
+    bytes: ("bytes", lambda value: value.hex()),
+}
+TYPED_DECODERS = {
+    "decimal": Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda value: datetime.timedelta(seconds=value),
+    "uuid": uuid.UUID,
+    "bytes": bytes.fromhex,
+}
+
+def encode_typed(value: Any) -> Any:
+    encoder = TYPED_ENCODERS.get(type(value))
+    if encoder is not None:
+        kind, encode = encoder
+        return {"__type__": kind, "value": encode(value)}
+    if isinstance(value, (list, tuple)):
+        return [encode_typed(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_typed(item) for key, item in value.items()}
+    return value
+
+def decode_typed(value: Any) -> Any:
+    if isinstance(value, dict):
+        decode = TYPED_DECODERS.get(value.get("__type__")) if len(value) == 2 and "value" in value else None
+        if decode is not None:
+            return decode(value["value"])
+        return {key: decode_typed(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_typed(item) for item in value]
+    return value
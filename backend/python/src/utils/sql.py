@@ -0,0 +1,91 @@
+# backend/python/src/utils/sql.py
+import re
+from typing import List, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError: # Sin sqlglot se usa la normalización textual
+    sqlglot = None
+
+""" VARIABLES GLOBALES """
+# Literales de texto, identificadores entre comillas, comentarios y espacios
+SQL_TOKEN_RE = re.compile(r"('(?:[^']|'')*')|(\"(?:[^\"]|\"\")*\")|(--[^\n]*)|(/\*.*?\*/)|(\s+)", re.DOTALL)
+TABLE_RE = re.compile(r'\b(?:from|join)\s+(?:(\w+|"[^"]+")\.)?(\w+|"[^"]+")', re.IGNORECASE)
+VOLATILE_RE = re.compile(r"\b(now|current_date|current_time|current_timestamp|localtime|localtimestamp|clock_timestamp|statement_timestamp|timeofday|random|gen_random_uuid)\b", re.IGNORECASE)
+""""""""""""""""""""""""""
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normaliza el texto de una query para usarlo como clave de caché: elimina comentarios,
+    colapsa espacios, pasa a minúsculas todo lo que no son literales ni identificadores entre comillas
+    y quita el ';' final.
+    """
+    sql = sql or ""
+    parts = []
+    pos = 0
+    for match in SQL_TOKEN_RE.finditer(sql):
+        parts.append(sql[pos:match.start()].lower())
+        literal, quoted = match.group(1), match.group(2)
+        parts.append(literal or quoted or " ")
+        pos = match.end()
+    parts.append(sql[pos:].lower())
+
+    normalized = []
+    for part in filter(None, parts):
+        if part == " " and (not normalized or normalized[-1].endswith(" ")):
+            continue
+        normalized.append(part)
+    return "".join(normalized).strip().rstrip(";").strip()
+
+def strip_trailing_semicolon(sql: str) -> str:
+    return (sql or "").strip().rstrip(";").strip()
+
+def inject_limit(sql: str, limit: int) -> str:
+    """
+    Envuelve la query en una subconsulta con LIMIT para acotar las filas que devuelve.
+    """
+    return f"SELECT * FROM (\n{strip_trailing_semicolon(sql)}\n) AS limited_query LIMIT {int(limit)}"
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Forma canónica de la query (espacios, mayúsculas, alias y literales reescritos por el parser) para usarla como clave de caché.
+    Si no se puede parsear se usa normalize_sql.
+    """
+    if sqlglot is not None:
+        try:
+            return sqlglot.parse_one(strip_trailing_semicolon(sql), read="postgres").sql(dialect="postgres", normalize=True)
+        except Exception:
+            pass
+    return normalize_sql(sql)
+
+def _unquote(identifier: str) -> str:
+    return identifier[1:-1] if identifier.startswith('"') else identifier.lower()
+
+def referenced_tables(sql: str) -> Optional[List[Tuple[str, str]]]:
+    """
+    Tablas (esquema, tabla) que lee la query, sin contar los CTE. El esquema vacío significa el de la conexión.
+    Devuelve None si no se puede determinar.
+    """
+    if sqlglot is not None:
+        try:
+            tree = sqlglot.parse_one(strip_trailing_semicolon(sql), read="postgres")
+            ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+            tables = set()
+            for table in tree.find_all(exp.Table):
+                if not table.db and table.name in ctes:
+                    continue
+                db = table.args.get("db")
+                schema = (db.name if db.args.get("quoted") else db.name.lower()) if db else ""
+                tables.add((schema, table.name if table.this.args.get("quoted") else table.name.lower()))
+            return sorted(tables)
+        except Exception:
+            return None
+    tables = {(_unquote(schema) if schema else "", _unquote(table)) for schema, table in TABLE_RE.findall(normalize_sql(sql))}
+    return sorted(tables) if tables else None
+
+def is_volatile(sql: str) -> bool:
+    """
+    La query depende del momento de ejecución (now(), current_date, random()...) y su resultado no se puede reutilizar.
+    """
+    return bool(VOLATILE_RE.search(sql or ""))
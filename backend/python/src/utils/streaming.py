@@ -0,0 +1,104 @@
+# backend/python/src/utils/streaming.py
+import re
+import asyncio
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Optional
+
+from src.utils.serialization import dumps
+
+""" VARIABLES GLOBALES """
+RESPONSE_KEY_RE = re.compile(r'"response"\s*:\s*"')
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+""""""""""""""""""""""""""
+
+"""
+Canal de eventos de una petición en streaming. El pipeline emite eventos de etapa
+(schema_loaded, sql_generated, rows_fetched...) y tokens de la respuesta final; el endpoint los consume.
+"""
+class PipelineStream():
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(self, event: str, data: Any = None):
+        self.queue.put_nowait((event, data))
+
+    async def events(self) -> AsyncIterator[tuple[str, Any]]:
+        while True:
+            event, data = await self.queue.get()
+            yield event, data
+            if event == "done":
+                break
+
+# Stream activo en el contexto de la petición actual (None si la petición no es en streaming)
+current_stream: ContextVar[Optional[PipelineStream]] = ContextVar("current_stream", default=None)
+
+def is_streaming() -> bool:
+    return current_stream.get() is not None
+
+"""
+Emite un evento en el stream de la petición actual. No hace nada si la petición no es en streaming.
+"""
+def emit_event(event: str, **data):
+    stream = current_stream.get()
+    if stream is not None:
+        stream.emit(event, data)
+
+"""
+Formatea un evento como Server-Sent Event.
+"""
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+"""
+Extrae incrementalmente el valor del campo "response" de un JSON que llega por trozos,
+de modo que se puedan reenviar al usuario los tokens de la respuesta según se generan.
+"""
+class ResponseFieldExtractor():
+    def __init__(self):
+        self.buffer: str = ""
+        self.start: int = -1 # Posición del primer carácter del valor
+        self.pos: int = 0 # Posición hasta la que se ha decodificado
+        self.done: bool = False
+
+    """
+    Añade un trozo de texto y devuelve el texto nuevo decodificado del campo "response".
+    """
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.start < 0:
+            match = RESPONSE_KEY_RE.search(self.buffer)
+            if not match:
+                return ""
+            self.start = self.pos = match.end()
+
+        out = []
+        buf = self.buffer
+        i = self.pos
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c == "\\":
+                if i + 1 >= len(buf):
+                    break # Escape incompleto: esperamos al siguiente trozo
+                esc = buf[i + 1]
+                if esc == "u":
+                    if i + 6 > len(buf):
+                        break
+                    try:
+                        out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            out.append(c)
+            i += 1
+        self.pos = i
+        return "".join(out)
@@ -0,0 +1,98 @@
+# backend/python/src/utils/tokens.py
+import os
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+except ImportError: # Sin tiktoken se estima a partir del nº de caracteres
+    tiktoken = None
+
+from src.logging.logger import base_logger
+from src.config.config import MODEL, PROMPT_DATA_TOKENS, PROMPT_RESERVED_TOKENS
+from src.utils.cache import TTLCache
+from src.utils.format import hash_text
+
+""" VARIABLES GLOBALES """
+CHARS_PER_TOKEN = 4 # Estimación cuando no hay tokenizador disponible
+DEFAULT_ENCODING = "o200k_base"
+DEFAULT_CONTEXT_WINDOW = 128000
+# Ventana de contexto por familia de modelo (se usa el prefijo más largo que coincida)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "gpt-5": 400000,
+}
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+_encodings: Dict[str, object] = {}
+_token_counts = TTLCache(maxsize=4096)
+
+def context_window(model: str = MODEL) -> int:
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+def data_token_budget(model: str = MODEL, budget: int = PROMPT_DATA_TOKENS, reserved: int = PROMPT_RESERVED_TOKENS) -> int:
+    """
+    Tokens disponibles para los datos del prompt: el presupuesto configurado, sin superar la ventana del modelo.
+    """
+    return max(0, min(budget, context_window(model) - reserved))
+
+def get_encoding(model: str = MODEL, logger=base_logger):
+    """
+    Codificación de tiktoken para el modelo, o None si no está disponible (sin tiktoken o sin los ficheros de la codificación).
+    Se resuelve una sola vez por modelo.
+    """
+    if model in _encodings:
+        return _encodings[model]
+    encoding = None
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = _load_encoding(DEFAULT_ENCODING, logger)
+        except Exception as e:
+            logger.warning(f"{file_name} => No se pudo cargar el tokenizador de {model}, se estimarán los tokens: {e}")
+    _encodings[model] = encoding
+    return encoding
+
+def _load_encoding(name: str, logger=base_logger):
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"{file_name} => No se pudo cargar la codificación {name}, se estimarán los tokens: {e}")
+        return None
+
+def count_tokens(text: str, model: str = MODEL) -> int:
+    """
+    Nº de tokens del texto para el modelo. El resultado se memoriza por hash del contenido.
+    """
+    key = (model, len(text), hash_text(text))
+    count = _token_counts.get(key)
+    if count is None:
+        encoding = get_encoding(model)
+        count = len(encoding.encode(text, disallowed_special=())) if encoding is not None else -(-len(text) // CHARS_PER_TOKEN)
+        _token_counts.set(key, count)
+    return count
+
+def pack_parts(parts: List[Tuple[str, int, int]], budget: int) -> Tuple[List[str], List[str]]:
+    """
+    Reparte las partes (nombre, prioridad, tokens) entre el prompt y ficheros: se incluyen en línea por orden de
+    prioridad (menor primero) mientras quepan en el presupuesto; las que no caben van a fichero.
+    Devuelve (en línea, a fichero).
+    """
+    inline: List[str] = []
+    overflow: List[str] = []
+    used = 0
+    for name, _, tokens in sorted(parts, key=lambda part: (part[1], part[2])):
+        if used + tokens <= budget:
+            inline.append(name)
+            used += tokens
+        else:
+            overflow.append(name)
+    return inline, overflow
@@ -0,0 +1,209 @@
+# backend/python/src/utils/tracing.py
+import os
+import time
+import uuid
+import asyncio
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+except ImportError: # Sin opentelemetry las trazas solo se guardan en proceso
+    otel_trace = None
+
+from src.logging.logger import base_logger
+from src.config.config import TRACE_EXPORTER, TRACE_OTLP_ENDPOINT, TRACE_SERVICE_NAME
+from src.utils.metrics import metrics
+
+""" VARIABLES GLOBALES """
+MAX_SPANS_PER_TRACE = 500 # Los spans que superen el límite se cuentan pero no se guardan
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+file_name = os.path.basename(__file__)
+""""""""""""""""""""""""""
+
+metrics.describe("request_duration_seconds", "histogram", "Duración total de las peticiones al agente por endpoint")
+metrics.describe("pipeline_stage_seconds", "histogram", "Duración de cada etapa del pipeline (spans: etapas, queries, llamadas a OpenAI, ficheros)")
+
+"""
+Tramo de tiempo de una etapa (etapa del pipeline, query, llamada a OpenAI, subida de fichero...) con sus atributos.
+"""
+class Span():
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.status = "ok"
+        self.otel = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id, "duration_ms": round(self.duration_ms, 2), "status": self.status, "attributes": self.attributes}
+
+"""
+Span que no registra nada (sin traza activa o con TRACE_EXPORTER=none).
+"""
+class NoopSpan():
+    name = ""
+    attributes: Dict[str, Any] = {}
+
+    def set_attributes(self, **attributes):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+"""
+Traza de una petición: todos sus spans, para exportarlos y para el desglose de tiempos de la respuesta.
+"""
+class Trace():
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, attributes=attributes)
+        self.spans: List[Span] = [self.root]
+        self.dropped = 0
+
+    def add(self, span: Span):
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    """
+    Tiempo total y nº de spans por nombre, en orden de aparición.
+    """
+    def breakdown(self) -> List[Dict[str, Any]]:
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans:
+            total = totals.setdefault(span.name, [0.0, 0])
+            total[0] += span.duration_ms
+            total[1] += 1
+        return [{"name": name, "duration_ms": round(duration, 2), "count": count} for name, (duration, count) in totals.items()]
+
+    """
+    Cabecera Server-Timing (https://www.w3.org/TR/server-timing/) con el desglose de tiempos.
+    """
+    def server_timing(self) -> str:
+        return ", ".join(
+            f'{entry["name"]};dur={entry["duration_ms"]}' + (f';desc="x{entry["count"]}"' if entry["count"] > 1 else "")
+            for entry in self.breakdown()
+        )
+
+def _setup_otlp(logger=base_logger):
+    if TRACE_EXPORTER != "otlp":
+        return None
+    if otel_trace is None:
+        logger.warning(f"{file_name} => TRACE_EXPORTER=otlp pero opentelemetry no está instalado; las trazas solo se guardan en proceso.")
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACE_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)))
+    otel_trace.set_tracer_provider(provider)
+    return otel_trace.get_tracer(TRACE_SERVICE_NAME)
+
+_tracer = _setup_otlp()
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in attributes.items() if v is not None}
+
+def _start(span: Span, parent: Optional[Span]):
+    if _tracer is not None:
+        context = otel_trace.set_span_in_context(parent.otel) if parent is not None and parent.otel is not None else None
+        span.otel = _tracer.start_span(span.name, context=context, attributes=_otel_attributes(span.attributes))
+
+def _finish(span: Span, error: Optional[BaseException] = None):
+    span.end = time.perf_counter()
+    if error is not None:
+        span.status = "cancelled" if isinstance(error, (asyncio.CancelledError, GeneratorExit)) else "error"
+        span.attributes["error"] = type(error).__name__
+    if span.otel is not None:
+        span.otel.set_attributes(_otel_attributes(span.attributes))
+        if error is not None:
+            span.otel.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(error)))
+        span.otel.end()
+
+@contextmanager
+def start_trace(name: str, logger=base_logger, **attributes) -> Iterator[Optional[Trace]]:
+    """
+    Abre la traza de una petición con su span raíz. Las tareas creadas dentro heredan el contexto, así que
+    sus spans cuelgan de esta traza. Al cerrarse, con TRACE_EXPORTER=log se escribe el desglose de tiempos.
+    """
+    if TRACE_EXPORTER == "none":
+        yield None
+        return
+    trace = Trace(name, attributes)
+    _start(trace.root, None)
+    trace_token = current_trace.set(trace)
+    span_token = current_span.set(trace.root)
+    error: Optional[BaseException] = None
+    try:
+        yield trace
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(span_token)
+        current_trace.reset(trace_token)
+        _finish(trace.root, error)
+        metrics.observe("request_duration_seconds", trace.root.duration_ms / 1000, endpoint=attributes.get("endpoint", name), status=trace.root.status)
+        if TRACE_EXPORTER == "log":
+            logger.info(f"{file_name} => Traza {trace.trace_id} ({trace.root.duration_ms:.1f} ms): {trace.server_timing()}")
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | NoopSpan]:
+    """
+    Mide un tramo dentro de la traza activa. Sin traza activa no hace nada.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+    parent = current_span.get()
+    s = Span(name, parent=parent, attributes=attributes)
+    trace.add(s)
+    _start(s, parent)
+    token = current_span.set(s)
+    error: Optional[BaseException] = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(token)
+        _finish(s, error)
+        metrics.observe("pipeline_stage_seconds", s.duration_ms / 1000, stage=name)
+
+def traced(name: str):
+    """
+    Decorador para funciones asíncronas: cada llamada es un span con ese nombre.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def set_attributes(**attributes):
+    """
+    Añade atributos al span actual (nº de filas, tokens, ruta seguida...). Sin traza activa no hace nada.
+    """
+    if current_trace.get() is not None:
+        s = current_span.get()
+        if s is not None:
+            s.set_attributes(**attributes)
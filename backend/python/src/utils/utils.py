@@ -1,5 +1,5 @@
 # backend/python/src/utils/utils.py
-import json
+from src.utils.serialization import dumps
 
 def serialize_result(data):
-    return json.dumps(data, indent=2, ensure_ascii=False)
\ No newline at end of file
+    return dumps(data, indent=True)
\ No newline at end of file